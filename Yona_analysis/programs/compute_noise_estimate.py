@@ -11,8 +11,9 @@ and save in output file
 import numpy as np
 from netCDF4 import Dataset as open_ncfile
 from modelsDef import defModels, defModelsCO2piC
-from maps_matplot_lib import defVarmme, averageDom
-from libToE import ToEdomainhistvshistNat, ToEdomain1pctCO2vsPiC
+from maps_matplot_lib import defVarmme, domainTables, averageDomains
+from libToE import ToEdomainhistvshistNat, ToEdomain1pctCO2vsPiC, noiseTable, noiseWindow, noiseBootstrap
+from libMembers import readMember, cachedCompute
 import glob
 
 
@@ -34,6 +35,12 @@ else:
     noise_description = 'The variables are averaged in the domains, then the standard deviation is computed ' \
                         'over those domains.'
 
+# PiControl noise: std over the last piC_window years, also given for all windows of piC_window years of the run
+# and as a block-bootstrap distribution (nboot series of blocks of piC_block years)
+piC_window = 95
+piC_nboot = 1000
+piC_block = 10
+
 
 # ----- Work ------
 
@@ -68,9 +75,45 @@ unit = varname['unit']
 nMembers_h = np.ma.empty(len(models)) # Initialize array for keeping nb of members per model
 nMembers_hn = np.ma.empty(len(models))
 
+# Domain index tables of all models, computed once
+tables = domainTables(models, domains, ToEdomainhistvshistNat, lat, density)
+
+def noiseDomains(field, table):
+    # Noise [basin,domain] of a [time,basin,rho,lat] field in all domains
+    if method_noise == 'average_std':
+        return averageDomains(np.ma.std(field, axis=0), table)
+    else:
+        return np.ma.std(averageDomains(field, table), axis=0)
+
+def noiseMember(fileName, tslice, table):
+    # Noise [basin,domain] of a member over tslice, memoised across scripts
+    return cachedCompute([fileName], ['noiseDomains', var, tslice, method_noise, table['index'], table['valid']],
+                         lambda: noiseDomains(readMember(fileName, var, [tslice])[0], table))
+
+def noisePiC(fileName, table):
+    # Noise [basin,domain] of PiControl over its last piC_window years, noise of all windows of piC_window years
+    # [start,basin,domain] and its block-bootstrap distribution [boot,basin,domain], from one noiseTable of the run
+    varpiC, = readMember(fileName, var)
+    if method_noise == 'average_std':
+        average = lambda std: averageDomains(std, table)
+    else:
+        varpiC = averageDomains(varpiC, table)
+        average = lambda std: std
+    noiseTab = noiseTable(varpiC)
+    timN_piC = varpiC.shape[0]
+    noise = average(noiseWindow(noiseTab, timN_piC-piC_window, timN_piC)[1])
+    # (by chunks of 100 windows/series, to limit memory in the average_std case)
+    starts = np.arange(timN_piC-piC_window+1)
+    rolling = np.ma.concatenate([average(noiseWindow(noiseTab, starts[c:c+100], starts[c:c+100]+piC_window)[1])
+                                 for c in range(0, starts.size, 100)])
+    boot = np.ma.concatenate([average(noiseBootstrap(noiseTab, piC_window, min(100, piC_nboot-c), piC_block, seed=c))
+                              for c in range(0, piC_nboot, 100)])
+    return noise, rolling, boot
+
 for i, model in enumerate(models):
 
     print('Working on', model['name'])
+    table = tables[model['name']]
 
     # Index of common time interval
     tstart = model['props'][2]
@@ -86,123 +129,32 @@ for i, model in enumerate(models):
     nruns_h = len(listruns_h)
     nMembers_h[i] = nruns_h
 
-    # Initialize varnoise for each basin, containing averaged noise for each domain and each run of the model
-    varnoise_hna = np.ma.masked_all((nruns_hn,len(domains)))
-    varnoise_hnp = np.ma.masked_all((nruns_hn,len(domains)))
-    varnoise_hni = np.ma.masked_all((nruns_hn,len(domains)))
-    varnoise_ha = np.ma.masked_all((nruns_h,len(domains)))
-    varnoise_hp = np.ma.masked_all((nruns_h,len(domains)))
-    varnoise_hi = np.ma.masked_all((nruns_h,len(domains)))
-    # Initialize output variables
+    # Initialize output variables, containing averaged noise for each basin, domain and run of the model
     varnoise_hn = np.ma.masked_all((nruns_hn,basinN,len(domains)))
     varnoise_h = np.ma.masked_all((nruns_h,basinN,len(domains)))
-
-    # Initialize varnoise PiControl for each basin, containing averaged noise for each domain
-    varnoise_piCa = np.ma.masked_all(len(domains))
-    varnoise_piCp = np.ma.masked_all(len(domains))
-    varnoise_piCi = np.ma.masked_all(len(domains))
-    # Initialize output variable
     varnoise_piC = np.ma.masked_all((basinN,len(domains)))
+    varnoise_piCRolling = np.ma.masked_all((1,basinN,len(domains)))
+    varnoise_piCBoot = np.ma.masked_all((piC_nboot,basinN,len(domains)))
 
-    # Read PiC file
+    # Loop over number of histNat runs
+    for khn in range(nruns_hn):
+        print('      . histNat run number', khn)
+        varnoise_hn[khn] = noiseMember(listruns_hn[khn], slice(tstart,tend), table)
+
+    # Loop over number of hist runs
+    for kh in range(nruns_h):
+        print('      . hist run number', kh)
+        varnoise_h[kh] = noiseMember(listruns_h[kh], slice(tstart,tend), table)
+
+    # PiControl
     filepiC = glob.glob(indir_piC + 'cmip5.' + model['name'] + '.' + '*zon2D.nc')
     if len(filepiC) !=0 :
-        fpiC = open_ncfile(filepiC[0],'r')
-        # Read var PiC
-        varpiC = fpiC.variables[var][-95:,:,:,:]
-        # Compute std of PiC
-        varstdpiC = np.ma.std(varpiC, axis=0)
-
-    for j, domain_name in enumerate(domains):
-
-        print('- ', domain_name)
-
-        # Select domain to average
-        domain = ToEdomainhistvshistNat(model['name'], domain_name)[0]
-        domain_char = ToEdomainhistvshistNat(model['name'], domain_name)[1]
-
-        # Loop over number of histNat runs
-        for khn in range(nruns_hn):
-            print('      . histNat run number', khn)
-
-            # Read file
-            fhn = open_ncfile(listruns_hn[khn],'r')
-            # Read var histNat
-            varhn = fhn.variables[var][tstart:tend,:,:,:]
-            # Compute std of histNat
-            varstdhn = np.ma.std(varhn, axis=0)
-            # Average std
-            if domain['Atlantic'] != None:
-                if method_noise == 'average_std':
-                    varnoise_hna[khn,j] = averageDom(varstdhn[1,:,:], 2, domain['Atlantic'], lat, density)
-                else:
-                    varnoise_hna[khn,j] = np.ma.std(averageDom(varhn[:,1,:,:], 3, domain['Atlantic'], lat, density), axis=0)
-            if domain['Pacific'] != None:
-                if method_noise == 'average_std':
-                    varnoise_hnp[khn,j] = averageDom(varstdhn[2,:,:], 2, domain['Pacific'], lat, density)
-                else:
-                    varnoise_hnp[khn,j] = np.ma.std(averageDom(varhn[:,2,:,:], 3, domain['Pacific'], lat, density), axis=0)
-            if domain['Indian'] != None:
-                if method_noise == 'average_std':
-                    varnoise_hni[khn,j] = averageDom(varstdhn[3,:,:], 2, domain['Indian'], lat, density)
-                else:
-                    varnoise_hni[khn,j] = np.ma.std(averageDom(varhn[:,3,:,:], 3, domain['Indian'], lat, density), axis=0)
-
-        # Loop over number of hist runs
-        for kh in range(nruns_h):
-            print('      . hist run number', kh)
-
-            # Read file
-            fh = open_ncfile(listruns_h[kh],'r')
-            # Read var hist
-            varh = fh.variables[var][tstart:tend,:,:,:]
-            # Compute std of hist
-            varstdh = np.ma.std(varh, axis=0)
-            # Average
-            if domain['Atlantic'] != None:
-                if method_noise == 'average_std':
-                    varnoise_ha[kh,j] = averageDom(varstdh[1,:,:], 2, domain['Atlantic'], lat, density)
-                else:
-                    varnoise_ha[kh,j] = np.ma.std(averageDom(varh[:,1,:,:], 3, domain['Atlantic'], lat, density), axis=0)
-            if domain['Pacific'] != None:
-                if method_noise == 'average_std':
-                    varnoise_hp[kh,j] = averageDom(varstdh[2,:,:], 2, domain['Pacific'], lat, density)
-                else:
-                    varnoise_hp[kh,j] = np.ma.std(averageDom(varh[:,2,:,:], 2, domain['Pacific'], lat, density), axis=0)
-            if domain['Indian'] != None:
-                if method_noise == 'average_std':
-                    varnoise_hi[kh,j] = averageDom(varstdh[3,:,:], 2, domain['Indian'], lat, density)
-                else:
-                    varnoise_hi[kh,j] = np.ma.std(averageDom(varh[:,3,:,:], 3, domain['Indian'], lat, density), axis=0)
-
-        # Average PiControl
-        if len(filepiC)!=0:
-            print('      . PiControl')
-            if domain['Atlantic'] != None:
-                if method_noise == 'average_std':
-                    varnoise_piCa[j] = averageDom(varstdpiC[1,:,:], 2, domain['Atlantic'], lat, density)
-                else :
-                    varnoise_piCa[j] = np.ma.std(averageDom(varpiC[:,1,:,:], 3, domain['Atlantic'], lat, density), axis=0)
-            if domain['Pacific'] != None:
-                if method_noise == 'average_std':
-                    varnoise_piCp[j] = averageDom(varstdpiC[2,:,:], 2, domain['Pacific'], lat, density)
-                else:
-                    varnoise_piCp[j] = np.ma.std(averageDom(varpiC[:,2,:,:], 3, domain['Pacific'], lat, density), axis=0)
-            if domain['Indian'] != None:
-                if method_noise == 'average_std':
-                    varnoise_piCi[j] = averageDom(varstdpiC[3,:,:], 2, domain['Indian'], lat, density)
-                else:
-                    varnoise_piCi[j] = np.ma.std(averageDom(varpiC[:,3,:,:], 3, domain['Indian'], lat, density), axis=0)
-
-    varnoise_hn[:,1,:] = varnoise_hna
-    varnoise_hn[:,2,:] = varnoise_hnp
-    varnoise_hn[:,3,:] = varnoise_hni
-    varnoise_h[:,1,:] = varnoise_ha
-    varnoise_h[:,2,:] = varnoise_hp
-    varnoise_h[:,3,:] = varnoise_hi
-    varnoise_piC[1,:] = varnoise_piCa
-    varnoise_piC[2,:] = varnoise_piCp
-    varnoise_piC[3,:] = varnoise_piCi
+        print('      . PiControl')
+        # ('noisePiC.2': bootstrap series truncated to piC_window years, older cached results are not reused)
+        varnoise_piC[:,:], varnoise_piCRolling, varnoise_piCBoot[:] = \
+            cachedCompute([filepiC[0]], ['noisePiC.2', var, piC_window, piC_nboot, piC_block, method_noise,
+                                         table['index'], table['valid']], lambda: noisePiC(filepiC[0], table))
+
     print('  varnoise_hn shape:', varnoise_hn.shape)
     print('  varnoise_h shape:', varnoise_h.shape)
     print('  varnoise_piC shape:', varnoise_piC.shape)
@@ -221,6 +173,8 @@ for i, model in enumerate(models):
     fout.createDimension('members_histNat', nruns_hn)
     fout.createDimension('basin', 4)
     fout.createDimension('domain', 5)
+    fout.createDimension('piC_start', varnoise_piCRolling.shape[0])
+    fout.createDimension('piC_boot', piC_nboot)
 
     # variables
     members_hist = fout.createVariable('members_hist', 'f4', ('members_hist',))
@@ -230,6 +184,8 @@ for i, model in enumerate(models):
     varstdh = fout.createVariable(varname['var_zonal_w/bowl']+'stdh', 'f4', ('members_hist','basin','domain',))
     varstdhn = fout.createVariable(varname['var_zonal_w/bowl']+'stdhn', 'f4', ('members_histNat','basin','domain',))
     varstdpiC = fout.createVariable(varname['var_zonal_w/bowl']+'stdpiC', 'f4', ('basin','domain',))
+    varstdpiCRolling = fout.createVariable(varname['var_zonal_w/bowl']+'stdpiCRolling', 'f4', ('piC_start','basin','domain',))
+    varstdpiCBoot = fout.createVariable(varname['var_zonal_w/bowl']+'stdpiCBoot', 'f4', ('piC_boot','basin','domain',))
 
     # data
     members_hist[:] =  np.arange(0,nruns_h)
@@ -239,6 +195,8 @@ for i, model in enumerate(models):
     varstdh[:,:,:] = varnoise_h
     varstdhn[:,:,:] = varnoise_hn
     varstdpiC[:,:] = varnoise_piC
+    varstdpiCRolling[:,:,:] = varnoise_piCRolling
+    varstdpiCBoot[:,:,:] = varnoise_piCBoot
 
     # units
     basin.units = 'basin index'
@@ -246,9 +204,15 @@ for i, model in enumerate(models):
     varstdh.units = unit
     varstdhn.units = unit
     varstdpiC.units = unit
+    varstdpiCRolling.units = unit
+    varstdpiCBoot.units = unit
     varstdh.long_name = 'Std for ' + legVar + ' of historical runs'
     varstdhn.long_name = 'Std for ' + legVar + ' of historicalNat runs'
     varstdpiC.long_name = 'Std for ' + legVar + ' of pre-industrial control run'
+    varstdpiCRolling.long_name = 'Std for ' + legVar + ' of pre-industrial control run over all windows of ' \
+                                 + str(piC_window) + ' years'
+    varstdpiCBoot.long_name = 'Block-bootstrap std for ' + legVar + ' of pre-industrial control run over ' \
+                              + str(piC_window) + ' years (blocks of ' + str(piC_block) + ' years)'
 
     fout.close()
 
@@ -275,6 +239,8 @@ for i, model in enumerate(models):
 #     varnoise_piCi = np.ma.masked_all(len(domains))
 #     # Initialize output variable
 #     varnoise_piC = np.ma.masked_all((basinN,len(domains)))
+#     varnoise_piCRolling = np.ma.masked_all((1,basinN,len(domains)))
+#     varnoise_piCBoot = np.ma.masked_all((piC_nboot,basinN,len(domains)))
 #
 #     for j, domain_name in enumerate(domains):
 #
@@ -328,6 +294,8 @@ for i, model in enumerate(models):
 #     basin[:] =  np.arange(0,basinN)
 #     domain[:] = np.arange(0,len(domains))
 #     varstdpiC[:,:] = varnoise_piC
+#     varstdpiCRolling[:,:,:] = varnoise_piCRolling
+#     varstdpiCBoot[:,:,:] = varnoise_piCBoot
 #
 #     # units
 #     basin.units = 'basin index'
@@ -11,9 +11,10 @@ then averaged it in the specified domains, making the calculations much longer)
 
 import numpy as np
 from netCDF4 import Dataset as open_ncfile
-from maps_matplot_lib import defVarmme, averageDom
+from maps_matplot_lib import defVarmme, domainTables, averageDomains
 from modelsDef import defModelsCO2piC
-from libToE import findToE, ToEdomain1pctCO2vsPiC
+from libToE import findToEMulti, ToEdomain1pctCO2vsPiC
+from libMembers import readMember
 
 # ----- Workspace ------
 
@@ -60,76 +61,32 @@ unit = varname['unit']
 
 # ----- Average signal and noise and compute ToE for each model ------
 
+# -- Domain index tables of all models, computed once
+tables = domainTables(models, domains, ToEdomain1pctCO2vsPiC, lat, density)
+
 for i, model in enumerate(models):
 
     print('Working on', model['name'])
+    table = tables[model['name']]
 
     # -- Read 1pctCO2 file and piControl file
     file_1pctCO2 = 'cmip5.' + model['name'] + '.1pctCO2.ensm.an.ocn.Omon.density.ver-' + model['file_end_CO2'] + '_zon2D.nc'
     file_piC = 'cmip5.' + model['name'] + '.piControl.ensm.an.ocn.Omon.density.ver-' + model['file_end_piC'] + '_zon2D.nc'
-    fCO2 = open_ncfile(indir_1pctCO2 + file_1pctCO2,'r')
-    fpiC = open_ncfile(indir_piC + file_piC,'r')
-
-    # -- Read var 1pctCO2
-    varCO2 = fCO2.variables[var][:]
-    # -- Read var PiControl
-    varpiC = fpiC.variables[var][-140:,:,:,:]
-
-    # -- Compute std of PiControl
-    varstd = np.ma.std(varpiC, axis=0)
-
-    # -- Initalize varnoise for each basin, containing averaged noise for each domain
-    varnoise_a = np.ma.masked_all(len(domains))
-    varnoise_p = np.ma.masked_all(len(domains))
-    varnoise_i = np.ma.masked_all(len(domains))
-    # -- Initialize varsignal for each basin, containing averaged signal for each domain
-    varsignal_a = np.ma.masked_all((timN,len(domains)))
-    varsignal_p = np.ma.masked_all((timN,len(domains)))
-    varsignal_i = np.ma.masked_all((timN,len(domains)))
-    # -- Initialize toe for each basin
-    toe_a = np.ma.masked_all(len(domains))
-    toe_p = np.ma.masked_all(len(domains))
-    toe_i = np.ma.masked_all(len(domains))
-    # -- Initialize ouput variable
-    varToE = np.ma.masked_all((basinN, len(domains)))
-
-    # -- Loop over domains
-    for j, domain_name in enumerate(domains):
-        print('- ' + domain_name)
-
-        # Select domain to average
-        domain = ToEdomain1pctCO2vsPiC(model['name'], domain_name)[0]
-
-        # Average signal and noise
-        if domain['Atlantic'] != None:
-            varsignal_a[:,j] = averageDom(varCO2[:,1,:,:]-varpiC[:,1,:,:], 3, domain['Atlantic'], lat, density)
-            if method_noise == 'average_std':
-                varnoise_a[j] = averageDom(varstd[1,:,:], 2, domain['Atlantic'], lat, density)
-            else:
-                varnoise_a[j] = np.ma.std(averageDom(varpiC[:,1,:,:], 3, domain['Atlantic'], lat, density), axis=0)
-        if domain['Pacific'] != None:
-            varsignal_p[:,j] = averageDom(varCO2[:,2,:,:]-varpiC[:,2,:,:], 3, domain['Pacific'], lat, density)
-            if method_noise == 'average_std':
-                varnoise_p[j] = averageDom(varstd[2,:,:], 2, domain['Pacific'], lat, density)
-            else:
-                varnoise_p[j] = np.ma.std(averageDom(varpiC[:,2,:,:], 3, domain['Pacific'], lat, density), axis=0)
-        if domain['Indian'] != None:
-            varsignal_i[:,j] = averageDom(varCO2[:,3,:,:]-varpiC[:,3,:,:], 3, domain['Indian'], lat, density)
-            if method_noise == 'average_std':
-                varnoise_i[j] = averageDom(varstd[3,:,:], 2, domain['Indian'], lat, density)
-            else:
-                varnoise_i[j] = np.ma.std(averageDom(varpiC[:,3,:,:], 3, domain['Indian'], lat, density), axis=0)
-        # Compute ToE of averaged domain
-        if domain['Atlantic'] != None and np.ma.is_masked(varnoise_a[j]) == False:
-            toe_a[j] = findToE(varsignal_a[:,j], varnoise_a[j], multStd)
-        if domain['Pacific'] != None and np.ma.is_masked(varnoise_p[j]) == False:
-            toe_p[j] = findToE(varsignal_p[:,j], varnoise_p[j], multStd)
-        if domain['Indian'] != None and np.ma.is_masked(varnoise_i[j]) == False:
-            toe_i[j] = findToE(varsignal_i[:,j], varnoise_i[j], multStd)
-
-    varToE[1,:] = toe_a
-    varToE[2,:] = toe_p
-    varToE[3,:] = toe_i
+
+    # -- Read var 1pctCO2 and var PiControl
+    varCO2, = readMember(indir_1pctCO2 + file_1pctCO2, var)
+    varpiC, = readMember(indir_piC + file_piC, var, [slice(-140,None)])
+
+    # -- Average signal and noise [basin,domain] in all domains
+    varsignal = averageDomains(varCO2-varpiC, table)
+    if method_noise == 'average_std':
+        varnoise = averageDomains(np.ma.std(varpiC, axis=0), table)
+    else:
+        varnoise = np.ma.std(averageDomains(varpiC, table), axis=0)
+
+    # -- Compute ToE of averaged domains
+    toe = findToEMulti(varsignal.reshape(timN,-1), varnoise.ravel(), [multStd])[0].reshape(basinN,len(domains))
+    varToE = np.ma.array(toe, mask=np.ma.getmaskarray(varsignal).all(axis=0) | np.ma.getmaskarray(varnoise))
 
     print('')
 
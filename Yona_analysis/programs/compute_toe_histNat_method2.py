@@ -8,9 +8,10 @@ Save ToE in output files
 
 import numpy as np
 from netCDF4 import Dataset as open_ncfile
-from maps_matplot_lib import defVarmme, averageDom
+from maps_matplot_lib import defVarmme, domainTables, averageDomains
 from modelsDef import defModels
-from libToE import findToE, ToEdomainhistvshistNat
+from libToE import findToEMulti, ToEdomainhistvshistNat
+from libMembers import readMember, cachedCompute
 import glob
 import os
 
@@ -64,22 +65,17 @@ legVar = varname['legVar']
 
 nMembers = np.ma.empty(len(models)) # Initialize array for keeping nb of members per model
 
+# Domain index tables of all models, computed once
+tables = domainTables(models, domains, ToEdomainhistvshistNat, lat, density)
+
 for i, model in enumerate(models):
 
     print('Working on', model['name'])
+    table = tables[model['name']]
 
-    # Read histNat ensemble mean
+    # Read histNat ensemble mean [time,basin,rho,lat]
     filehn = 'cmip5.' + model['name'] + '.historicalNat.ensm.an.ocn.Omon.density.ver-' + model['file_end_histNat'] + '_zon2D.nc'
-    fhn = open_ncfile(indir_histNat + filehn,'r')
-    # Read var histNat
-    varhn_a = fhn.variables[var][0:145,1,:,:].squeeze()
-    varhn_p = fhn.variables[var][0:145,2,:,:].squeeze()
-    varhn_i = fhn.variables[var][0:145,3,:,:].squeeze()
-    # Read std of histNat (max std of all runs for each model)
-    if method_noise == 'average_std':
-        varstd_a = fhn.variables[var+'Std'][1,:,:].squeeze()
-        varstd_p = fhn.variables[var+'Std'][2,:,:].squeeze()
-        varstd_i = fhn.variables[var+'Std'][3,:,:].squeeze()
+    varhn, = readMember(indir_histNat + filehn, var, [slice(0,145)])
 
     # Read hist files
     listruns = glob.glob(indir_hist + 'cmip5.' + model['name'] + '.' + '*zon2D.nc')
@@ -89,83 +85,36 @@ for i, model in enumerate(models):
     tstart = model['props'][2]
     tend = model['props'][3]
 
-    # Initialize varnoise for each basin, containing averaged noise for each domain
-    varnoise_a = np.ma.masked_all(len(domains))
-    varnoise_p = np.ma.masked_all(len(domains))
-    varnoise_i = np.ma.masked_all(len(domains))
-    # Initialize varsignal for each basin, containing averaged signal for each domain and each run
-    varsignal_a = np.ma.masked_all((timN,nruns,len(domains)))
-    varsignal_p = np.ma.masked_all((timN,nruns,len(domains)))
-    varsignal_i = np.ma.masked_all((timN,nruns,len(domains)))
-    # Initialize toe for each basin (run, domain)
-    toe_a = np.ma.masked_all((nruns,len(domains)))
-    toe_p = np.ma.masked_all((nruns,len(domains)))
-    toe_i = np.ma.masked_all((nruns,len(domains)))
-    # Initialize output variable
-    varToE = np.ma.masked_all((nruns,basinN,len(domains))) # (members,basin,domain)
     # Initialize array to store run names
     run_names = np.empty(nruns).astype('S6')
 
-    if method_noise == 'average_histNat':
+    # Noise [basin,domain]
+    if method_noise == 'average_std':
+        # Average std of histNat (max std of all runs for each model)
+        varnoise = averageDomains(readMember(indir_histNat + filehn, var+'Std', None), table)
+    else:
         # Here we read the std of the averaged histNat in the 5 domains for all runs, then take the max as our noise
         filenoise = 'cmip5.' + model['name'] + '.noise_domains_hist_histNat.std_of_average.nc'
         fnoise = open_ncfile(indir_noise + filenoise,'r')
-        varstd = fnoise.variables[var+'stdhn'][:]
-        varnoise_a = np.ma.max(varstd[:,1,:], axis=0)
-        varnoise_p = np.ma.max(varstd[:,2,:], axis=0)
-        varnoise_i = np.ma.max(varstd[:,3,:], axis=0)
-
-    # Loop over 5 domains
-    for j, domain_name in enumerate(domains):
-        print('- ', j, domains[j])
-
-        # Select domain to average
-        domain = ToEdomainhistvshistNat(model['name'], domain_name)[0]
-        domain_char = ToEdomainhistvshistNat(model['name'], domain_name)[1]
-
-        if method_noise == 'average_std':
-            # Average noise
-            if domain['Atlantic'] != None:
-                varnoise_a[j] = averageDom(varstd_a, 2, domain['Atlantic'], lat, density)
-            if domain['Pacific'] != None:
-                varnoise_p[j] = averageDom(varstd_p, 2, domain['Pacific'], lat, density)
-            if domain['Indian'] != None:
-                varnoise_i[j] = averageDom(varstd_i, 2, domain['Indian'], lat, density)
-
-        # Loop over number of runs
-        for k in range(nruns):
-            run_number = os.path.basename(listruns[k]).split('.')[3]
-            run_names[k] = run_number
-            print('    . run number', k, run_number)
-
-            # Read file
-            fh = open_ncfile(listruns[k],'r')
-            # Read var hist
-            varh_a = fh.variables[var][tstart:tend,1,:,:].squeeze()
-            varh_p = fh.variables[var][tstart:tend,2,:,:].squeeze()
-            varh_i = fh.variables[var][tstart:tend,3,:,:].squeeze()
-
-            # Average signal var hist - var histNat
-            if domain['Atlantic'] != None:
-                varsignal_a[:,k,j] = averageDom(varh_a-varhn_a, 3, domain['Atlantic'], lat, density)
-            if domain['Pacific'] != None:
-                varsignal_p[:,k,j] = averageDom(varh_p-varhn_p, 3, domain['Pacific'], lat, density)
-            if domain['Indian'] != None:
-                varsignal_i[:,k,j] = averageDom(varh_i-varhn_i, 3, domain['Indian'], lat, density)
-
-            print('      varsignal shape:', varsignal_a.shape, varsignal_p.shape, varsignal_i.shape)
-
-            # Compute ToE of averaged domain for run k
-            if domain['Atlantic'] != None and np.ma.is_masked(varnoise_a[j]) == False:
-                toe_a[k,j] = findToE(varsignal_a[:,k,j], varnoise_a[j], multStd) + iniyear
-            if domain['Pacific'] != None and np.ma.is_masked(varnoise_p[j]) == False:
-                toe_p[k,j] = findToE(varsignal_p[:,k,j], varnoise_p[j], multStd) + iniyear
-            if domain['Indian'] != None and np.ma.is_masked(varnoise_i[j]) == False:
-                toe_i[k,j] = findToE(varsignal_i[:,k,j], varnoise_i[j], multStd) + iniyear
-
-    varToE[:,1,:] = toe_a
-    varToE[:,2,:] = toe_p
-    varToE[:,3,:] = toe_i
+        varnoise = np.ma.max(fnoise.variables[var+'stdhn'][:], axis=0)
+
+    # Average signal var hist - var histNat for all basins and domains
+    varsignal = np.ma.masked_all((timN,nruns,basinN,len(domains))) # (time,members,basin,domain)
+    # (the averaged signal of each run is memoised)
+    for k in range(nruns):
+        run_number = os.path.basename(listruns[k]).split('.')[3]
+        run_names[k] = run_number
+        print('    . run number', k, run_number)
+        varsignal[:,k] = cachedCompute([listruns[k], indir_histNat + filehn],
+                                       ['signalDomains', var, tstart, tend, slice(0,145), table['index'], table['valid']],
+                                       lambda: averageDomains(readMember(listruns[k], var, [slice(tstart,tend)])[0]-varhn, table))
+    print('      varsignal shape:', varsignal.shape)
+
+    # Compute ToE of averaged domains for all runs at once
+    noise = np.ma.resize(varnoise, (nruns,basinN,len(domains)))
+    toe = findToEMulti(varsignal.reshape(timN,-1), noise.ravel(), [multStd])[0].reshape(nruns,basinN,len(domains))
+    varToE = np.ma.array(toe + iniyear, mask=np.ma.getmaskarray(varsignal).all(axis=0) | np.ma.getmaskarray(noise))
+
     print('  varToE shape:', varToE.shape)
     print('  ', np.ma.around(np.ma.median(varToE[:,1,0])))
     print('')
@@ -9,9 +9,10 @@ Save ToE in output files
 
 import numpy as np
 from netCDF4 import Dataset as open_ncfile
-from maps_matplot_lib import defVarmme, averageDom
+from maps_matplot_lib import defVarmme, domainTables, averageDomains
 from modelsDef import defModels
-from libToE import findToE, findToE_2thresholds, ToEdomainhistvshistNat
+from libToE import findToEMulti, ToEdomainhistvshistNat, noiseTable, noiseWindow
+from libMembers import readMember, cachedCompute
 import glob
 
 # ----- Workspace ------
@@ -41,6 +42,7 @@ multStd = 2. # detect ToE at multStd std dev of histNat
 
 # use_piC = False # Over projection period, signal = RCP-average(histNat), noise = std(histNat)
 use_piC = True # Over projection period, signal = RCP-average(PiControl), noise = std(PiControl)
+piC_window = [-95, None] # PiControl years used for the projection period mean and noise (any window of the run)
 
 iniyear = 1860
 finalyear = 2100
@@ -64,9 +66,29 @@ legVar = varname['legVar']
 
 nMembers = np.ma.zeros(len(models)) # Initialize array for keeping nb of members per model
 
+# Domain index tables of all models, computed once
+tables = domainTables(models, domains, ToEdomainhistvshistNat, lat, density)
+
+def piCStats(filepiC, table):
+    # Time mean [basin,rho,lat] and noise [basin,domain] of PiControl over piC_window, from noiseTable()s of the run
+    varpiC, = readMember(filepiC, var)
+    t0, t1 = slice(*piC_window).indices(varpiC.shape[0])[0:2]
+    meanvar, stdvar = noiseWindow(noiseTable(varpiC), t0, t1)
+    if method_noise == 'average_std':
+        return meanvar, averageDomains(stdvar, table)
+    else:
+        return meanvar, noiseWindow(noiseTable(averageDomains(varpiC, table)), t0, t1)[1]
+
+def signalMember(fileName, varhn, meanvar, tstart, tend, table):
+    # Averaged signal [time,basin,domain] of a hist+rcp85 run: hist - histNat, then rcp85 - meanvar
+    # (the file is read once for both periods and all basins)
+    varh, varrcp = readMember(fileName, var, [slice(tstart,tend), slice(tend,tend+95)])
+    return np.ma.concatenate((averageDomains(varh-varhn, table), averageDomains(varrcp-meanvar, table)))
+
 for i, model in enumerate(models):
 
     print('Working on', model['name'])
+    table = tables[model['name']]
 
     if (use_piC != True) or (use_piC == True and model['name'] != 'GISS-E2-R' and model['name'] != 'FGOALS-g2'
                              and model['name'] != 'MIROC-ESM'):
@@ -80,185 +102,62 @@ for i, model in enumerate(models):
             tstart = model['props'][2]
             tend = model['props'][3]
 
-            # Read histNat ensemble mean
+            # Read histNat ensemble mean [time,basin,rho,lat]
             filehn = 'cmip5.' + model['name'] + '.historicalNat.ensm.an.ocn.Omon.density.ver-' \
                      + model['file_end_histNat'] + '_zon2D.nc'
-            fhn = open_ncfile(indir_histNat + filehn,'r')
-            # Read var histNat
-            varhn_a = fhn.variables[var][:,1,:,:].squeeze()
-            varhn_p = fhn.variables[var][:,2,:,:].squeeze()
-            varhn_i = fhn.variables[var][:,3,:,:].squeeze()
-            print(' varhn shape : ', varhn_a.shape)
-            # Read std of histNat (max std of all runs for each model)
-            if method_noise == 'average_std':
-                varstd_a = fhn.variables[var+'Std'][1,:,:].squeeze()
-                varstd_p = fhn.variables[var+'Std'][2,:,:].squeeze()
-                varstd_i = fhn.variables[var+'Std'][3,:,:].squeeze()
+            varhn, = readMember(indir_histNat + filehn, var)
+            print(' varhn shape : ', varhn.shape)
 
             # Compute time average of the whole histNat series (signal over projection = RCP - mean(histNat))
-            meanvarhn_a = np.ma.mean(varhn_a, axis=0)
-            meanvarhn_p = np.ma.mean(varhn_p, axis=0)
-            meanvarhn_i = np.ma.mean(varhn_i, axis=0)
+            meanvar = np.ma.mean(varhn, axis=0)
 
-            if use_piC == True:
-                # Read and Compute time average of PiControl over last 95 years + std of PiControl
-                filepiC = glob.glob(indir_piC + 'cmip5.' + model['name'] + '.' + '*zon2D.nc')[0]
-                fpiC = open_ncfile(filepiC,'r')
-                varpiC_a = fpiC.variables[var][-95:,1,:,:].squeeze()
-                varpiC_p = fpiC.variables[var][-95:,2,:,:].squeeze()
-                varpiC_i = fpiC.variables[var][-95:,3,:,:].squeeze()
-                meanvarpiC_a = np.ma.mean(varpiC_a, axis=0)
-                meanvarpiC_p = np.ma.mean(varpiC_p, axis=0)
-                meanvarpiC_i = np.ma.mean(varpiC_i, axis=0)
-                stdvarpiC_a = np.ma.std(varpiC_a, axis=0)
-                stdvarpiC_p = np.ma.std(varpiC_p, axis=0)
-                stdvarpiC_i = np.ma.std(varpiC_i, axis=0)
-
-            # Initialize varnoise for each basin, containing averaged noise for each domain
-            varnoise_a = np.ma.masked_all(len(domains))
-            varnoise_p = np.ma.masked_all(len(domains))
-            varnoise_i = np.ma.masked_all(len(domains))
-            varnoise2_a = np.ma.masked_all(len(domains))
-            varnoise2_p = np.ma.masked_all(len(domains))
-            varnoise2_i = np.ma.masked_all(len(domains))
-            # Initialize varsignal for each basin, containing averaged signal for each domain and each run
-            varsignal_a = np.ma.masked_all((timN,nruns,len(domains)))
-            varsignal_p = np.ma.masked_all((timN,nruns,len(domains)))
-            varsignal_i = np.ma.masked_all((timN,nruns,len(domains)))
-            # Initialize toe for each basin (run, domain)
-            toe_a = np.ma.masked_all((nruns,len(domains)))
-            toe_p = np.ma.masked_all((nruns,len(domains)))
-            toe_i = np.ma.masked_all((nruns,len(domains)))
-            # Initialize output variable
-            varToE = np.ma.masked_all((nruns,basinN,len(domains))) # (members,basin,domain)
-
-            if method_noise == 'average_histNat':
+            # Noise [basin,domain] over historical period
+            if method_noise == 'average_std':
+                # Average std of histNat (max std of all runs for each model)
+                varnoise = averageDomains(readMember(indir_histNat + filehn, var+'Std', None), table)
+            else:
                 # Here we read the std of the averaged histNat in the 5 domains for all runs, then take the max as our noise
                 filenoise = 'cmip5.' + model['name'] + '.noise_domains_hist_histNat.std_of_average.nc'
                 fnoise = open_ncfile(indir_noise + filenoise,'r')
-                varstd = fnoise.variables[var+'stdhn'][:]
-                varnoise_a = np.ma.max(varstd[:,1,:], axis=0)
-                varnoise_p = np.ma.max(varstd[:,2,:], axis=0)
-                varnoise_i = np.ma.max(varstd[:,3,:], axis=0)
-
-            # Loop over 5 domains
-            for j, domain_name in enumerate(domains):
-                print('- ', j, domains[j])
-
-                # Select domain to average
-                domain = ToEdomainhistvshistNat(model['name'], domain_name)[0]
-                domain_char = ToEdomainhistvshistNat(model['name'], domain_name)[1]
-
-                if method_noise == 'average_std':
-                    # Average noise
-                    if domain['Atlantic'] != None:
-                        varnoise_a[j] = averageDom(varstd_a, 2, domain['Atlantic'], lat, density)
-                    if domain['Pacific'] != None:
-                        varnoise_p[j] = averageDom(varstd_p, 2, domain['Pacific'], lat, density)
-                    if domain['Indian'] != None:
-                        varnoise_i[j] = averageDom(varstd_i, 2, domain['Indian'], lat, density)
-
-                # Average noise over projection period if we want to use PiControl
-                if use_piC == True:
-                    if domain['Atlantic'] != None:
-                        if method_noise == 'average_std':
-                            varnoise2_a[j] = averageDom(stdvarpiC_a, 2, domain['Atlantic'], lat, density)
-                        else:
-                            varnoise2_a[j] = np.ma.std(averageDom(varpiC_a, 3, domain['Atlantic'], lat, density), axis=0)
-                    if domain['Pacific'] != None:
-                        if method_noise == 'average_std':
-                            varnoise2_p[j] = averageDom(stdvarpiC_p, 2, domain['Pacific'], lat, density)
-                        else:
-                            varnoise2_p[j] = np.ma.std(averageDom(varpiC_p, 3, domain['Pacific'], lat, density), axis=0)
-                    if domain['Indian'] != None:
-                        if method_noise == 'average_std':
-                            varnoise2_i[j] = averageDom(stdvarpiC_i, 2, domain['Indian'], lat, density)
-                        else:
-                            varnoise2_i[j] = np.ma.std(averageDom(varpiC_i, 3, domain['Indian'], lat, density), axis=0)
-
-                # Loop over number of runs
-                for k in range(nruns):
-                    print('    . run number', k)
-
-                    # Read file
-                    fhrcp = open_ncfile(listruns[k],'r')
-                    # Read var hist + rcp85
-                    varh_a = fhrcp.variables[var][tstart:tend,1,:,:].squeeze()
-                    varh_p = fhrcp.variables[var][tstart:tend,2,:,:].squeeze()
-                    varh_i = fhrcp.variables[var][tstart:tend,3,:,:].squeeze()
-                    varrcp_a = fhrcp.variables[var][tend:tend+95,1,:,:].squeeze()
-                    varrcp_p = fhrcp.variables[var][tend:tend+95,2,:,:].squeeze()
-                    varrcp_i = fhrcp.variables[var][tend:tend+95,3,:,:].squeeze()
-
-                    # Average signal hist - histNat over historical period,
-                    # rcp85 - mean(histNat) or rcp85 - mean(PiC) over projection period
-                    if domain['Atlantic'] != None:
-                        varsignal_a[0:145,k,j] = averageDom(varh_a-varhn_a, 3, domain['Atlantic'], lat, density)
-                        if use_piC != True:
-                            varsignal_a[145:,k,j] = averageDom(varrcp_a-meanvarhn_a, 3, domain['Atlantic'], lat, density)
-                        else:
-                            varsignal_a[145:,k,j] = averageDom(varrcp_a-meanvarpiC_a, 3, domain['Atlantic'], lat, density)
-                    if domain['Pacific'] !=None:
-                        varsignal_p[0:145,k,j] = averageDom(varh_p-varhn_p, 3, domain['Pacific'], lat, density)
-                        if use_piC != True:
-                            varsignal_p[145:,k,j] = averageDom(varrcp_p-meanvarhn_p, 3, domain['Pacific'], lat, density)
-                        else:
-                            varsignal_p[145:,k,j] = averageDom(varrcp_p-meanvarpiC_p, 3, domain['Pacific'], lat, density)
-                    if domain['Indian'] != None:
-                        varsignal_i[0:145,k,j] = averageDom(varh_i-varhn_i, 3, domain['Indian'], lat, density)
-                        if use_piC != True:
-                            varsignal_i[145:,k,j] = averageDom(varrcp_i-meanvarhn_i, 3, domain['Indian'], lat, density)
-                        else:
-                            varsignal_i[145:,k,j] = averageDom(varrcp_i-meanvarpiC_i, 3, domain['Indian'], lat, density)
-
-                    print('      varsignal shape:', varsignal_a.shape, varsignal_p.shape, varsignal_i.shape)
-
-                    # Compute ToE of averaged domain for run k
-                    if use_piC != True:
-                        if domain['Atlantic'] != None and np.ma.is_masked(varnoise_a[j]) == False:
-                            toe_a[k,j] = findToE(varsignal_a[:,k,j], varnoise_a[j], multStd) + iniyear
-                        if domain['Pacific'] != None and np.ma.is_masked(varnoise_p[j]) == False:
-                            toe_p[k,j] = findToE(varsignal_p[:,k,j], varnoise_p[j], multStd) + iniyear
-                        if domain['Indian'] != None and np.ma.is_masked(varnoise_i[j]) == False:
-                            toe_i[k,j] = findToE(varsignal_i[:,k,j], varnoise_i[j], multStd) + iniyear
-                    else:
-                        if domain['Atlantic'] != None and np.ma.is_masked(varnoise_a[j]) == False \
-                                and np.ma.is_masked(varnoise2_a[j]) == False:
-                            toe_a[k,j] = findToE_2thresholds(varsignal_a[:,k,j], varnoise_a[j], varnoise2_a[j], 145, multStd) + iniyear
-                        if domain['Pacific'] != None and np.ma.is_masked(varnoise_p[j]) == False \
-                                and np.ma.is_masked(varnoise2_p[j]) == False:
-                            toe_p[k,j] = findToE_2thresholds(varsignal_p[:,k,j], varnoise_p[j], varnoise2_p[j], 145, multStd) + iniyear
-                        if domain['Indian'] != None and np.ma.is_masked(varnoise_i[j]) == False \
-                                and np.ma.is_masked(varnoise2_i[j]) == False:
-                            toe_i[k,j] = findToE_2thresholds(varsignal_i[:,k,j], varnoise_i[j], varnoise2_i[j], 145, multStd) + iniyear
-
-                    # Take out runs where the signal is of opposite sign than expected
-                    if signal_domains[j] == 'fresher':
-                        if np.ma.mean(varsignal_a[-5:,k,j],axis=0) > 2*varnoise_a[j]:
-                            toe_a[k,j] = np.ma.masked
-                        if np.ma.mean(varsignal_p[-5:,k,j],axis=0) > 2*varnoise_p[j]:
-                            toe_p[k,j] = np.ma.masked
-                        if np.ma.mean(varsignal_i[-5:,k,j],axis=0) > 2*varnoise_i[j]:
-                            toe_i[k,j] = np.ma.masked
-                    else:
-                        if np.ma.mean(varsignal_a[-5:,k,j],axis=0) < -2*varnoise_a[j]:
-                            toe_a[k,j] = np.ma.masked
-                        if np.ma.mean(varsignal_p[-5:,k,j],axis=0) < -2*varnoise_p[j]:
-                            toe_p[k,j] = np.ma.masked
-                        if np.ma.mean(varsignal_i[-5:,k,j],axis=0) < -2*varnoise_i[j]:
-                            toe_i[k,j] = np.ma.masked
-
-                    # # Take out runs that are wrongly concatenated (i.e. which have a jump between 2005 and 2006)
-                    # if np.ma.abs(varsignal_a[145,k,j]-varsignal_a[144,k,j])>0.2:  # Jump in salinity difference
-                    #     toe_a[k,j] = np.ma.masked
-                    # if np.ma.abs(varsignal_p[145,k,j]-varsignal_p[144,k,j])>0.2:  # Jump in salinity difference
-                    #     toe_p[k,j] = np.ma.masked
-                    # if np.ma.abs(varsignal_i[145,k,j]-varsignal_i[144,k,j])>0.2:  # Jump in salinity difference
-                    #     toe_i[k,j] = np.ma.masked
-
-            varToE[:,1,:] = toe_a
-            varToE[:,2,:] = toe_p
-            varToE[:,3,:] = toe_i
+                varnoise = np.ma.max(fnoise.variables[var+'stdhn'][:], axis=0)
+
+            if use_piC == True:
+                # Read and Compute time average of PiControl over piC_window + noise of PiControl over projection period
+                filepiC = glob.glob(indir_piC + 'cmip5.' + model['name'] + '.' + '*zon2D.nc')[0]
+                meanvar, varnoise2 = cachedCompute([filepiC], ['piCStats', var, piC_window, method_noise,
+                                                               table['index'], table['valid']],
+                                                   lambda: piCStats(filepiC, table))
+            else:
+                varnoise2 = varnoise
+
+            # Average signal hist - histNat over historical period,
+            # rcp85 - mean(histNat) or rcp85 - mean(PiC) over projection period, for all basins and domains
+            varsignal = np.ma.masked_all((timN,nruns,basinN,len(domains))) # (time,members,basin,domain)
+            # (the averaged signal of each run is memoised)
+            for k in range(nruns):
+                print('    . run number', k)
+                varsignal[:,k] = cachedCompute([listruns[k], indir_histNat + filehn] + ([filepiC] if use_piC else []),
+                                               ['signalDomains', var, tstart, tend, use_piC, piC_window,
+                                                table['index'], table['valid']],
+                                               lambda: signalMember(listruns[k], varhn, meanvar, tstart, tend, table))
+            print('      varsignal shape:', varsignal.shape)
+
+            # Compute ToE of averaged domains for all runs at once
+            noise1 = np.ma.resize(varnoise, (nruns,basinN,len(domains)))
+            noise2 = np.ma.resize(varnoise2, (nruns,basinN,len(domains)))
+            toe = findToEMulti(varsignal.reshape(timN,-1), [noise1.ravel(), noise2.ravel()], [multStd],
+                               tidx=145)[0].reshape(nruns,basinN,len(domains))
+            varToE = np.ma.array(toe + iniyear, mask=np.ma.getmaskarray(varsignal).all(axis=0)
+                                 | np.ma.getmaskarray(noise1) | np.ma.getmaskarray(noise2))
+
+            # Take out runs where the signal is of opposite sign than expected
+            endsignal = np.ma.mean(varsignal[-5:], axis=0)
+            fresher = np.array([sign == 'fresher' for sign in signal_domains])
+            opposite = np.where(fresher, endsignal > 2*varnoise, endsignal < -2*varnoise)
+            varToE[np.ma.filled(opposite, False)] = np.ma.masked
+
+            # # Take out runs that are wrongly concatenated (i.e. which have a jump between 2005 and 2006)
+            # varToE[np.ma.filled(np.ma.abs(varsignal[145]-varsignal[144]) > 0.2, False)] = np.ma.masked  # Jump in salinity difference
             print('  varToE shape:', varToE.shape)
             print('  ', np.ma.around(np.ma.median(varToE[:,1,0])))
             print('')
@@ -11,7 +11,8 @@ import numpy as np
 from netCDF4 import Dataset as open_ncfile
 from maps_matplot_lib import defVarmme
 from modelsDef import defModels
-from libToE import findToE, findToE_2thresholds
+from libToE import findToE
+from libMembers import readMember, readMembers
 import glob
 
 # ----- Workspace ------
@@ -70,103 +71,43 @@ for i, model in enumerate(models): # Loop on models
             tstart = model['props'][2]
             tend = model['props'][3]
 
-            # Read histNat ensemble mean
+            # Read histNat ensemble mean [time,basin,density,latitude] and std of histNat
+            # (max std of all runs for each model), once for all basins
             filehn = 'cmip5.' + model['name'] + '.historicalNat.ensm.an.ocn.Omon.density.ver-' \
                      + model['file_end_histNat'] + '_zon2D.nc'
-            fhn = open_ncfile(indir_histNat + filehn,'r')
-
-            # Read var histNat
-            varhn_a = fhn.variables[var][:,1,:,:].squeeze()
-            varhn_p = fhn.variables[var][:,2,:,:].squeeze()
-            varhn_i = fhn.variables[var][:,3,:,:].squeeze()
-
-            # Read std of histNat (max std of all runs for each model)
-            stdvarhn_a = fhn.variables[var+'Std'][1,:,:].squeeze()
-            stdvarhn_i = fhn.variables[var+'Std'][3,:,:].squeeze()
-            stdvarhn_p = fhn.variables[var+'Std'][2,:,:].squeeze()
+            varhn, = readMember(indir_histNat + filehn, var)
+            stdvarhn = readMember(indir_histNat + filehn, var+'Std', None)
 
             # Compute time average of the whole histNat series (signal over projection = RCP - mean(histNat))
-            meanvarhn_a = np.ma.mean(varhn_a, axis=0)
-            meanvarhn_p = np.ma.mean(varhn_p, axis=0)
-            meanvarhn_i = np.ma.mean(varhn_i, axis=0)
+            meanvar = np.ma.mean(varhn, axis=0)
 
-            # Reorganise i,j dims in single dimension data (speeds up loops)
-            stdvarhn_a = np.reshape(stdvarhn_a, (levN*latN))
-            stdvarhn_p = np.reshape(stdvarhn_p, (levN*latN))
-            stdvarhn_i = np.reshape(stdvarhn_i, (levN*latN))
+            # Reorganise basin,i,j dims in single dimension data (speeds up loops)
+            stdvarhn = np.reshape(stdvarhn, (basinN*levN*latN))
 
             if use_piC:
-                # Read and Compute time average of PiControl over last 95 years + std of PiControl
+                # Read and Compute time average of PiControl over last 95 years
                 filepiC = glob.glob(indir_piC + 'cmip5.' + model['name'] + '.' + '*zon2D.nc')[0]
-                fpiC = open_ncfile(filepiC,'r')
-                varpiC_a = fpiC.variables[var][-95:,1,:,:].squeeze()
-                varpiC_p = fpiC.variables[var][-95:,2,:,:].squeeze()
-                varpiC_i = fpiC.variables[var][-95:,3,:,:].squeeze()
-                meanvarpiC_a = np.ma.mean(varpiC_a, axis=0)
-                meanvarpiC_p = np.ma.mean(varpiC_p, axis=0)
-                meanvarpiC_i = np.ma.mean(varpiC_i, axis=0)
-                stdvarpiC_a = np.ma.std(varpiC_a, axis=0)
-                stdvarpiC_p = np.ma.std(varpiC_p, axis=0)
-                stdvarpiC_i = np.ma.std(varpiC_i, axis=0)
-
-                # Reorganise i,j dims in single dimension data (speeds up loops)
-                stdvarpiC_a = np.reshape(stdvarpiC_a, (levN*latN))
-                stdvarpiC_p = np.reshape(stdvarpiC_p, (levN*latN))
-                stdvarpiC_i = np.reshape(stdvarpiC_i, (levN*latN))
-
-            # Initialize toe for each basin (run, density, lat)
-            toe_a = np.ma.masked_all((nruns,levN,latN))
-            toe_p = np.ma.masked_all((nruns,levN,latN))
-            toe_i = np.ma.masked_all((nruns,levN,latN))
+                varpiC, = readMember(filepiC, var, [slice(-95,None)])
+                meanvar = np.ma.mean(varpiC, axis=0)
+
             # Initialize output variable
             varToE = np.ma.masked_all((nruns,basinN,levN,latN)) # (members,basin,density,latitude)
 
-            # Loop over number of runs
-            for k in range(nruns):
+            # Loop over number of runs (each file is read once for both periods and all basins)
+            for k, (varh, varrcp) in enumerate(readMembers(listruns, var, [slice(tstart,tend), slice(tend,tend+95)])):
                 print('    . run number', k)
 
-                # Read file
-                fhrcp = open_ncfile(listruns[k],'r')
-                # Read var hist + rcp85
-                varh_a = fhrcp.variables[var][tstart:tend,1,:,:].squeeze()
-                varh_p = fhrcp.variables[var][tstart:tend,2,:,:].squeeze()
-                varh_i = fhrcp.variables[var][tstart:tend,3,:,:].squeeze()
-                varrcp_a = fhrcp.variables[var][tend:tend+95,1,:,:].squeeze()
-                varrcp_p = fhrcp.variables[var][tend:tend+95,2,:,:].squeeze()
-                varrcp_i = fhrcp.variables[var][tend:tend+95,3,:,:].squeeze()
-
-                # Initialize and fill var_signal for each basin (timN, density, latitude)
-                varsignal_a = np.ma.masked_all((timN,levN,latN))
-                varsignal_p = np.ma.masked_all((timN,levN,latN))
-                varsignal_i = np.ma.masked_all((timN,levN,latN))
-
-                varsignal_a[0:145,:,:] = varh_a-varhn_a
-                varsignal_p[0:145,:,:] = varh_p-varhn_p
-                varsignal_i[0:145,:,:] = varh_i-varhn_i
-
-                if use_piC == False:
-                    varsignal_a[145:,:,:] = varrcp_a-meanvarhn_a
-                    varsignal_p[145:,:,:] = varrcp_p-meanvarhn_p
-                    varsignal_i[145:,:,:] = varrcp_i-meanvarhn_i
-                else:
-                    varsignal_a[145:,:,:] = varrcp_a-meanvarpiC_a
-                    varsignal_p[145:,:,:] = varrcp_p-meanvarpiC_p
-                    varsignal_i[145:,:,:] = varrcp_i-meanvarpiC_i
-
-                # Reorganise i,j dims in single dimension data (speeds up loops)
-                varsignal_a = np.reshape(varsignal_a, (timN, levN*latN))
-                varsignal_p = np.reshape(varsignal_p, (timN, levN*latN))
-                varsignal_i = np.reshape(varsignal_i, (timN, levN*latN))
+                # Signal (timN, basin, density, latitude)
+                varsignal = np.ma.concatenate((varh-varhn, varrcp-meanvar), axis=0)
+
+                # Reorganise basin,i,j dims in single dimension data (speeds up loops)
+                varsignal = np.reshape(varsignal, (timN, basinN*levN*latN))
 
                 # Compute ToE as last date when diff hist+RCP - histNat is larger than mult * stddev
-                toe_a = np.reshape(findToE(varsignal_a, stdvarhn_a, multStd),(levN,latN))
-                toe_p = np.reshape(findToE(varsignal_p, stdvarhn_p, multStd),(levN,latN))
-                toe_i = np.reshape(findToE(varsignal_i, stdvarhn_i, multStd),(levN,latN))
+                toe = np.reshape(findToE(varsignal, stdvarhn, multStd), (basinN,levN,latN))
 
                 # Save in output variable
-                varToE[k,1,:,:] = toe_a
-                varToE[k,2,:,:] = toe_p
-                varToE[k,3,:,:] = toe_i
+                varToE[k,1:,:,:] = toe[1:]
 
             # Save in output file
             if use_piC == False:
@@ -0,0 +1,132 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Read-once access to the zon2D member files used by the ToE and noise scripts
+Each member variable is read once for all basins (a single netCDF read covering all the requested
+time slices) and the same array is handed to every basin and domain computation
+Derived arrays (means, std, domain averages) can be memoised on disk across scripts with cachedCompute()
+"""
+
+import os
+import hashlib
+import numpy as np
+from netCDF4 import Dataset as open_ncfile
+
+# Cache of derived arrays: directory and disk quota (GB)
+cacheDir = os.environ.get('TOE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'toe_derived'))
+cacheQuota = 2.
+
+
+def readMember(fileName, var, tslices=[slice(None)]):
+    '''
+    Read variable var of a member file once, for all basins and all requested time slices
+        tslices is a list of slices along time (first dimension), e.g. [slice(tstart,tend), slice(tend,tend+95)]
+        or None to read a variable without time dimension (e.g. var+'Std')
+    The union of the slices is read in one call and each slice is returned as a view of it
+    returns a list of arrays [time,basin,density,latitude] (one per slice), or the array if tslices is None
+    '''
+    f = open_ncfile(fileName, 'r')
+    v = f.variables[var]
+    if tslices is None:
+        data = v[:]
+        f.close()
+        return data
+    timN = v.shape[0]
+    bounds = [s.indices(timN)[0:2] for s in tslices]
+    t0 = min([b[0] for b in bounds])
+    t1 = max([b[1] for b in bounds])
+    data = v[t0:t1]
+    f.close()
+    return [data[b[0]-t0:b[1]-t0] for b in bounds]
+
+
+def readMembers(listFiles, var, tslices=[slice(None)]):
+    '''
+    Iterate over the member files of an ensemble, reading each one once with readMember()
+    yields the list of slices of each member, in the order of listFiles
+    '''
+    for fileName in listFiles:
+        yield readMember(fileName, var, tslices)
+
+
+# -----------------------------------------------
+#          Cache of derived arrays
+# -----------------------------------------------
+
+def cacheKey(fileNames, params):
+    '''
+    Content address of a derived quantity: hash of the input files (path, size, mtime) and of the
+    operation parameters (numbers, strings, lists or numpy arrays, e.g. a domainTables() index table)
+    '''
+    h = hashlib.sha1()
+    for fileName in fileNames:
+        st = os.stat(fileName)
+        h.update(repr((os.path.abspath(fileName), st.st_size, int(st.st_mtime))).encode())
+    for p in params:
+        if isinstance(p, np.ndarray):
+            h.update(repr((p.dtype.str, p.shape)).encode())
+            h.update(np.ascontiguousarray(p).tobytes())
+        else:
+            h.update(repr(p).encode())
+    return h.hexdigest()
+
+
+def cachedCompute(fileNames, params, compute, cache=True):
+    '''
+    Return compute() (a masked array or a tuple of masked arrays derived from fileNames),
+    reading it from the cache if it was already computed with the same files and params
+        fileNames: list of input files the result depends on
+        params: list of operation parameters (variable name, time slice, method, domain table...)
+    Results are stored as compressed .npz files in cacheDir; the least recently used ones are
+    removed when the cache exceeds cacheQuota GB
+    cache=False bypasses the cache
+    '''
+    if not cache:
+        return compute()
+    fileCache = os.path.join(cacheDir, cacheKey(fileNames, params) + '.npz')
+    if os.path.exists(fileCache):
+        os.utime(fileCache, None) # mark as recently used
+        npz = np.load(fileCache)
+        result = tuple([np.ma.array(npz['data%d' % n], mask=npz['mask%d' % n]) for n in range(int(npz['n']))])
+        single = bool(npz['single'])
+        npz.close()
+        return result[0] if single else result
+    result = compute()
+    arrays = result if isinstance(result, tuple) else (result,)
+    store = {'n': len(arrays), 'single': not isinstance(result, tuple)}
+    for n, a in enumerate(arrays):
+        a = np.ma.asarray(a)
+        store['data%d' % n] = a.filled(0)
+        store['mask%d' % n] = np.ma.getmaskarray(a)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    # write then rename, so that concurrent scripts never read a partial file
+    fileTmp = fileCache[:-4] + '.%d.tmp.npz' % os.getpid()
+    np.savez_compressed(fileTmp, **store)
+    os.rename(fileTmp, fileCache)
+    cacheEvict()
+    return result
+
+
+def cacheEvict(quota=None):
+    '''
+    Remove the least recently used cached arrays until the cache size is below quota GB (default cacheQuota)
+    '''
+    if quota is None:
+        quota = cacheQuota
+    entries = []
+    for name in os.listdir(cacheDir):
+        if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+            st = os.stat(os.path.join(cacheDir, name))
+            entries.append((st.st_mtime, st.st_size, name))
+    entries.sort()
+    size = sum([e[1] for e in entries])
+    for mtime, fsize, name in entries:
+        if size <= quota*1.e9:
+            break
+        try:
+            os.remove(os.path.join(cacheDir, name))
+        except OSError: # already removed by another script
+            pass
+        size -= fsize
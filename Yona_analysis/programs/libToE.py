@@ -1,30 +1,19 @@
+import os,sys
 import numpy as np
 import time as timc
+# findToEMulti is shared with the density binning code (libToECore.py at the root of the repository)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from libToECore import findToEMulti
 
-def findToE(signal, noise, mult):
+def findToE(signal, noise, mult, unemerged=None):
     '''
     define Time of Emergence (ToE) from last time index at which signal is larger than mult*noise
-        signal is [time,space]
-        noise is [space]
+        signal is [time,space] or [time]
+        noise is [space] or single-value
         mult is float
-    TODO: add valmask where ToE not reached
+        unemerged is the value where ToE is not reached (default timN)
     '''
-    #tcpu0 = timc.clock()
-    timN = signal.shape[0]
-    toe_wrk = np.ma.ones(signal.shape)*1. # init toe_wrk array to 1
-    signaltile = np.reshape(np.tile(noise,timN),signal.shape) # repeat noise timN
-    toe_idx = np.argwhere(abs(signal) >= mult*signaltile) # find indices of points where signal > noise
-    if signal.size > timN: # if there are at least 2 dimensions
-        toe_wrk[toe_idx[:,0],toe_idx[:,1]] = 0. # set corresponding points in toe_wrk to zero
-    else: # if there is only the time dimension
-        toe_wrk[toe_idx[:,0]] = 0
-    toe = timN-np.flipud(toe_wrk).argmax(axis=0) # compute ToE as last index when signal > noise
-    #tcpu1 = timc.clock()
-    # perf
-    #print ' ToE CPU = ',tcpu1-tcpu0
-
-
-    return toe
+    return findToEMulti(signal, noise, [mult], unemerged=unemerged)[0]
 
 def findToE_2thresholds(signal, noise1, noise2, tidx, mult):
     '''
@@ -34,21 +23,72 @@ def findToE_2thresholds(signal, noise1, noise2, tidx, mult):
         mult is float
         tidx is an integer
         use noise1 over first part of the signal (until tidx), noise2 over second part
-    1D case for now
     '''
-    timN = signal.shape[0]
-    toe_wrk = np.ma.ones(signal.shape)*1. # init toe_wrk array to 1
-    signaltile1 = np.tile(noise1,tidx) # repeat noise1
-    signaltile2 = np.tile(noise2,timN-tidx)
-    signaltile = np.concatenate((signaltile1, signaltile2))
-    toe_idx = np.argwhere(abs(signal) >= mult*signaltile) # find indices of points where signal > noise
-    # if signal.size > timN: # if there are at least 2 dimensions
-    #     toe_wrk[toe_idx[:,0],toe_idx[:,1]] = 0. # set corresponding points in toe_wrk to zero
-    # else: # if there is only the time dimension
-    toe_wrk[toe_idx[:,0]] = 0
-    toe = timN-np.flipud(toe_wrk).argmax(axis=0) # compute ToE as last index when signal > noise
-
-    return toe
+    return findToEMulti(signal, [noise1, noise2], [mult], tidx=tidx)[0]
+
+def noiseTable(var):
+    '''
+    Cumulative sums of a (control) run along time, to get the mean and std over any window in O(1) per point
+        var is [time,space...] (masked values are left out of the sums)
+    returns a dictionary with the cumulative number of values 'n', sums 's' and squares 's2' of var-'ref'
+    ([time+1,space...], leading zero), 'ref' being the time mean of the run (to limit round-off errors)
+    '''
+    var = np.ma.asarray(var)
+    good = ~np.ma.getmaskarray(var)
+    ref = np.ma.filled(np.ma.mean(var, axis=0), 0.)
+    anom = np.where(good, var.filled(0.) - ref, 0.)
+    table = {'ref': ref}
+    for name, x in [['n', good], ['s', anom], ['s2', anom*anom]]:
+        table[name] = np.zeros((var.shape[0]+1,) + var.shape[1:])
+        np.cumsum(x, axis=0, out=table[name][1:])
+    return table
+
+def noiseWindow(table, t0, t1):
+    '''
+    mean and (population) standard deviation of the run over time window [t0:t1] from its noiseTable
+        t0, t1 are integers, or arrays of integers (e.g. all start positions for a given window length)
+    returns mean, std ([space...] or [window,space...]), masked where the window has no valid value
+    (same as np.ma.mean and np.ma.std over var[t0:t1])
+    '''
+    n = table['n'][t1] - table['n'][t0]
+    s = table['s'][t1] - table['s'][t0]
+    s2 = table['s2'][t1] - table['s2'][t0]
+    empty = n == 0
+    n = np.where(empty, 1., n)
+    mean = s/n
+    std = np.sqrt(np.maximum(s2/n - mean*mean, 0.))
+    return np.ma.array(mean + table['ref'], mask=empty), np.ma.array(std, mask=empty)
+
+def noiseRolling(table, length):
+    '''
+    mean and standard deviation of the run over all windows of length years (all start positions)
+    returns mean, std [start,space...]
+    '''
+    t0 = np.arange(table['n'].shape[0] - length)
+    return noiseWindow(table, t0, t0 + length)
+
+def noiseBootstrap(table, length, nboot=1000, block=10, seed=None):
+    '''
+    block-bootstrap distribution of the standard deviation of the run over length years
+    Each of the nboot series is made of length/block blocks of block consecutive years drawn at random in the
+    run (the last block is truncated so that series are exactly length years long); its sums are built from
+    the block sums of the noiseTable (no copy of the data)
+    returns std [nboot,space...], masked where a series has no valid value
+    '''
+    rng = np.random.RandomState(seed)
+    nblock = int(np.ceil(float(length)/block))
+    t0 = rng.randint(0, table['n'].shape[0] - block, size=(nboot, nblock))
+    shape = (nboot,) + table['n'].shape[1:]
+    n = np.zeros(shape); s = np.zeros(shape); s2 = np.zeros(shape)
+    for ib in range(nblock):
+        t1 = t0[:,ib] + min(block, length - ib*block)
+        n += table['n'][t1] - table['n'][t0[:,ib]]
+        s += table['s'][t1] - table['s'][t0[:,ib]]
+        s2 += table['s2'][t1] - table['s2'][t0[:,ib]]
+    empty = n == 0
+    n = np.where(empty, 1., n)
+    std = np.sqrt(np.maximum(s2/n - (s/n)**2, 0.))
+    return np.ma.array(std, mask=empty)
 
 
 
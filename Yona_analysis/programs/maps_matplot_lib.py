@@ -4,11 +4,9 @@
 
 import numpy as np
 import numpy.ma as ma
-from mpl_toolkits.basemap import Basemap
 #from matplotlib.ticker import MaxNLocator
-from netCDF4 import Dataset as open_ncfile
-from matplotlib.ticker import AutoMinorLocator
-from scipy.interpolate import interp1d, InterpolatedUnivariateSpline
+# Basemap, netCDF4, matplotlib and scipy are imported in the functions using them, so that
+# defVar*/averageDom can be used by compute scripts without loading the plotting stack
 
 # --------------------------------
 #       Variable properties
@@ -381,6 +379,9 @@ def zonal_2D(plt, action, ax0, ax1, ticks, lat, density, varBasin, domrho, cmap,
 def proj_map(kind, plt, ax, minmax, clevsm, clevsm_bold, lat, lon, cmap, isopyc, sliced_density, var1,
              var2 = None, var3 = None):
 
+    from mpl_toolkits.basemap import Basemap
+    from netCDF4 import Dataset as open_ncfile
+
     isopyc_idx = np.argmin(np.abs(sliced_density - isopyc))
 
     if kind == 'hist-histNat':
@@ -475,6 +476,8 @@ def proj_map(kind, plt, ax, minmax, clevsm, clevsm_bold, lat, lon, cmap, isopyc,
 def proj_map_zonal_changes(kind, zonal_change, plt, ax1, ax2, minmax, clevsm, lat, lon, cmap, isopyc,
                            sliced_density, var1, var2 = None):
 
+    from mpl_toolkits.basemap import Basemap
+    from netCDF4 import Dataset as open_ncfile
 
     isopyc_idx = np.argmin(np.abs(sliced_density - isopyc))
 
@@ -589,14 +592,24 @@ def proj_map_zonal_changes(kind, zonal_change, plt, ax1, ax2, minmax, clevsm, la
 #          Average in lat/rho domain
 # -----------------------------------------------
 
+def domainIndex(domain, lat, rho):
+    '''
+    Index bounds [ridx1, ridx2, lidx1, lidx2] of a [latmin, latmax, rhomin, rhomax] box on the rho/lat grids
+    The box average is taken over [ridx1:ridx2] and [lidx1:lidx2] (as in averageDom)
+    Returns None if the box is not defined or does not intersect the grid
+    '''
+    if domain is None:
+        return None
+    latidx = np.flatnonzero((lat >= domain[0]) & (lat <= domain[1]))
+    rhoidx = np.flatnonzero((rho >= domain[2]) & (rho <= domain[3]))
+    if latidx.size == 0 or rhoidx.size == 0:
+        return None
+    return [rhoidx[0], rhoidx[-1], latidx[0], latidx[-1]]
+
+
 def averageDom(field, dim, domain, lat, rho):
 
-    latidx = np.argwhere((lat >= domain[0]) & (lat <= domain[1])).transpose()
-    rhoidx = np.argwhere((rho >= domain[2]) & (rho <= domain[3])).transpose()
-    lidx1 = latidx[0][0];
-    lidx2 = latidx[0][-1]
-    ridx1 = rhoidx[0][0];
-    ridx2 = rhoidx[0][-1]
+    ridx1, ridx2, lidx1, lidx2 = domainIndex(domain, lat, rho)
     if dim == 3:
         vara = np.ma.average(field[:, ridx1:ridx2, :], axis=1)
         var_ave = np.ma.average(vara[:, lidx1:lidx2], axis=1)
@@ -607,14 +620,135 @@ def averageDom(field, dim, domain, lat, rho):
     return var_ave
 
 
+def domainTables(models, domains, domainFunc, lat, rho, basins=['Atlantic', 'Pacific', 'Indian']):
+    '''
+    Compile the domain boxes of all models into index tables once, to be used by averageDomains()
+    - models: list of model names (or defModels() dictionaries)
+    - domains: list of domain names (e.g. ['Southern ST', 'SO', 'Northern ST', 'North Atlantic', 'North Pacific'])
+    - domainFunc: libToE.ToEdomainhistvshistNat or libToE.ToEdomain1pctCO2vsPiC
+    - basins: basin names of field indices 1,2,3 (index 0, global, has no box)
+    Returns a dictionary model name -> {'index': [basin, domain, 4] ridx1, ridx2, lidx1, lidx2, 'valid': [basin, domain]}
+    '''
+    tables = {}
+    for model in models:
+        name = model['name'] if isinstance(model, dict) else model
+        index = np.zeros((len(basins)+1, len(domains), 4), dtype=np.int64)
+        valid = np.zeros((len(basins)+1, len(domains)), dtype=bool)
+        for j, domain_name in enumerate(domains):
+            try:
+                domain = domainFunc(name, domain_name)[0]
+            except UnboundLocalError:  # model not in the domain definitions
+                continue
+            for ib, basin in enumerate(basins):
+                idx = domainIndex(domain[basin], lat, rho)
+                if idx is not None:
+                    index[ib+1, j] = idx
+                    valid[ib+1, j] = True
+        tables[name] = {'index': index, 'valid': valid}
+
+    return tables
+
+
+def averageDomains(field, table):
+    '''
+    Average a field in all domains and basins of a domainTables() table at once
+    Same average as averageDom (mean over rho, then over latitude of the rho means), computed
+    for all boxes from prefix sums of the valid values along rho and latitude
+    - field: [time, basin, rho, lat] or [basin, rho, lat]
+    Returns [time, basin, domain] or [basin, domain], masked where the box is not defined or empty
+    '''
+    field = np.ma.asarray(field)
+    single = field.ndim == 3
+    if single:
+        field = field[np.newaxis]
+    timN, basN, rhoN, latN = field.shape
+    index = table['index']
+    valid = table['valid']
+    domN = valid.shape[1]
+    bidx = np.arange(basN)[:, np.newaxis]
+    didx = np.arange(domN)[np.newaxis, :]
+    ridx1, ridx2, lidx1, lidx2 = [index[..., k] for k in range(4)]
+
+    # Mean over rho in each box for all latitudes: [time, basin, domain, lat]
+    good = ~np.ma.getmaskarray(field)
+    csum = np.zeros((timN, basN, rhoN+1, latN))
+    ccnt = np.zeros((timN, basN, rhoN+1, latN))
+    np.cumsum(field.filled(0.), axis=2, out=csum[:, :, 1:, :])
+    np.cumsum(good, axis=2, out=ccnt[:, :, 1:, :])
+    rsum = csum[:, bidx, ridx2, :] - csum[:, bidx, ridx1, :]
+    rcnt = ccnt[:, bidx, ridx2, :] - ccnt[:, bidx, ridx1, :]
+    rgood = rcnt > 0
+    rmean = np.where(rgood, rsum/np.maximum(rcnt, 1), 0.)
+
+    # Mean over latitude of the rho means: [time, basin, domain]
+    csum = np.zeros((timN, basN, domN, latN+1))
+    ccnt = np.zeros((timN, basN, domN, latN+1))
+    np.cumsum(rmean, axis=3, out=csum[..., 1:])
+    np.cumsum(rgood, axis=3, out=ccnt[..., 1:])
+    lsum = csum[:, bidx, didx, lidx2] - csum[:, bidx, didx, lidx1]
+    lcnt = ccnt[:, bidx, didx, lidx2] - ccnt[:, bidx, didx, lidx1]
+    var_ave = np.ma.array(lsum/np.maximum(lcnt, 1), mask=(lcnt == 0) | ~valid)
+
+    if single:
+        var_ave = var_ave[0]
+    return var_ave
+
+
 # -----------------------------------------------
 #          Remap to Depth coordinates
 # -----------------------------------------------
 
-def remapToZ(fieldr,depthr,volumr, targetz, bowlz, v, bathy):
+def binToZ(fieldr, depthr, volumr, targetz, v='S'):
+    '''
+    Assign every isopycnal to its target z layer [targetz[k],targetz[k+1]) with a sorted search and compute
+    the volume-weighted mean of the field in each layer (sum of the field for volume, v='V')
+    - fieldr, depthr, volumr: [..., density, latitude] (any leading dimensions, e.g. time, basin)
+    Returns fieldz, volumez [..., depth, latitude], masked where the layer is empty or gets a masked value
+    (the last target level is always masked)
+    '''
+    targetz = np.asarray(targetz, dtype='float64')
+    fieldr = np.ma.asarray(fieldr)
+    lead = fieldr.shape[:-2]
+    rhoN, latN = fieldr.shape[-2:]
+    levN = len(targetz)
+    colN = int(np.prod(lead))
+    shape = (colN, rhoN, latN)
+
+    depth = np.reshape(np.ma.filled(np.ma.asarray(depthr, dtype='float64'), np.nan), shape)
+    kz = np.searchsorted(targetz, depth, side='right') - 1
+    ok = (kz >= 0) & (kz < levN-1) & ~np.isnan(depth)
+    if v != 'V':
+        volum = np.reshape(np.ma.filled(np.ma.asarray(volumr, dtype='float64'), 0.), shape)
+        ok &= volum != 0.
+    else:
+        volum = np.ones(shape)
+
+    # flat index of the [column, z, lat] cell of each isopycnal
+    idx = (np.arange(colN)[:, None, None]*levN + kz)*latN + np.arange(latN)[None, None, :]
+    idx = idx[ok]
+    cellN = colN*levN*latN
+    field = np.reshape(fieldr.filled(0.), shape)
+    fsum = np.bincount(idx, weights=(field*volum)[ok], minlength=cellN)
+    vsum = np.bincount(idx, weights=volum[ok], minlength=cellN)
+    bad = np.bincount(idx, weights=np.reshape(np.ma.getmaskarray(fieldr), shape)[ok], minlength=cellN)
+
+    if v != 'V':
+        empty = (vsum == 0.) | (bad > 0)
+        fieldz = fsum/np.where(empty, 1., vsum)
+    else:
+        empty = (fsum == 0.) | (bad > 0)
+        fieldz = fsum
+    shapez = lead + (levN, latN)
+    fieldz = np.ma.array(np.reshape(fieldz, shapez), mask=np.reshape(empty, shapez), dtype='float32')
+    volumez = np.ma.array(np.reshape(vsum, shapez), mask=np.reshape(empty, shapez), dtype='float32')
+
+    return fieldz, volumez
+
+
+def remapToZ(fieldr,depthr,volumr, targetz, bowlz, v, bathy, interp=True):
     '''
     The remaToZ() function remaps a density bined zonal field back to z
-    It starts from the surface and computes the mean field for each z level, using the zonal volume of isopycnals for weighting
+    It computes the mean field for each z level, using the zonal volume of isopycnals for weighting
 
     Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
 
@@ -622,14 +756,17 @@ def remapToZ(fieldr,depthr,volumr, targetz, bowlz, v, bathy):
 
     Inputs:
     ------
-    - fieldr     - field (T or S)       - 3D basin,density,latitude
-    - depthr     - depth of isopycnals  - 3D basin,density,latitude
-    - volumr     - volume of isopycnals - 3D basin,density,latitude
+    - fieldr     - field (T or S)       - 3D basin,density,latitude (or 4D time,basin,density,latitude)
+    - depthr     - depth of isopycnals  - 3D basin,density,latitude (or 4D)
+    - volumr     - volume of isopycnals - 3D basin,density,latitude (or 4D)
     - targetz    - target z grid        - 1D
-    - bowlz      - depth of bowl        - basin, latitude array
+    - bowlz      - depth of bowl        - basin, latitude array (or time,basin,latitude)
+    - v          - variable ('V' for volume: sum instead of volume-weighted mean)
+    - bathy      - depth of bottom      - basin, latitude array
+    - interp     - interpolate each depth column with a spline (default True)
 
     Output:
-    - fieldz    - 3D depth,latitude
+    - fieldz    - 3D basin,depth,latitude (or 4D time,basin,depth,latitude)
 
     Usage:
     ------
@@ -638,99 +775,46 @@ def remapToZ(fieldr,depthr,volumr, targetz, bowlz, v, bathy):
     -----
     - EG 18 Aug 2016   - Initial function write
     - March 2017 Yona Silvy : updating script and adding an interpolation on each depth column
+    - EG 18 Oct 2026   - Vectorized: isopycnals binned by sorted search and weighted bincount (binToZ),
+                         bowl and bottom masks by broadcasting, whole time series at once; depthr is no
+                         longer modified
    '''
-
-    latN = fieldr.shape[2]
-    rhoN = fieldr.shape[1]
-    basN = fieldr.shape[0]
-
+    targetz = np.asarray(targetz, dtype='float64')
     levN = len(targetz)
 
-    # init fieldx array
-    fieldz  = np.ma.masked_all([basN, levN, latN], dtype='float32')
-    volumez = np.ma.masked_all([basN, levN, latN], dtype='float32')
-
-    if v != 'V': # If not volume
-        for ibasin in range(1,4):
-            for j in range(latN):
-                # Initialize local variables for interpolation to save levels that are not missing data
-                iz_notempty = 0
-                z_notempty = np.array([])
-                fieldz_notempty = np.array([])
-                for k in range(levN-1):
-                    field_int = 0.
-                    volum_int = 0.
-                    for r in range(rhoN):
-                        if volumr[ibasin,r,j] != 0:
-                            if depthr[ibasin,r,j] >= targetz[k] and depthr[ibasin,r,j] < targetz[k+1]:
-                                field_int = field_int + fieldr[ibasin,r,j]*volumr[ibasin,r,j]
-                                volum_int = volum_int + volumr[ibasin,r,j]
-                                depthr[ibasin,r,j] = -100. # to speed up search for next depths
-                    if volum_int != 0.:
-                        fieldz[ibasin,k,j] = field_int / volum_int
-                        volumez[ibasin,k,j] = volum_int
-                        # Save which levels are not missing data for extrapolating
-                        z_notempty = np.append(z_notempty, targetz[k])
-                        fieldz_notempty = np.append(fieldz_notempty, fieldz[ibasin,k,j])
-                        iz_notempty = iz_notempty + 1
-                    # Search bowl index for masking data later
-                    if bowlz[ibasin,j] >= targetz[k] and bowlz[ibasin,j] < targetz[k+1] :
-                        kbowl = k+1
-                # print('lat index', j)
-                # print(iz_notempty-1, z_notempty.shape)
-                if np.ma.is_masked(bowlz[ibasin,j]) == False :
-                    # Interpolate the data on the depth column
-                    if iz_notempty > 3:
-                        # print 'Interpolate'
-                        spl = InterpolatedUnivariateSpline(z_notempty, fieldz_notempty)
-                        fieldz_new = spl(targetz)
-                        fieldz[ibasin,:,j] = fieldz_new
-                    # Mask field above the bowl
-                    fieldz[ibasin,0:kbowl,j] = np.ma.masked
-                # Mask bottom
-                if np.ma.is_mask(bathy[ibasin,j]) == False and bathy[ibasin,j] < targetz[-1]:
-                    bathy_mask = np.ma.nonzero(targetz>=bathy[ibasin,j])[0]
-                    # print(targetz[bathy_mask[0]:])
-                    fieldz[ibasin,bathy_mask[0]:,j] = np.ma.masked
-
-
-    else :
-        for ibasin in range(1,4):
-            for j in range(latN):
-                iz_notempty = 0
-                z_notempty = np.array([])
-                fieldz_notempty = np.array([])
-                for k in range(levN-1):
-                    field_int = 0.
-                    for r in range(rhoN):
-                        if depthr[ibasin,r,j] >= targetz[k] and depthr[ibasin,r,j] < targetz[k+1]:
-                            field_int = field_int + fieldr[ibasin,r,j]
-                            depthr[ibasin,r,j] = -100. # to speed up search for next depths
-                    if field_int != 0.:
-                        fieldz[ibasin,k,j] = field_int
-                        # Save which levels are not missing data for extrapolating
-                        z_notempty = np.append(z_notempty, targetz[k])
-                        fieldz_notempty = np.append(fieldz_notempty,fieldz[ibasin,k,j])
-                        iz_notempty = iz_notempty + 1
-                    # Search bowl index for masking data later
-                    if bowlz[ibasin,j] >= targetz[k] and bowlz[ibasin,j] < targetz[k+1] :
-                        kbowl = k
-                print('lat index', j)
-                print(iz_notempty-1, z_notempty.shape)
-                if np.ma.is_masked(bowlz[ibasin,j]) == False :
-                    # Interpolate the data on the depth column
-                    if iz_notempty > 3:
-                        # print 'Interpolate'
-                        spl = InterpolatedUnivariateSpline(z_notempty, fieldz_notempty)
-                        fieldz_new = spl(targetz)
-                        fieldz[ibasin,:,j] = fieldz_new
-                    # Mask field below the bowl
-                    fieldz[ibasin,0:kbowl,j] = np.ma.masked
-                # Mask bottom
-                if np.ma.is_mask(bathy[ibasin,j]) == False and bathy[ibasin,j] < targetz[-1]:
-                    bathy_mask = np.ma.nonzero(targetz>=bathy[ibasin,j])[0]
-                    print(targetz[bathy_mask[0]:])
-                    fieldz[ibasin,bathy_mask[0]:,j] = np.ma.masked
+    fieldz = binToZ(fieldr, depthr, volumr, targetz, v)[0]
+    bowlz = np.ma.asarray(bowlz)
+    bowlm = np.ma.getmaskarray(bowlz)
+    if bowlm.shape != fieldz.shape[:-2] + fieldz.shape[-1:]:
+        bowlm = np.broadcast_to(bowlm, fieldz.shape[:-2] + fieldz.shape[-1:])
+    # Only basins 1 to 3
+    fieldz[..., 0, :, :] = np.ma.masked
+
+    if interp:
+        # Interpolate the data on the depth columns where the bowl is defined and more than 3 levels have data
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        count = np.ma.count(fieldz, axis=-2)
+        count[..., 0, :] = 0
+        for col in np.argwhere(~bowlm & (count > 3)):
+            col = tuple(col)
+            column = fieldz[col[:-1] + (slice(None), col[-1])]
+            good = ~np.ma.getmaskarray(column)
+            spl = InterpolatedUnivariateSpline(targetz[good], column.data[good])
+            fieldz[col[:-1] + (slice(None), col[-1])] = spl(targetz)
+
+    # Mask field above the bowl (below the bowl index for volume)
+    kbowl = np.searchsorted(targetz, np.ma.filled(bowlz, 0.), side='right')
+    if v == 'V':
+        kbowl = np.maximum(kbowl - 1, 0)
+    lev = np.arange(levN)[:, None]
+    above = (lev < kbowl[..., None, :]) & ~bowlm[..., None, :]
+
+    # Mask bottom
+    bathy = np.ma.asarray(bathy)
+    bathyd = np.ma.filled(bathy, np.inf)
+    deep = (targetz[:, None] >= bathyd[..., None, :]) & (bathyd < targetz[-1])[..., None, :]
+
+    fieldz[above | deep] = np.ma.masked
 
     return fieldz
 
@@ -742,6 +826,8 @@ def remapToZ(fieldr,depthr,volumr, targetz, bowlz, v, bathy):
 
 def zon_2Dz(plt, ax0, ax1, ticks, lat, lev, varBasin, clevsm, cmap, levels, domzed):
 
+    from matplotlib.ticker import AutoMinorLocator
+
     # -- variables
     var = varBasin['var_change']
     bowl1 = varBasin['bowl1']
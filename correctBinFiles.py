@@ -1,151 +1,65 @@
 import gc
-import cdms2 as cdm
-import MV2 as mv
+from libDensityCore import seamCorrect,ptopCorrect
+from libDensityIO import NetcdfReader,NetcdfWriter
 import numpy as npy
 
-def correctFile(idxcorr, ncorr, inFile, inDir, outFile, outDir):
+def correctFile(idxcorr, ncorr, inFile, inDir, outFile, outDir, memMax=2., comp=1):
     '''
     Correct density binned files (undefined ptop & long 0 issue)
     idxcorr = [idx_i,idx_i1,jmax] indices for longitude correction - if [0,0,0] ignore
-    ncorr   = number of corrections: 1 or 2
+    ncorr   = number of corrections: 1 or 2 (idxcorr is then a list of 2 [idx_i,idx_i1,jmax])
+    memMax  = memory of a block of years (GB): the file is read, corrected and written by blocks of years
+    comp    = netCDF compression (0 for no compression)
+    Variables are written with the dimensions of the input file (no ncpdq needed)
+    The same corrections can be done in densityBin (corrLong option)
     '''
-    # CDMS initialisation - netCDF compression
-    comp = 1 # 0 for no compression
-    cdm.setNetcdfShuffleFlag(comp)
-    cdm.setNetcdfDeflateFlag(comp)
-    cdm.setNetcdfDeflateLevelFlag(comp)
-    cdm.setAutoBounds('on')
-    # Numpy initialisation
-    npy.set_printoptions(precision=2)
-
     varList3D = ['isondepthg','isonthickg', 'sog','thetaog']
     varList2D = ['ptopsoxy','ptopdepthxy','ptopsigmaxy','ptopthetaoxy','persistmxy']
-
-    # First test, read level by level and write level by level (memory management)
-    # use ncpdq -a time,lev,lat,lon to recover the dimension order
-
-    fi = cdm.open(inDir+'/'+inFile)
-    fo = cdm.open(outDir+'/'+outFile,'w')
-    isondg  = fi['isondepthg'] ; # Create variable handle
-    # Get grid objects
-    #axesList = isondg.getAxisList()
-    #sigmaGrd = isondg.getLevel()
-    lonN = isondg.shape[3]
-    latN = isondg.shape[2]
-    levN = isondg.shape[1]
-    timN = isondg.shape[0]
-    #valmask = isondg.missing_value
-
-    if ncorr == 2:
-        ic1 = idxcorr[0][0]
-        ic2 = idxcorr[0][1]
-        jcmax = idxcorr[0][2]
-        ic12 = idxcorr[1][0]
-        ic22 = idxcorr[1][1]
-        jcmax2 = idxcorr[1][2]
-        if ic2 >= lonN-1:
-            ic2 = 0
-        if ic22 >= lonN-1:
-            ic22 = 0
-    elif ncorr == 1:
-        ic1 = idxcorr[0]
-        ic2 = idxcorr[1]
-        jcmax = idxcorr[2]
-        if ic2 >= lonN-1:
-            ic2 = 0
-    #print ic1,ic2,jcmax
-    corr_long = True
-    if ic1 == 0 and ic2 == 0 and jcmax == 0:
-        corr_long = False
-    #testp = 10
-    for it in range(timN):
-        #if it/testp*testp == it:
-        #    print ' year =',it
-        # test
-        #i = 90
-        #j = 90
-        #i2d = 6
-        #j2d = 12
-        #ij = j*lonN+i
-        #ij2d = j2d*lonN+i2d
-        #print 'ij=',ij
-        # 3D variables
+    valmask = 1.e20
+    if ncorr == 1:
+        idxcorr = [idxcorr]
+
+    readers = dict([(iv, NetcdfReader(inDir+'/'+inFile, iv, valmask=valmask, fixUnits=False)) for iv in varList3D+varList2D])
+    timN, levN, latN, lonN = readers['isondepthg'].shape
+    timeValues, timeAtts = readers['isondepthg'].time(0, timN)
+    # Output with the axes and attributes of the input file
+    fi = readers['isondepthg'].dataset()
+    fo = NetcdfWriter(outDir+'/'+outFile, comp=comp, valmask=valmask,
+                      attributes=dict([(att, fi.getncattr(att)) for att in fi.ncattrs()]))
+    fo.createAxis('time', timeValues, timeAtts, unlimited=True)
+    dims = fi.variables['isondepthg'].dimensions
+    for dim in dims[1:]:
+        axis = fi.variables[dim]
+        atts = dict([(att, axis.getncattr(att)) for att in axis.ncattrs()])
+        bounds = None
+        if 'bounds' in atts and atts['bounds'] in fi.variables:
+            bounds = fi.variables[atts['bounds']][:]
+        fo.createAxis(dim, axis[:], atts, bounds=bounds)
+    sigma = npy.array(fi.variables[dims[1]][:])
+    for iv in varList3D+varList2D:
+        chunks = [1]*(len(readers[iv].shape)-2) + [latN, lonN]
+        fo.createVariable(iv, fi.variables[iv].dimensions, readers[iv].attributes, chunks=chunks)
+
+    # Blocks of years (3D variables and their bowl values in memory)
+    tchunk = int(max(min(memMax*1.e9/(len(varList3D)*levN*latN*lonN*8.), timN), 1))
+    for t0 in range(0, timN, tchunk):
+        t1 = min(t0+tchunk, timN)
+        var3D = dict([(iv, readers[iv].read(t0, t1)) for iv in varList3D])
+        # Correct for longitude interpolation issue
+        seamCorrect(var3D.values(), idxcorr)
         for iv in varList3D:
-            #print iv
-            outVar = fi(iv,time = slice(it,it+1))
-            # Correct for longitude interpolation issue
-            if corr_long:
-                for jt in range(jcmax):
-                    outVar[:,:,jt,ic1] = (outVar[:,:,jt,ic1-1]+outVar[:,:,jt,ic2+1])/2
-                    outVar[:,:,jt,ic2] = outVar[:,:,jt,ic1]
-                if ncorr == 2:
-                    for jt in range(jcmax2):
-                        outVar[:,:,jt,ic12] = (outVar[:,:,jt,ic12-1]+outVar[:,:,jt,ic22+1])/2
-                        outVar[:,:,jt,ic22] = outVar[:,:,jt,ic12]
-            # Correct Bowl properties
-            if iv =='isondepthg':
-                vardepth = npy.reshape(outVar,(levN,latN*lonN))
-                #print 'test'
-                #print outVar[:,:,j2d,i2d]
-                #print vardepth[:,ij2d]
-                # find values of surface points
-                vardepthBowl = npy.min(npy.reshape(outVar,(levN,latN*lonN)),axis=0)
-                vardepthBowlTile = npy.repeat(vardepthBowl,levN,axis=0).reshape((latN*lonN,levN)).transpose()
-                #print vardepthBowlTile.shape
-                #print vardepthBowl[ij2d], vardepthBowlTile[:,ij2d]
-                levs = outVar.getAxisList()[1][:]
-                #print 'levs',levs
-                levs3d  = mv.reshape(npy.tile(levs,latN*lonN),(latN*lonN,levN)).transpose()
-                varsigmaBowl = npy.max(npy.where(vardepth == vardepthBowlTile,levs3d,0),axis=0)
-                #print varsigmaBowl[ij2d],levs3d[:,ij2d]
-
-            elif iv == 'sog':
-                varsog = npy.reshape(outVar,(levN,latN*lonN))
-                varsoBowl = npy.max(npy.where(vardepth == vardepthBowlTile,varsog,0),axis=0)
-                #print varsoBowl[ij2d], varsog[:,ij2d]
-                #print vardepth[:,ij2d],vardepthBowlTile[:,ij2d]
-                del (varsog); gc.collect()
-            elif iv =='thetaog':
-                varthetao = npy.reshape(outVar,(levN,latN*lonN))
-                varthetaoBowl = npy.max(npy.where(vardepth == vardepthBowlTile,varthetao,-1000),axis=0)
-                #print varthetaoBowl[ij2d],varthetao[:,ij2d]
-                del (varthetao); gc.collect()
-            # Write
-            fo.write(outVar.astype('float32'), extend = 1, index = it)
-            fo.sync()
-        del (vardepth); gc.collect()
-        # 2D variables and correct isondepthg = 0
+            fo.write(iv, var3D[iv], [t0])
+        # 2D variables: longitude and undefined bowl (ptopsoxy < 30) corrections
+        var2D = dict([(iv, readers[iv].read(t0, t1)) for iv in varList2D])
+        seamCorrect(var2D.values(), idxcorr)
+        ptopCorrect(var3D['isondepthg'], var3D['sog'], var3D['thetaog'], sigma, var2D)
         for iv in varList2D:
-            outVar = fi(iv,time = slice(it,it+1))
-            # Correct for longitude interpolation issue
-            if corr_long:
-                for jt in range(jcmax):
-                    outVar[:,jt,ic1] = (outVar[:,jt,ic1-1]+outVar[:,jt,ic2+1])/2
-                    outVar[:,jt,ic2] = outVar[:,jt,ic1]
-                if ncorr == 2:
-                    for jt in range(jcmax2):
-                        outVar[:,jt,ic12] = (outVar[:,jt,ic12-1]+outVar[:,jt,ic22+1])/2
-                        outVar[:,jt,ic22] = outVar[:,jt,ic12]
-            # Correct for ptopsoxy < 30
-            #print 'before',outVar[:,j2d,i2d]
-            if iv == 'ptopsoxy':
-                testso = npy.reshape(outVar,(latN*lonN)) < 30.
-                #print 'testdepth', testdepth[ij2d]
-                #print npy.argwhere(testdepth)[0:10]/lonN, npy.argwhere(testdepth)[0:10]-npy.argwhere(testdepth)[0:10]/lonN*lonN
-                outVar.data[...] = npy.where(testso,varsoBowl,npy.reshape(outVar,(latN*lonN))).reshape(outVar.shape)[...]
-            elif iv == 'ptopdepthxy':
-                outVar.data[...] = npy.where(testso,vardepthBowl,npy.reshape(outVar,(latN*lonN))).reshape(outVar.shape)[...]
-            elif iv == 'ptopthetaoxy':
-                outVar.data[...] = npy.where(testso,varthetaoBowl,npy.reshape(outVar,(latN*lonN))).reshape(outVar.shape)[...]
-            elif iv == 'ptopsigmaxy':
-                outVar.data[...] = npy.where(testso,varsigmaBowl,npy.reshape(outVar,(latN*lonN))).reshape(outVar.shape)[...]
-            #print 'after',outVar[:,j2d,i2d]
-
-            # Write
-            fo.write(outVar.astype('float32'), extend = 1, index = it)
-            fo.sync()
+            fo.write(iv, var2D[iv], [t0])
+        fo.sync()
+        del(var3D, var2D) ; gc.collect()
 
-    fi.close()
+    for iv in readers.keys():
+        readers[iv].close()
     fo.close()
 
 # testing
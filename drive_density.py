@@ -15,13 +15,16 @@ PJD 13 Mar 2015     - Added experiment to outFile path - deal with concurrent ru
 PJD 26 Mar 2015     - Added overWrite argument
 PJD 27 Jan 2016     - Added piControl to experiment list
 PJD 11 Apr 2016     - Added 1pctCO2 to experiment list
+EG  18 Oct 2026     - Members of a model processed with densityBinBatch (shared grid setup, nproc processes)
+EG  18 Oct 2026     - nproc from the command line (--nproc) or sized to cores and memory (--memPerProc)
                     - TODO:
 
 @author: durack1
 """
 
 import argparse,datetime,gc,glob,os,sys ; #re
-from binDensity import densityBin
+import multiprocessing as mp
+from binDensity import densityBinBatch
 from durolib import trimModelList,writeToLog #fixVarUnits,
 from string import replace
 from socket import gethostname
@@ -34,6 +37,8 @@ parser.add_argument('experiment',metavar='str',type=str,help='include \'experime
 parser.add_argument('outPath',metavar='str',type=str,nargs='?',help='include \'outPath\' as a command line argument')
 parser.add_argument('r1Prioritize',metavar='bool',type=bool,nargs='?',default=False,help='include \'r1Prioritize\' as a command line argument - True processes r1i1p1 sims first')
 parser.add_argument('overWrite',metavar='bool',type=bool,nargs='?',default=False,help='include \'overWrite\' as a command line argument - True overwrites existing files')
+parser.add_argument('-n','--nproc',type=int,default=0,help='number of members processed in parallel (default: from cores and memory)')
+parser.add_argument('-m','--memPerProc',type=float,default=8.,help='memory used by one densityBin process in GB (default: 8)')
 args = parser.parse_args()
 # Test arguments
 if (args.modelSuite in ['cmip3','cmip5']):
@@ -60,6 +65,20 @@ if args.overWrite:
     overWrite = True
 else:
     overWrite = False
+# Target grid
+targetGrid  = os.path.join(os.path.dirname(os.path.abspath(__file__)),'dataAndMasks','170224_WOD13_masks.nc')
+# Number of members processed in parallel: available cores, limited by available memory
+if args.nproc > 0:
+    nproc = args.nproc
+else:
+    nproc = mp.cpu_count()
+    try:
+        memAvail = [int(line.split()[1]) for line in open('/proc/meminfo') if line.startswith('MemAvailable')][0]/1.e6 ; # GB
+        nproc = min(nproc,int(memAvail/args.memPerProc))
+    except Exception,err:
+        print 'Available memory unknown, using all cores: ',err
+    nproc = max(nproc,1)
+print ''.join(['** ',str(nproc),' processes **'])
 
 #%%
 ## TEST ##
@@ -80,6 +99,7 @@ elif os.getlogin() == 'eguil':
 logfile = os.path.join(logPath,"".join([timeFormat,'_drive_density-',modelSuite,'-',experiment,'-',gethostname().split('.')[0],'.log'])) ; # WORK MODE
 writeToLog(logfile,"".join(['TIME: ',timeFormat]))
 writeToLog(logfile,"".join(['HOSTNAME: ',gethostname()]))
+writeToLog(logfile,''.join(['PROCESSES: ',str(nproc)]))
 print "".join(['** Processing files from ',modelSuite,' for ',experiment,' **'])
 writeToLog(logfile,"".join(['** Processing files from ',modelSuite,' for ',experiment,' **']))
 
@@ -240,6 +260,8 @@ for count,x in enumerate(list_soAndthetaoAndfx):
         list_sht.append(x)
 for x,model in enumerate(list_sht):
 '''
+# Group members by model (and areacello file) so grid setup is shared in densityBinBatch
+modelJobs = {} ; modelOrder = []
 for x,model in enumerate(list_soAndthetaoAndfx):
     # Check for MIROC4h and exclude
     if 'MIROC4h' in model:
@@ -248,7 +270,6 @@ for x,model in enumerate(list_soAndthetaoAndfx):
     # Get steric outfile name
     experiment      = model[4].split('.')[2] ; # Add experiment for multiple concurrent runs
     outfileDensity  = os.path.join(outPath,experiment,model[4])
-    writeToLog(logfile,''.join(['Processing:   ',outfileDensity.split('/')[-1]]))
     print 'FileCount: ',x
     print 'outPath:   ','/'.join(outfileDensity.split('/')[0:-1])
     print 'outfile:   ',outfileDensity.split('/')[-1]
@@ -260,8 +281,21 @@ for x,model in enumerate(list_soAndthetaoAndfx):
     #densityBin(model[3],model[1],model[5],outfileDensity,debug=True,timeint='1,24')
     if overWrite and os.path.exists(replace(outfileDensity,'.mo.','.an.')):
         print 'skipping existing file..'
-        continue ; # Skip existing file        
-    densityBin(model[3],model[1],model[5],outfileDensity,debug=True,timeint='all')
+        continue ; # Skip existing file
+    key = (model[3].split('/')[-1].split('.')[1],model[5])
+    if key not in modelJobs:
+        modelJobs[key] = [] ; modelOrder.append(key)
+    modelJobs[key].append([model[3],model[1],outfileDensity])
+
+# Process members of each model in a batch (grid, masks and regridder set up once)
+for key in modelOrder:
+    jobs = modelJobs[key]
+    for job in jobs:
+        writeToLog(logfile,''.join(['Processing:   ',job[2].split('/')[-1]]))
+    results = densityBinBatch([job[0:2] for job in jobs],key[1],targetGrid,[job[2] for job in jobs],nproc=nproc,debug=True,timeint='all')
+    for outfile,elapsed,err in results:
+        if err is not None:
+            writeToLog(logfile,''.join(['** Failed:   ',outfile.split('/')[-1],' ',err]))
 
 #%%
 '''
@@ -0,0 +1,39 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Test density binning with latitude bands (nband=2) on a model with missing_value = 1.e20:
+# results must be identical to the single process run (nband=1)
+#
+# Oct 2026 EG
+#
+# ----------------------------------------
+#
+import glob,os
+import cdms2 as cdm
+import numpy as npy
+from binDensity import densityBin
+indir ='/prodigfs/project/CMIP5/main/CNRM-CERFACS/CNRM-CM5-2/piControl/mon/ocean/Omon/r1i1p1/latest'
+fileFx  ='/prodigfs/project/CMIP5/main/CNRM-CERFACS/CNRM-CM5-2/piControl/fx/ocean/fx/r0i0p0/latest/areacello/areacello_fx_CNRM-CM5-2_piControl_r0i0p0.nc'
+fileT = sorted(glob.glob(indir+'/thetao/thetao_Omon_CNRM-CM5-2_piControl_r1i1p1_*.nc'))[0]
+fileS = sorted(glob.glob(indir+'/so/so_Omon_CNRM-CM5-2_piControl_r1i1p1_*.nc'))[0]
+targetGrid = os.path.join(os.path.dirname(os.path.abspath(__file__)),'dataAndMasks','170224_WOD13_masks.nc')
+outFile = 'density_band_test'
+
+fs = cdm.open(fileS)
+print ' so missing_value:',fs['so'].missing_value
+fs.close()
+
+for nband in [1,2]:
+    densityBin(fileT,fileS,fileFx,targetGrid,outFile=outFile+'_nband%d.nc' % nband,debug=True,timeint='1,24',nband=nband)
+
+f1 = cdm.open(outFile+'_nband1.nc')
+f2 = cdm.open(outFile+'_nband2.nc')
+for var in ['isondepthg','isonthickg','thetaog','sog','isondepth','isonso','ptopdepthxy']:
+    v1 = f1(var) ; v2 = f2(var)
+    diff = npy.ma.max(npy.ma.abs(v1-v2))
+    same = (npy.ma.getmaskarray(v1) == npy.ma.getmaskarray(v2)).all()
+    print ' ',var,'max diff nband 1/2:',diff,' same mask:',same
+    assert same and diff < 1.e-4
+f1.close()
+f2.close()
+print ' nband test passed'
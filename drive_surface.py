@@ -10,6 +10,8 @@ This script generates input lists of cmip5 ocean fields and drives surface_trans
 PJD 28 Oct 2014     - Started file
 PJD 22 Nov 2014     - Updated to grab all files
 PJD  9 Dec 2014     - Updated to include tauu and tauv
+EG  18 Oct 2026     - Members of a model processed with surfTransfBatch (shared grid setup) on a pool sized
+                      to cores and memory, completed outputs skipped, timing summary per run
                     TODO:
                     - Need to consider cases where version numbers of input variables don't align
                     - Need to consider adding additional files using so/thetao fields rather than 2D sos/tos
@@ -17,8 +19,9 @@ PJD  9 Dec 2014     - Updated to include tauu and tauv
 @author: durack1
 """
 
-import argparse,datetime,gc,glob,os,sys ; #re
-from surface_transf import surfTransf
+import argparse,datetime,gc,glob,os,sys,timeit ; #re
+import multiprocessing as mp
+from surface_transf import surfTransfBatch
 from durolib import trimModelList,writeToLog #fixVarUnits,
 from string import replace
 from socket import gethostname
@@ -34,6 +37,9 @@ parser = argparse.ArgumentParser()
 parser.add_argument('modelSuite',metavar='str',type=str,help='including \'cmip3/5\' as a command line argument will select one model suite to process')
 parser.add_argument('experiment',metavar='str',type=str,help='include \'experiment\' as a command line argument')
 parser.add_argument('outPath',metavar='str',type=str,help='include \'outPath\' as a command line argument')
+parser.add_argument('-n','--nproc',type=int,default=0,help='number of members processed in parallel (default: from cores and memory)')
+parser.add_argument('-m','--memPerProc',type=float,default=4.,help='memory used by one surfTransf process in GB (default: 4)')
+parser.add_argument('-o','--overWrite',action='store_true',help='overwrite existing output files')
 args = parser.parse_args()
 # Test arguments
 if (args.modelSuite in ['cmip3','cmip5']):
@@ -49,6 +55,7 @@ if not (os.path.exists(args.outPath)):
 else:
     outPath     = args.outPath
     print "** *.nc files will be written to",args.outPath,"**"
+overWrite = args.overWrite
    
 #%%
 '''
@@ -86,11 +93,9 @@ fxPath      = os.path.join('/work',modelSuite,'fx/fx/areacello');
 
 # Validate paths
 if not os.path.exists(outPath):
-    pass
-    #os.makedirs(outPath)
+    os.makedirs(outPath)
 if not os.path.exists(soPath) or not os.path.exists(thetaoPath) or not os.path.exists(hfdsPath) \
-   or not os.path.exists(wfoPath) or not os.path.exists(fxPath) or not os.path.exists(tauuPath) \
-   or not os.path.exists(tauvPath):
+   or not os.path.exists(wfoPath) or not os.path.exists(fxPath):
     print "** Invalid source data path - no *.nc files will be written **"
     sys.exit()
 
@@ -221,43 +226,84 @@ for x,model in enumerate(list_hfds):
 del(x,model,modelNoVer,index,modelTest) ; gc.collect()
 
 #%%
-# Remove blank entries
+# Remove blank entries (tauu and tauv are not used by surfTransf and not required)
 tmp = []
 for x in list_inFiles:
-    if None not in x and x not in tmp:
+    if None not in x[0:4]+x[6:8] and x not in tmp:
         tmp.append(x)
 list_inFiles = tmp
 del(tmp,x) ; gc.collect()
 
 #%%
-# Process model list
-# Use for debugging
+# Number of members processed in parallel: available cores, limited by available memory
+if args.nproc > 0:
+    nproc = args.nproc
+else:
+    nproc = mp.cpu_count()
+    try:
+        memAvail = [int(line.split()[1]) for line in open('/proc/meminfo') if line.startswith('MemAvailable')][0]/1.e6 ; # GB
+        nproc = min(nproc,int(memAvail/args.memPerProc))
+    except Exception,err:
+        print 'Available memory unknown, using all cores: ',err
+    nproc = max(nproc,1)
+print ''.join(['** ',str(nproc),' processes **'])
+writeToLog(logfile,''.join(['PROCESSES: ',str(nproc)]))
 
-modelInd = [0] ; # Test suite to capture all errors
-# rerun CSIRO-Mk3 count > 18
-'''
-list_sht = []
-for count,x in enumerate(list_inFiles):
-    if count >= 18:
-        if count <= 27:
-            list_sht.append(x)
-for x,model in enumerate(list_sht):
-'''
+#%%
+# Group members by model (and areacello file) so grid setup is shared in surfTransfBatch
+varNames = ['tos','sos','hfds','wfo']
+modelJobs = {} ; modelOrder = [] ; skipped = []
 for x,model in enumerate(list_inFiles):
-    # Get steric outfile name
     outfileTransf = os.path.join(outPath,model[7])
-    writeToLog(logfile,''.join(['Processing:   ',outfileTransf.split('/')[-1]]))
-    print 'FileCount: ',x    
-    print 'outPath:   ','/'.join(outfileTransf.split('/')[0:-1])
+    print 'FileCount: ',x
     print 'outfile:   ',outfileTransf.split('/')[-1]
     print 'hfds:      ',model[0].split('/')[-1]
     print 'wfo:       ',model[1].split('/')[-1]
     print 'sos:       ',model[2].split('/')[-1]
     print 'tos:       ',model[3].split('/')[-1]
-    print 'tauu:      ',model[4].split('/')[-1]
-    print 'tauv:      ',model[5].split('/')[-1]
     print 'areacello: ',model[6].split('/')[-1]
-    # Call surfTransf
-    #surfTransf(fileFx,fileTos,fileSos,fileHef,fileWfo,outFile,debug=True,timeint='all')
-    #surfTransf(model[4],model[3],model[2],model[0],model[1],outfileTransf,debug=True,timeint='1,24')
-    #surfTransf(model[4],model[3],model[2],model[0],model[1],outfileTransf,debug=True,timeint='all')
+    # Completed outputs only exist once surfTransf has finished (written under a temporary name)
+    if not overWrite and os.path.exists(outfileTransf):
+        print 'skipping existing file..'
+        skipped.append(outfileTransf)
+        continue
+    key = (model[3].split('/')[-1].split('.')[1],model[6])
+    if key not in modelJobs:
+        modelJobs[key] = [] ; modelOrder.append(key)
+    # surfTransf(fileFx,fileTos,fileSos,fileHef,fileWfo,...)
+    modelJobs[key].append([[model[6],model[3],model[2],model[0],model[1]],outfileTransf])
+
+#%%
+# Process members of each model in a batch (grid, masks and regridder set up once)
+te0 = timeit.default_timer()
+results = []
+for key in modelOrder:
+    jobs = modelJobs[key]
+    for job in jobs:
+        writeToLog(logfile,''.join(['Processing:   ',job[1].split('/')[-1]]))
+    tm0 = timeit.default_timer()
+    res = surfTransfBatch([job[0] for job in jobs],varNames,[job[1] for job in jobs],nproc=nproc,debug=False,timeint='all')
+    if res is None:
+        continue
+    for outfile,elapsed,err in res:
+        if err is not None:
+            writeToLog(logfile,''.join(['** Failed:   ',outfile.split('/')[-1],' ',err]))
+    writeToLog(logfile,''.join(['Model ',key[0],': ',str(len(jobs)),' members in ',format(timeit.default_timer()-tm0,'.1f'),' s']))
+    results.extend(res)
+
+#%%
+# Timing summary
+wall    = timeit.default_timer() - te0
+done    = [r for r in results if r[2] is None]
+failed  = [r for r in results if r[2] is not None]
+cumul   = sum([r[1] for r in results])
+summary = ['** Summary: ',str(len(done)),' done, ',str(len(failed)),' failed, ',str(len(skipped)),' skipped **',
+           '\n   wall time: ',format(wall,'.1f'),' s, cumulated member time: ',format(cumul,'.1f'),' s']
+if wall > 0:
+    summary += [' (speedup ',format(cumul/wall,'.1f'),')']
+for outfile,elapsed,err in results:
+    summary += ['\n   ',format(elapsed,'8.1f'),' s  ',outfile.split('/')[-1]]
+    if err is not None:
+        summary += ['  FAILED: ',err]
+print ''.join(summary)
+writeToLog(logfile,''.join(summary))
@@ -0,0 +1,1166 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+'''
+ libDensityCore.py contains the numpy only computation kernels of the density binning and
+ surface transformation codes (EOS, density grid, area metrics, binning kernels, corrections, remap to depth, ToE)
+
+ No cdms2, ESMF or durolib import: the kernels can be used by analysis scripts and worker
+ processes without loading the CDAT stack. binDensity.py, surface_transf.py, libToE.py and
+ libDensityPostpro.py import (and re-export) them from here.
+
+EG  18 Oct 2026     - Started file: maskVal, computeAreaScale, eosNeutral, rhonGrid, binColumns (binDensity.py),
+                      transfBin, surfDensFlux, surfDomainMasks (surface_transf.py), findToE (libToE.py)
+EG  18 Oct 2026     - Added bowlMask: mask above the bowl for all columns at once
+EG  18 Oct 2026     - Added ensStatsInit/ensStatsAdd/ensStatsGet: running (one member at a time) ensemble statistics
+EG  18 Oct 2026     - Added ensStatsMerge: merge (or removal) of running statistics of sets of members
+EG  18 Oct 2026     - Added findToEMulti: ToE for several thresholds in one pass, findToE uses it
+EG  18 Oct 2026     - Added remapColumns: remap of binned columns to depth levels (remapRhoToZ.py)
+EG  18 Oct 2026     - Added seamCorrect/ptopCorrect: vectorized corrections of correctBinFiles.py
+EG  18 Oct 2026     - findToEMulti/findToE moved to libToECore.py (shared with the python 3 analysis programs)
+'''
+
+import numpy as npy
+import time as timc
+
+# Turn off numpy warnings
+npy.seterr(all='ignore') ; # as in binDensity, masked/invalid points are handled with valmask
+
+def maskVal(field,valmask):
+    '''
+    The maskVal() function applies a mask to an array provided
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+    Co-author: Paul J. Durack : pauldurack@llnl.gov : @durack1.
+
+    Created on Sun Sep 14 21:13:30 2014
+
+    Inputs:
+    ------
+    - field     - 1D/2D/3D array
+    - vamask    - 1D scalar of mask value
+
+    Output:
+    - field     - 1D/2D/3D masked array
+
+    Usage:
+    ------
+    >>> from libDensityCore import maskVal
+    >>> maskedVariable = maskVal(unMaskedVariable,valmask)
+
+    Notes:
+    -----
+    - PJD 15 Sep 2014 -
+    - EG  18 Oct 2026 - moved to libDensityCore, MV2 only used (imported) for cdms2 variables
+    '''
+    if hasattr(field, 'getAxisList'):
+        import MV2 as ma ; # cdms2 variables keep their axes
+    else:
+        ma = npy.ma
+    field [npy.isnan(field.data)] = valmask
+    field._FillValue = valmask
+    if valmask > 0:
+        field = ma.masked_where(field > valmask/10, field)
+    else:
+        field = ma.masked_where(field < valmask / 10, field)
+    return field
+
+# Compute area of grid cells on earth
+def computeAreaScale(lon,lat):
+    '''
+    The computeAreaScale() function calculates grid cell area and scale factors assuming values are
+    cell mid-points, formulaes
+     area = R^2(lon2-lon1)*(sin(lat2) - sin(lat1))
+     distance = R arccos[ sin(lat1)*sin(lat2) + cos(lat1)*cos(lat2)*cos(lon2-lon1) ]
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+    Co-author: Paul J. Durack : pauldurack@llnl.gov : @durack1.
+
+    Created on Sun Sep 14 21:13:30 2014
+
+    Inputs:
+    ------
+    - lon   - 1D longitude  - >0, <360
+    - lat   - 1D latitude   - >-90, <90
+
+    Output:
+    - area(lon,lat)     - 2D area array     - m^-^2
+
+    Usage:
+    ------
+    >>> from libDensityCore import computeAreaScale
+    >>> computeArea(lon,lat)
+
+    Notes:
+    -----
+    - PJD 15 Sep 2014 -
+    - EG  15 May 2018 - added scale factors calculation
+
+    '''
+    radius = 6371000. ; # Earth radius (metres)
+    radconv = npy.pi/180.
+    lonN = int(lon.shape[0])
+    latN = int(lat.shape[0])
+    area   = npy.ma.ones([latN, lonN], dtype='float32')*0.
+    scalex = npy.ma.ones([latN, lonN], dtype='float32')*0.
+    scaley = npy.ma.ones([latN, lonN], dtype='float32')*0.
+    lonr = lon[:] * radconv
+    latr = lat[:] * radconv
+    #loop
+    for i in range(1,lonN-1):
+        lonm1 = (lonr[i-1] + lonr[i]  )*0.5
+        lonp1 = (lonr[i]   + lonr[i+1])*0.5
+        for j in range(1,latN-1):
+            latm1 = (latr[j-1] + latr[j]  )*0.5
+            latp1 = (latr[j]   + latr[j+1])*0.5
+            area[j,i] = npy.float(radius**2 * (lonp1 - lonm1) * (npy.sin(latp1) - npy.sin(latm1)))
+            scalex[j,i] = npy.float(radius * npy.arccos (npy.sin(latm1)**2 + npy.cos(latm1)**2*npy.cos(lonp1-lonm1)))
+            scaley[j,i] = npy.float(radius * npy.arccos (npy.sin(latm1)*npy.sin(latp1)+ npy.cos(latm1)*npy.cos(latp1) ))
+        # North and south bounds
+        latm1 = ((-90.*radconv) + latr[0] )*0.5
+        latp1 = (latr[0]        + latr[1] )*0.5
+        area[0,i] = npy.float(radius**2 * (lonp1 - lonm1) * (npy.sin(latp1) - npy.sin(latm1)))
+        scalex[0,i] = npy.float(radius * npy.arccos (npy.sin(latm1)**2 + npy.cos(latm1)**2*npy.cos(lonp1-lonm1)))
+        scaley[0,i] = npy.float(radius * npy.arccos (npy.sin(latm1)*npy.sin(latp1)+ npy.cos(latm1)*npy.cos(latp1)))
+        latm1 = (latr[latN-2] + latr[latN-1])*0.5
+        latp1 = (latr[latN-1] + (90.*radconv)  )*0.5
+        area[latN-1,i] = npy.float(radius**2 * (lonp1 - lonm1) * (npy.sin(latp1) - npy.sin(latm1)))
+        scalex[latN-1,i] = npy.float(radius * npy.arccos (npy.sin(latm1)**2 + npy.cos(latm1)**2*npy.cos(lonp1-lonm1)))
+        scaley[latN-1,i] = npy.float(radius * npy.arccos (npy.sin(latm1)*npy.sin(latp1)+ npy.cos(latm1)*npy.cos(latp1)))
+    # East and west bounds
+    area[:,0]        = area[:,1]
+    area[:,lonN-1]   = area[:,lonN-2]
+    scalex[:,0]      = scalex[:,1]
+    scaley[:,0]      = scaley[:,1]
+    scalex[:,lonN-1] = scalex[:,lonN-2]
+    scaley[:,lonN-1] = scaley[:,lonN-2]
+
+    return area, scalex, scaley
+
+def eosNeutral(pottemp,salt):
+    '''
+    The eosNeutral() function takes potential temperature and salinity arguments
+    and calculates approximate neutral density (gamma_a) which is returned as a
+    variable. The function uses the McDougall & Jackett (2005) equation of state
+
+    McDougall, T. J. and D. R. Jackett (2005) The material derivative of neutral
+    density. Journal of Marine Research, 63 (1), pp 159-185. doi: 10.1357/0022240053693734
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+    Co-author: Paul J. Durack : pauldurack@llnl.gov : @durack1.
+
+    Created on Sun Sep 14 21:13:30 2014
+
+    Inputs:
+    ------
+    - pottemp(time,lev,lat,lon)     - 4D potential temperature  - deg_C
+    - salt(time,lev,lat,lon)        - 4D salinity               - PSS-78
+
+    Output:
+    - rho(time,lev,lat,lon)         - 4D neutral density array  - kg m^-^3
+
+    Usage:
+    ------
+    >>> from libDensityCore import eosNeutral
+    >>> eosNeutral(pottemp,salt)
+    >>> eosNeutral(20.,35.) ; # Check value 1024.5941675119673
+
+    Notes:
+    -----
+    - PJD 14 Sep 2014 -
+    '''
+    zt = pottemp
+    zs = salt
+    # neutral density
+    zsr     = npy.ma.sqrt(zs)
+    zr1     = ( ( -4.3159255086706703e-4*zt+8.1157118782170051e-2 )*zt+2.2280832068441331e-1 )*zt+1002.3063688892480
+    zr2     = ( -1.7052298331414675e-7*zs-3.1710675488863952e-3*zt-1.0304537539692924e-4 )*zs
+    zr3     = ( ( (-2.3850178558212048e-9*zt -1.6212552470310961e-7 )*zt+7.8717799560577725e-5 )*zt+4.3907692647825900e-5 )*zt + 1.0
+    zr4     = ( ( -2.2744455733317707e-9*zt*zt+6.0399864718597388e-6)*zt-5.1268124398160734e-4 )*zs
+    zr5     = ( -1.3409379420216683e-9*zt*zt-3.6138532339703262e-5)*zs*zsr
+    zrho    = ( zr1 + zr2 ) / ( zr3 + zr4 + zr5 )
+    return zrho
+
+def rhonGrid(rho_min,rho_int,rho_max,del_s1,del_s2):
+    '''
+    The rhonGrid() function computes grid for density variables
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+    Co-author: Paul J. Durack : pauldurack@llnl.gov : @durack1.
+
+    Created on Sun Sep 14 21:13:30 2014
+
+    Inputs:
+    ------
+    - rho_min    - scalar - minimum density                       (e.g. 18)
+    - rho_int    - scalar - intermediate density                  (e.g. 26)
+    - rho_max    - scalar - maximum density                       (2.g. 28)
+    - del_s1     - scalar - delta_rho between rho_min and rho_int (e.g. 0.2)
+    - del_s2     - scalar - delta_rho between rho_mintand rho_max (e.g. 0.1)
+
+    Output:
+    - s_s        - 1D array - Density grid
+    - s_sax      - 1D array - Density grid for plotting axis (adds the last interval e.g. 28-28.1)
+    - del_s      - 1D array - delta_rho
+    - N_s        - integer  - dimension of density grid
+
+    Usage:
+    ------
+    >>> from libDensityCore import rhonGrid
+    >>> rhonGrid(rho_min,rho_int,rho_max,del_s1,del_s2)
+
+    Notes:
+    -----
+    - PJD 14 Sep 2014 - Rewrote as function
+    - EG  23 Sep 2014 - documentation
+    '''
+    s_s1 = npy.arange(rho_min, rho_int, del_s1, dtype = npy.float32)
+    s_s2 = npy.arange(rho_int, rho_max, del_s2, dtype = npy.float32)
+    s_s  = npy.concatenate([s_s1, s_s2])
+    N_s1 = len(s_s1)
+    N_s2 = len(s_s2)
+    N_s  = len(s_s)
+    del_s = npy.concatenate([npy.tile(del_s1, N_s1), npy.tile(del_s2, N_s2)])
+    s_sax = npy.append(s_s, s_s[N_s-1]+del_s2) # make axis
+    return s_s, s_sax, del_s, N_s
+
+def binColumns(rhon,thetao,so,vo,s_s,z_zt,lev_thick,lev_thickt,rho_max,del_s1,valmask,
+               max_depth_ocean=6000.,debug=False,ijtest=0,areac=None):
+    '''
+    The binColumns() function bins a set of independent water columns from the source
+    z grid onto the target density grid (kernel of densityBin)
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026 (extracted from the densityBin time loop)
+
+    Inputs:
+    ------
+    - rhon(time,lev,col)        - neutral density (-1000.) on the source z grid (columns = flattened lat*lon)
+    - thetao(time,lev,col)      - potential temperature
+    - so(time,lev,col)          - salinity (masked points set to valmask)
+    - vo(time,lev,col)          - meridional velocity (None if no MSF)
+    - s_s(N_s,col)              - target density grid tiled over columns
+    - z_zt, lev_thick           - depth and thickness of source levels
+    - lev_thickt(lev,col)       - lev_thick tiled over columns
+    - rho_max, del_s1, valmask  - grid constants from densityBinGrid
+    -> options:
+    - max_depth_ocean           - maximum depth of ocean (thicker isopycnals are masked)
+    - debug, ijtest             - print diagnostics for column ijtest at first time step
+    - areac(col)                - cell area of columns (for debug integrals)
+
+    Output:
+    - depth_bin, thick_bin, x1_bin, x2_bin, x3_bin (time,N_s+1,col) - binned fields (x3_bin None if vo is None)
+    - nomask(col)               - ocean points (surface unmasked at all time steps)
+    - cpu                       - CPU of the kernel steps (see cpuan in densityBin)
+
+    Usage:
+    ------
+    >>> from libDensityCore import binColumns
+    >>> depth_bin,thick_bin,x1_bin,x2_bin,x3_bin,nomask,cpu = binColumns(rhon,thetao,so,None,s_s,z_zt,lev_thick,lev_thickt,rho_max,del_s1,valmask)
+
+    Notes:
+    -----
+    - Columns are independent so any subset of columns (e.g. a band of latitudes, see densityBin nband)
+      gives the same result as the full field
+    '''
+    nt, depthN, ncol = so.shape
+    N_s = s_s.shape[0]
+    # Output arrays set to missing for binned fields
+    depth_bin = maskVal(npy.ma.ones([nt, N_s+1, ncol], dtype='float32')*valmask, valmask)
+    thick_bin,x1_bin,x2_bin = [npy.ma.ones([nt, N_s+1, ncol])*valmask for _ in range(3)]
+    x3_bin = None
+    if vo is not None:
+        x3_bin = npy.ma.ones([nt, N_s+1, ncol])*valmask
+    nomaskAll = npy.ones(ncol, dtype=bool)
+    cpu = [0.]*6
+    # Loop on time
+    for t in range(nt):
+        tcpu0 = timc.clock()
+        # x1 contents on vertical (not yet implemented - may be done to ensure conservation)
+        x1_content = thetao[t]
+        x2_content = so[t]
+        #
+        #  Find indexes of masked points
+        vmask_3D    = npy.ma.masked_values(so[t],valmask).mask ; # Returns boolean
+        #vmask_3D2 = so.mask[t] todo: use this instead ?
+
+        # find surface non-masked points
+        nomask      = npy.equal(vmask_3D[0],0) ; # Returns boolean
+        nomaskAll = nomaskAll & nomask
+        # compute "1D volume flux"
+        if vo is not None:
+            x3_content = vo[t]*lev_thickt*(1.-vmask_3D)
+            if debug and t == 0:
+                print ' x3_content before cumul and z_zt :', x3_content.shape
+                print x3_content[:,ijtest]
+                print z_zt
+        #
+        # Vertical integral of x3_content from bottom
+            x3intz = npy.ma.ones([depthN, ncol])*valmask
+            for k in range(depthN-1,-1,-1):
+                x3intz[k,:] = npy.ma.cumsum(x3_content[k:depthN,:], axis=0)[-1,:]
+            x3intz[vmask_3D] = valmask
+            x3_content = x3intz
+        #print npy.argwhere(nomask == True).shape # 16756/27118 for ORCA2/IPSL-CM5A-LR
+        # Check integrals on source z coordinate grid
+        if debug and t == 0 and areac is not None:
+            areat = areac*nomask
+            voltotij0 = npy.ma.sum(lev_thickt*(1-vmask_3D[:,:]), axis=0)
+            temtotij0 = npy.ma.sum(lev_thickt*(1-vmask_3D[:,:])*x1_content[:,:], axis=0)
+            saltotij0 = npy.ma.sum(lev_thickt*(1-vmask_3D[:,:])*x2_content[:,:], axis=0)
+            if vo is not None:
+                hvmtotij0 = npy.ma.sum(x3_content*(1-vmask_3D[:,:]), axis=0) # vertical sum of h*v (m2/s)
+                print 'hvmtotij0[ijtest]',hvmtotij0[ijtest]
+            voltot = npy.ma.sum(voltotij0*areat)
+            temtot = npy.ma.sum(temtotij0*areat)/voltot
+            saltot = npy.ma.sum(saltotij0*areat)/voltot
+            if vo is not None:
+                hvmtot = npy.sum(hvmtotij0*areat)/npy.sum(areat)
+            print '  Total volume in z coordinates source grid (ref = 1.33 e+18)   : ', voltot
+            print '  Mean Temp./Salinity in z coordinates source grid              : ', temtot, saltot
+            if vo is not None:
+                print '  Mean meridional transport in z coordinates source grid (m2/s) : ', hvmtot
+
+        # init arrays for this time chunk
+        z_s,c1_s,c2_s,t_s       = [npy.ma.ones((N_s+1, ncol))*valmask for _ in range(4)]
+        szmin,szmax,delta_rho   = [npy.ma.ones(ncol)*valmask for _ in range(3)]
+        i_min,i_max             = [npy.ma.zeros(ncol) for _ in range(2)]
+        if vo is not None:
+            c3_s = npy.ma.ones((N_s+1, ncol))*valmask
+        tcpu1 = timc.clock()
+        # find bottom level at each lat/lon point
+        i_bottom                = vmask_3D.argmax(axis=0)-1
+        # init arrays as a function of depth = f(z)
+        s_z     = rhon[t]
+        c1_z    = x1_content
+        c2_z    = x2_content
+        if vo is not None:
+            c3_z    = x3_content
+        # Extract a strictly increasing sub-profile
+        # todo : ensure this works whatever the valmask (fails for valmask <0)
+        i_min[nomask]           = s_z.argmin(axis=0)[nomask]
+        i_max[nomask]           = s_z.argmax(axis=0)[nomask]-1 # why -1 ?
+        i_min[i_min > i_max]    = i_max[i_min > i_max]
+        # Test on bottom minus surface stratification to check that it is larger than delta_rho
+        delta_rho[nomask]           = s_z[i_bottom[nomask],nomask] - s_z[0,nomask]
+        i_min[delta_rho < del_s1]   = 0
+        i_max[delta_rho < del_s1]   = i_bottom[delta_rho < del_s1]
+
+        # General case
+        # find min/max of density for each z profile
+        for i in range(ncol):
+            if nomask[i]:
+                szmin[i] = s_z[int(i_min[i]),i]
+                szmax[i] = s_z[int(i_max[i]),i]
+            else:
+                szmin[i] = 0.
+                szmax[i] = rho_max+10.
+        tcpu2 = timc.clock()
+        if debug and t == 0: #t == 0:
+            print ' i_bottom, szmin, szmax, i_min, i_max',i_bottom[ijtest], szmin[ijtest],szmax[ijtest], i_min[ijtest],i_max[ijtest]
+        #
+        #  Find indices between density min and density max
+        #
+        # Construct arrays of szm/c1m/c2m/c3m = s_z[i_min[i]:i_max[i],i] and valmask otherwise
+        # same for zzm from z_zt
+        szm,zzm,c1m,c2m,c3m  = [npy.ma.ones(s_z.shape)*valmask for _ in range(5)]
+        for k in range(depthN):
+            k_ind = i_min*1.; k_ind[:] = valmask
+            k_ind = npy.argwhere( (k >= i_min) & (k <= i_max))
+            szm[k,k_ind] = s_z [k,k_ind]
+            c1m[k,k_ind] = c1_z[k,k_ind]
+            c2m[k,k_ind] = c2_z[k,k_ind]
+            if vo is not None:
+                c3m[k,k_ind] = c3_z[k,k_ind]
+            zzm[k,:] = z_zt[k] # TODO ?? For smooth bottom interpolation use z_zw for integral field ?
+
+        if debug and t == 0 :
+            print ' szm just before interp', szm[:,ijtest]
+            if vo is not None:
+                print ' c3m just before interp', c3m[:,ijtest]
+            print ' zzm just before interp', zzm[:,ijtest]
+            print ' c1m just before interp', c1m[:,ijtest]
+            print ' c2m just before interp', c2m[:,ijtest]
+
+        # Interpolate depth(z) (= zzm) to depth(s) at s_s densities (= z_s) using density(z) (= szm)
+        # Use z_s to interpolate other fields
+        # This loop uses 85% of the CPU
+        # TODO: use ESMF ? outsource to fortran program ?
+        # TODO check that interp is linear or/and stabilise column as post-pro
+        tcpu3 = timc.clock()
+        for i in range(ncol):
+            if nomask[i]:
+                z_s [0:N_s,i] = npy.interp(s_s[:,i], szm[:,i], zzm[:,i], right = 0., left = 0.) ; # depth - consider spline
+                c1_s[0:N_s,i] = npy.interp(z_s[0:N_s,i], zzm[:,i], c1m[:,i], right = valmask, left = valmask) ; # thetao
+                c2_s[0:N_s,i] = npy.interp(z_s[0:N_s,i], zzm[:,i], c2m[:,i], right = valmask, left = valmask) ; # so
+                if vo is not None:
+                    c3_s[0:N_s,i] = npy.interp(z_s[0:N_s,i], zzm[:,i], c3m[:,i], right = valmask, left = c3m[0,i]) ; # volume flux
+        tcpu40 = timc.clock()
+        # find mask on s grid
+        indsm = npy.argwhere (c1_s > valmask/10).transpose()
+
+        if debug and t == 0 : #t == 0:
+            print ' z_s just after interp', z_s[:,ijtest]
+            print ' c1_s just after interp', c1_s[:,ijtest]
+            if vo is not None:
+                print ' c3_s just after interp', c3_s[:,ijtest]
+        # Derive back integral of field c3_s
+        if vo is not None:
+            c3ders = npy.ma.ones([N_s+1, ncol])*valmask
+            c3ders = npy.roll(c3_s - npy.roll(c3_s,-1,axis=0),1,axis=0)
+            if debug and t == 0:
+                print ' c3_s after derivative :'
+                print c3ders[:,ijtest]
+            c3ders[indsm[0], indsm[1]] = valmask
+            if debug and t == 0:
+                print ' c3_s after masking :'
+                print c3ders[:,ijtest]
+        # Where level of s_s has higher density than bottom density,
+        # isopycnal is set to bottom (z_s = z_zw[i_bottom])
+        inds = npy.argwhere(s_s > szmax).transpose()
+
+        # Find indices of densest point in column on s grid
+        ssr = npy.roll(s_s, 1, axis=0)
+        ssr[0,:] = ssr[1,:]-del_s1
+        inds_bottom = npy.argwhere ( (szmax <= s_s) & (szmax > ssr) ).transpose()
+        bottom_ind = npy.ones((2,ncol), dtype='int')*-1 # Todo init at sz_max ?
+        bottom_ind [0,inds_bottom[1]] = inds_bottom[0]
+        bottom_ind [1,:] = npy.arange(ncol)
+
+        # Bottom correction for extensive field
+        # Densest value of derivative on s grid c3ders should be equal to c3_s
+        # Create 3D tiled array with bottom value at all levels (as below)
+        if vo is not None:
+            c3ders[indsm[0], indsm[1]] = 0
+            zcd = npy.cumsum(c3ders, axis=0)
+            if debug and t == 0:
+                print '   zcd', zcd[:,ijtest]
+            zcd = npy.tile(zcd[bottom_ind[0]-1,bottom_ind[1]].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+            c3t = npy.tile(c3_s[0,:].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+            c3ders[bottom_ind[0],bottom_ind[1]]=c3t[bottom_ind[0],bottom_ind[1]]-zcd[bottom_ind[0],bottom_ind[1]]
+
+            if debug and t == 0:
+                print ' bottom correction', bottom_ind[0,ijtest], bottom_ind[1,ijtest]
+                print '   c3t', c3t[:,ijtest]
+                print '   zcd', zcd[:,ijtest]
+                print '   c3ders', c3ders[:,ijtest]
+                print '   int(c3ders)', npy.cumsum(c3ders, axis=0)[:,ijtest]
+        #print npy.sum(c3ders[0:npy.max(bottom_ind[0,ijtest],0),bottom_ind[1,ijtest]],axis=0)
+        #c3ders[bottom_ind[0],bottom_ind[1]] = c3_s[0]*1. - npy.sum(c3ders[0:npy.max(bottom_ind[0],0),bottom_ind[1]],axis=0)
+        #print 'sum of ', c3ders[0:npy.max(bottom_ind[0,ijtest],0),bottom_ind[1,ijtest]]
+        #print 'equal ',npy.sum(c3ders[0:npy.max(bottom_ind[0,ijtest],0),bottom_ind[1,ijtest]],axis=0)
+        #print c3_s[0,ijtest] - npy.sum(c3ders[0:npy.max(bottom_ind[0,ijtest],0),bottom_ind[1,ijtest]],axis=0)
+
+            c3ders[indsm[0], indsm[1]] = valmask
+            if debug and t == 0:
+                print ' c3_s after bottom correction :'
+                print c3ders[:,ijtest]
+
+            c3_s = c3ders*1.
+
+        # Compute thickness of isopycnal from depth
+        t_s = z_s - npy.roll(z_s,1,axis=0)
+        t_s[indsm[0], indsm[1]] = -10.
+        if debug and t == 0:
+            print ' t_s: '
+            print t_s[:,ijtest]
+        # Create 3D tiled array with bottom value at all levels (to avoid loop)
+        zst = npy.tile(z_s[bottom_ind[0],bottom_ind[1]].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+        c1t = npy.tile(c1_s[bottom_ind[0],bottom_ind[1]].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+        c2t = npy.tile(c2_s[bottom_ind[0],bottom_ind[1]].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+        if vo is not None:
+            c3t = npy.tile(c3_s[bottom_ind[0],bottom_ind[1]].reshape(ncol), N_s+1).reshape(N_s+1,ncol)
+        # apply tiles array to density levels denser than bottom density
+        z_s [inds[0],inds[1]] = zst[inds[0],inds[1]]
+        c1_s[inds[0],inds[1]] = c1t[inds[0],inds[1]]
+        c2_s[inds[0],inds[1]] = c2t[inds[0],inds[1]]
+        if vo is not None:
+            c3_s[inds[0],inds[1]] = c3t[inds[0],inds[1]]
+
+        tcpu4 = timc.clock()
+        if debug and t == 0: #t == 0:
+            print ' z_s  after inds test', z_s[:,ijtest]
+            if vo is not None:
+                print ' c3_s after inds test', c3_s[:,ijtest]
+        # Add half level to depth to ensure thickness integral conservation at bottom
+        if debug and t == 0:
+            print ' before add half level:'
+            print z_s [bottom_ind[0],bottom_ind[1]][ijtest]
+            print lev_thick[i_bottom[ijtest]]/2.
+        z_s [bottom_ind[0],bottom_ind[1]] = z_s[bottom_ind[0],bottom_ind[1]]+lev_thick[i_bottom[:]]/2.
+        if debug and t == 0:
+            print ' after add half level:'
+            print z_s [bottom_ind[0],bottom_ind[1]][ijtest]
+        # Correct thickness of isopycnal from depth
+        t_s = z_s - npy.roll(z_s,1,axis=0)
+        t_s[indsm[0], indsm[1]] = -10.
+        if debug and t == 0:
+            print ' corrected thickness:'
+            print t_s[:,ijtest]
+        # Use thickness of isopycnal (less than zero) to create masked point for all binned arrays
+        inds = npy.argwhere( (t_s <= 0.) ^ (t_s >= max_depth_ocean)).transpose()
+        t_s [inds[0],inds[1]] = valmask
+        z_s [inds[0],inds[1]] = valmask
+        c1_s[inds[0],inds[1]] = valmask
+        c2_s[inds[0],inds[1]] = valmask
+        if vo is not None:
+            c3_s[inds[0],inds[1]] = valmask
+        #
+        if debug and t == 0: #t == 0:
+            #  Check t_s == 0 vs. non-masked values for c1_s
+            indtst = npy.argwhere( (t_s <= 0.) & (c1_s < valmask/10) )
+            print 'Nb points with t_s vs. c1_s pb ',indtst.shape
+            i = ijtest
+            print
+            print ' density target array s_s[i]'
+            print s_s[:,i]
+            print ' density profile on Z grid szm[i]'
+            print szm[:,i]
+            print ' depth profile on Z grid zzm[i]'
+            print zzm[:,i]
+            print ' depth profile on rhon target grid z_s[i]'
+            print z_s[:,i]
+            print ' thickness profile on rhon grid t_s[i]'
+            print t_s[:,i]
+            print ' bined temperature profile on rhon grid c1_s[i]'
+            print c1_s[:,i]
+            print ' bined salinity profile on rhon grid c2_s[i]'
+            print c2_s[:,i]
+            if vo is not None:
+                print ' bined integral profile on rhon grid c3_s[i]'
+                print c3_s[:,i]
+            print ' vertical integral on z and sigma (volume)'
+            print npy.ma.sum(lev_thick*(szm[:,i] < valmask/10)), npy.ma.sum(t_s[:,i]*(t_s[:,i] < valmask/10))
+            #print lev_thick*(szm[:,ijtest] < valmask/10)
+            #print t_s[:,ijtest]*(t_s[:,ijtest] < valmask/10)
+        #
+        # Vertical integral of hvm (c3_s) from bottom to obtain msf
+        # use npy.cumsum + reverse axis
+        if vo is not None:
+            c3zero = c3_s*1.
+            c3zero[indsm[0], indsm[1]] = 0.
+            c3zero[inds[0], inds[1]] = 0.
+            c3zero = npy.cumsum(c3zero[::-1,:],axis=0)[::-1,:]
+            c3_s2 = c3zero*1.
+            c3_s2[indsm[0], indsm[1]] = valmask
+            c3_s2[inds[0], inds[1]] = valmask
+
+            if debug and t == 0:
+                print ' c3_s2 after cumsum :'
+                print c3_s2[:,ijtest]
+
+            c3_s = c3_s2*1.
+        # assign to final arrays
+        depth_bin[t,:,:] = z_s
+        thick_bin[t,:,:] = t_s
+        x1_bin[t,:,:]    = c1_s
+        x2_bin[t,:,:]    = c2_s
+        if vo is not None:
+            x3_bin[t,:,:]    = c3_s
+
+        # CPU analysis
+        tcpu5 = timc.clock()
+        cpu[0] = cpu[0] + tcpu1 - tcpu0
+        cpu[1] = cpu[1] + tcpu2 - tcpu1
+        cpu[2] = cpu[2] + tcpu3 - tcpu2
+        cpu[3] = cpu[3] + tcpu40 - tcpu3
+        cpu[4] = cpu[4] + tcpu4 - tcpu40
+        cpu[5] = cpu[5] + tcpu5 - tcpu4
+    #
+    # end of loop on t <===
+    #
+    return depth_bin,thick_bin,x1_bin,x2_bin,x3_bin,nomaskAll,cpu
+
+# ------------------------------------------------
+#  Surface transformation
+# ------------------------------------------------
+
+def transfBin(rhonl, dflxh, dflxw, areai, masks, sigrid, del_s, valmask=1.e20):
+    '''
+    The transfBin() function bins the area weighted heat and water density fluxes
+    of one month on the density grid, for all bins and basins at once
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - rhonl(lat,lon)        - surface neutral density (data, minus 1000., valmask or NaN where masked)
+    - dflxh, dflxw(lat,lon) - heat and water density fluxes (data, valmask or NaN where masked)
+    - areai(lat,lon)        - cell area
+    - masks                 - list of basin masks (1 inside basin), None for no masking (global)
+    - sigrid, del_s(N_s)    - density grid and bin widths (from rhonGrid)
+    - valmask <optional>    - mask value of rhonl, dflxh and dflxw (as set by surfDensFlux)
+
+    Output:
+    - transfh, transfw(nbasin,N_s+1)  - heat and water transformation (sum of flux*area per bin / del_s)
+    - areabin(nbasin,N_s+1)           - area of bin (index N_s-1 is not used)
+
+    Usage:
+    ------
+    >>> from libDensityCore import transfBin
+    >>> transfh, transfw, areabin = transfBin(rhonl, dflxh, dflxw, areai, [None, maskAtl], sigrid, del_s)
+
+    Notes:
+    -----
+    - Bin index found once with a search on the sorted bin edges, sums done with weighted
+      bincounts keyed by (basin, bin). Same bins as the former loop on ks:
+      sigrid[ks] <= rhon < sigrid[ks+1] for ks < N_s-1, densest points (rhon >= sigrid[N_s-1])
+      in index N_s (divided by del_s[N_s-2]), basin points selected on rhon*mask
+    - Masked points (valmask or NaN density or flux) are not binned in any basin
+    '''
+    N_s  = len(sigrid)
+    nbin = N_s+1
+    nb   = len(masks)
+    rho  = npy.asarray(rhonl).ravel()
+    flxh = npy.asarray(dflxh).ravel()
+    flxw = npy.asarray(dflxw).ravel()
+    # Valid points: density and fluxes defined (masked points are valmask or NaN)
+    valid = npy.ones(rho.shape, dtype=bool)
+    for var in [rho, flxh, flxw]:
+        valid &= npy.isfinite(var) & (npy.abs(var) < abs(valmask)/10)
+    # Bin index (-1 = not binned)
+    ks = npy.searchsorted(sigrid, rho, side='right') - 1
+    ks[~valid] = -1
+    ks[ks == N_s-1] = N_s
+    # Bin of points outside a basin mask (rhon*mask = 0)
+    ks0 = npy.searchsorted(sigrid, 0., side='right') - 1
+    if ks0 == N_s-1:
+        ks0 = N_s
+    ks0 = npy.where(valid, ks0, -1)
+    # Weights (masked area does not contribute)
+    area = npy.where(valid, npy.ma.filled(areai, 0.).ravel(), 0.).astype('float64')
+    wh   = npy.where(valid, flxh, 0.)*area
+    ww   = npy.where(valid, flxw, 0.)*area
+    keys = []
+    for b in range(nb):
+        if masks[b] is None:
+            kb = ks
+        else:
+            kb = npy.where(npy.ma.filled(masks[b], 0).ravel() != 0, ks, ks0)
+        keys.append(npy.where(kb >= 0, b*nbin + kb, -1))
+    keys = npy.concatenate(keys)
+    sel  = keys >= 0
+    keys = keys[sel]
+    transfh = npy.bincount(keys, weights=npy.tile(wh, nb)[sel], minlength=nb*nbin).reshape(nb, nbin)
+    transfw = npy.bincount(keys, weights=npy.tile(ww, nb)[sel], minlength=nb*nbin).reshape(nb, nbin)
+    areabin = npy.bincount(keys, weights=npy.tile(area, nb)[sel], minlength=nb*nbin).reshape(nb, nbin)
+    # Divide by bin width
+    dels = npy.ones(nbin)
+    dels[0:N_s-1] = del_s[0:N_s-1]
+    dels[N_s]     = del_s[N_s-2]
+    transfh = transfh/dels
+    transfw = transfw/dels
+    return transfh, transfw, areabin
+
+def surfDensFlux(sst, sss, heat, wfo, valmask, empsw=0):
+    '''
+    The surfDensFlux() function computes surface neutral density and the heat and water
+    density fluxes in one pass, with the seawater (EOS-80) coefficients evaluated at p=0
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - sst, sss(...)         - surface temperature and salinity (any shape, e.g. time block)
+    - heat(...)             - net surface heat flux (W/m2)
+    - wfo(...)              - fresh water flux (kg/m2/s)
+    - valmask               - mask value (set where sst/sss are masked or results are not finite)
+    - empsw <optional>      - 0: water flux is a volume flux (multiplied by sss)
+
+    Output:
+    - rhon(...)             - neutral density (eosNeutral, minus 1000.)
+    - denflxh, denflxw(...) - heat and water density fluxes (kg/m2/s)
+
+    Usage:
+    ------
+    >>> from libDensityCore import surfDensFlux
+    >>> rhon, denflxh, denflxw = surfDensFlux(tost, sost, heft, empt, valmask)
+
+    Notes:
+    -----
+    - Same as -sw.alpha/sw.cp*heat and rho*sw.beta*sss*wfo at p=0 (ptmp is the identity at
+      p=0, cp reduces to Cpst0), powers of T and S shared between the polynomials
+    '''
+    zt   = npy.asarray(sst, dtype='float64')
+    zs   = npy.asarray(sss, dtype='float64')
+    zsr  = npy.sqrt(zs)
+    zss  = zs*zsr
+    zt2  = zt*zt
+    # Neutral density (as eosNeutral)
+    zr1  = ( ( -4.3159255086706703e-4*zt+8.1157118782170051e-2 )*zt+2.2280832068441331e-1 )*zt+1002.3063688892480
+    zr2  = ( -1.7052298331414675e-7*zs-3.1710675488863952e-3*zt-1.0304537539692924e-4 )*zs
+    zr3  = ( ( (-2.3850178558212048e-9*zt -1.6212552470310961e-7 )*zt+7.8717799560577725e-5 )*zt+4.3907692647825900e-5 )*zt + 1.0
+    zr4  = ( ( -2.2744455733317707e-9*zt2+6.0399864718597388e-6)*zt-5.1268124398160734e-4 )*zs
+    zr5  = ( -1.3409379420216683e-9*zt2-3.6138532339703262e-5)*zss
+    zrho = ( zr1 + zr2 ) / ( zr3 + zr4 + zr5 )
+    del(zr1, zr2, zr3, zr4, zr5, zt2)
+    # EOS-80 coefficients at p=0 (IPTS-68 temperature)
+    t68  = zt*1.00024
+    sm35 = zs-35.
+    beta = ( ( (-0.415613e-9*t68 + 0.555579e-7)*t68 - 0.301985e-5)*t68 + 0.785567e-3 ) \
+           + sm35*(0.788212e-8*t68 - 0.356603e-6) + 0.515032e-8*sm35*sm35
+    aonb = ( ( ( (-0.255019e-7*t68 + 0.298357e-5)*t68 - 0.203814e-3)*t68 + 0.170907e-1)*t68 + 0.665157e-1 ) \
+           + sm35*(-0.846960e-4*t68 + 0.378110e-2) - 0.678662e-5*sm35*sm35
+    cp   = ( ( ( (2.093236e-5*t68 - 2.654387e-3)*t68 + 0.1412855)*t68 - 3.720283)*t68 + 4217.4 ) \
+           + ( (-1.38385e-3*t68 + 0.1072763)*t68 - 7.64357)*zs \
+           + ( (5.148e-5*t68 - 4.07718e-3)*t68 + 0.1770383)*zss
+    del(t68, sm35, zsr, zss)
+    # Density fluxes (convwf : kg/m2/s = mm/s -> m/s)
+    convwf  = 1.e-3
+    denflxh = -aonb*beta/cp*heat
+    if empsw == 0:
+        denflxw = zrho*beta*zs*wfo*convwf
+    else:
+        denflxw = zrho*beta*wfo*convwf
+    rhon = zrho - 1000.
+    del(aonb, beta, cp, zrho)
+    # Masked points (sst/sss set to valmask) and non finite values set to valmask
+    masked = (npy.abs(zt) > abs(valmask)/10) | (npy.abs(zs) > abs(valmask)/10)
+    out = []
+    for var in [rhon, denflxh, denflxw]:
+        var = var.astype('float32')
+        var[~npy.isfinite(var) | masked] = valmask
+        out.append(var)
+    return out
+
+# Latitude bands of the named domains of surfTransf (latmin < lat <= latmax, None for the whole grid)
+surfDomainBands = {'global': None, 'north': [0., 90.], 'north40': [40., 90.], 'south': [-90., 0.]}
+
+def surfDomainMasks(domain, lat2d):
+    '''
+    The surfDomainMasks() function builds the domain masks of surfTransf on the target grid
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - domain                    - one domain or a list of domains, a domain being a name of surfDomainBands,
+                                  a [latmin, latmax] band or a (name, mask(lat,lon)) pair (True inside domain),
+                                  or a domain mask stack (domain,lat,lon)
+    - lat2d(lat,lon)            - latitude of target grid
+
+    Output:
+    - names                     - list of domain names
+    - dmasks                    - list of domain masks (True inside domain, None for the whole grid)
+    - multi                     - True if a list of domains (or a stack) was given
+
+    Usage:
+    ------
+    >>> from libDensityCore import surfDomainMasks
+    >>> names, dmasks, multi = surfDomainMasks(['global', 'north', [-30., 30.]], lat2d)
+    '''
+    def isDomain(dom):
+        if isinstance(dom, basestring):
+            return True
+        return (len(dom) == 2 and (isinstance(dom[0], (int, float)) or hasattr(dom[1], 'shape')))
+
+    if hasattr(domain, 'ndim') and domain.ndim == 3:
+        domain = [('domain'+str(k), domain[k]) for k in range(domain.shape[0])]
+        multi  = True
+    elif isDomain(domain):
+        domain = [domain]
+        multi  = False
+    else:
+        multi  = True
+    names  = []
+    dmasks = []
+    for dom in domain:
+        if isinstance(dom, basestring):
+            if dom not in surfDomainBands:
+                raise ValueError('surfDomainMasks: unknown domain '+dom+' (use '+', '.join(sorted(surfDomainBands.keys()))+')')
+            name, band = dom, surfDomainBands[dom]
+        elif hasattr(dom[1], 'shape'):
+            name, band = dom[0], None
+        else:
+            name, band = 'lat'+str(dom[0])+'_'+str(dom[1]), dom
+        if hasattr(dom[1], 'shape'):
+            dmask = npy.ma.filled(dom[1], 0) != 0
+        elif band is None:
+            dmask = None
+        else:
+            dmask = (lat2d > band[0]) & (lat2d <= band[1])
+        names.append(name)
+        dmasks.append(dmask)
+    return names, dmasks, multi
+
+# ------------------------------------------------
+#  Corrections of density binned fields
+# ------------------------------------------------
+
+def seamCorrect(fields, idxcorr):
+    '''
+    The seamCorrect() function corrects the longitude interpolation issue (seam) of density binned
+    fields: columns idx_i and idx_i1 are replaced by the mean of their neighbours, up to latitude jmax
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fields                    - list of masked arrays [...,lat,lon] (any number of leading dimensions),
+                                  corrected in place
+    - idxcorr                   - [idx_i,idx_i1,jmax] or list of them (modelsDef 'correctFile'), [0,0,0] is ignored
+
+    Usage:
+    ------
+    >>> from libDensityCore import seamCorrect
+    >>> seamCorrect([depth,thick,thetao,so],[139,140,145])
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version (vectorized version of the loops of correctBinFiles.correctFile)
+    - idx_i1 >= lonN-1 is the first longitude (seam on the grid edge)
+    - The mean is masked where a neighbour is masked
+    '''
+    if len(idxcorr) > 0 and not hasattr(idxcorr[0], '__len__'):
+        idxcorr = [idxcorr]
+    for field in fields:
+        lonN = field.shape[-1]
+        for ic1,ic2,jcmax in idxcorr:
+            if ic1 == 0 and ic2 == 0 and jcmax == 0:
+                continue
+            if ic2 >= lonN-1:
+                ic2 = 0
+            field[...,:jcmax,ic1] = (field[...,:jcmax,ic1-1] + field[...,:jcmax,ic2+1])/2
+            field[...,:jcmax,ic2] = field[...,:jcmax,ic1]
+
+def ptopCorrect(depth, so, thetao, sigma, ptop, soMin=30.):
+    '''
+    The ptopCorrect() function corrects undefined bowl properties: where the salinity of the bowl
+    (ptopsoxy) is below soMin, the bowl properties are set to those of the shallowest isopycnal
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - depth[time,rho,lat,lon]   - masked array of isopycnal depth (isondepthg)
+    - so, thetao                - masked arrays of binned salinity and temperature (sog, thetaog)
+    - sigma[rho]                - density grid
+    - ptop                      - dictionary of masked arrays [time,lat,lon]: 'ptopsoxy','ptopdepthxy',
+                                  'ptopthetaoxy','ptopsigmaxy', corrected in place
+    - soMin <optional>          - salinity threshold of undefined bowl
+
+    Usage:
+    ------
+    >>> from libDensityCore import ptopCorrect
+    >>> ptopCorrect(depth,so,thetao,sigmaGrd,{'ptopsoxy':ptops,'ptopdepthxy':ptopd,'ptopthetaoxy':ptopt,'ptopsigmaxy':ptopsig})
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version (vectorized version of correctBinFiles.correctFile, all times at once)
+    - The shallowest isopycnal of a column is the densest one at the minimum depth of the column
+    '''
+    valid = ~npy.ma.getmaskarray(depth)
+    depthBowl = npy.ma.min(depth, axis=1)
+    isBowl = valid & (depth.filled(0) == npy.ma.filled(depthBowl, 0)[:,npy.newaxis])
+    sigmaBowl  = npy.max(npy.where(isBowl, npy.asarray(sigma)[npy.newaxis,:,npy.newaxis,npy.newaxis], 0), axis=1)
+    soBowl     = npy.max(npy.where(isBowl, npy.ma.filled(so, 0), 0), axis=1)
+    thetaoBowl = npy.max(npy.where(isBowl, npy.ma.filled(thetao, -1000), -1000), axis=1)
+    undef = npy.ma.filled(ptop['ptopsoxy'] < soMin, False) & ~npy.ma.getmaskarray(depthBowl)
+    for name,bowl in [['ptopsoxy',soBowl], ['ptopdepthxy',depthBowl], ['ptopthetaoxy',thetaoBowl], ['ptopsigmaxy',sigmaBowl]]:
+        ptop[name][undef] = npy.ma.filled(bowl, 0)[undef]
+
+# ------------------------------------------------
+#  Remapping to depth
+# ------------------------------------------------
+
+def remapColumns(depth, thick, fields, zbounds, valmask):
+    '''
+    The remapColumns() function remaps density binned columns back to depth levels: each target
+    level gets the thickness weighted mean of the isopycnal layers it overlaps
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - depth[rho,col]            - depth of isopycnals (bottom of isopycnal layers, isondepth)
+    - thick[rho,col]            - thickness of isopycnal layers (isonthick)
+    - fields                    - list of binned fields [rho,col] (thetao, so..)
+    - zbounds[levN+1]           - bounds of target depth levels (increasing)
+    - valmask                   - mask value (missing isopycnals are valmask in depth, thick or fields)
+
+    Output:
+    - fieldsz                   - list of remapped fields [levN,col], valmask where the level has no water
+    - fracz[levN,col]           - fraction of each target level filled by isopycnal layers
+
+    Usage:
+    ------
+    >>> from libDensityCore import remapColumns
+    >>> [thetaoz,soz],fracz = remapColumns(depth_bin,thick_bin,[x1_bin,x2_bin],zbounds,valmask)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version (Python version of Remapping_rho_vers_z.m for full 3D fields)
+    - Isopycnal layer s spans [depth-thick, depth] (as built by binColumns), layers are made
+      contiguous and non overlapping with a running maximum of their bottom depth
+    - Thickness and field x thickness are integrated from the surface at the layer bottoms; their
+      values at the target bounds are found with one sorted search for all columns (column offsets),
+      so that the cost is O(rho+lev) per column and there is no loop
+    '''
+    rhoN, ncol = depth.shape
+    zbounds = npy.asarray(zbounds, dtype='float64')
+    levN = len(zbounds) - 1
+    depth = npy.asarray(depth, dtype='float64')
+    thick = npy.asarray(thick, dtype='float64')
+    fields = [npy.asarray(x, dtype='float64') for x in fields]
+    ok = (depth < valmask/10) & (thick < valmask/10) & (thick > 0.)
+    for x in fields:
+        ok &= npy.abs(x) < valmask/10
+    # contiguous layers: bottom is the running maximum of valid bottoms, top is below previous bottom
+    bot = npy.maximum.accumulate(npy.where(ok, depth, 0.), axis=0)
+    botp = npy.concatenate([npy.zeros((1, ncol)), bot[:-1]], axis=0)
+    top = npy.where(ok, npy.maximum(npy.minimum(depth - thick, bot), botp), bot)
+    dz = bot - top
+    # integrals at layer bottoms, with a leading zero (above first layer)
+    hcum = npy.zeros((rhoN+1, ncol))
+    npy.cumsum(dz, axis=0, out=hcum[1:])
+    xcum = []
+    for x in fields:
+        c = npy.zeros((rhoN+1, ncol))
+        npy.cumsum(npy.where(ok, x, 0.)*dz, axis=0, out=c[1:])
+        xcum.append(c)
+    # sorted search of the target bounds in the layer tops of each column
+    offset = 2.*(max(npy.abs(zbounds).max(), npy.abs(bot).max()) + 1.)
+    cols = npy.arange(ncol)*offset
+    keys = (top + cols[npy.newaxis, :]).transpose().ravel()
+    query = (zbounds[:, npy.newaxis] + cols[npy.newaxis, :]).transpose().ravel()
+    idx = npy.searchsorted(keys, query, side='right') - 1
+    col = npy.repeat(npy.arange(ncol), levN+1)
+    s = idx - col*rhoN
+    above = s < 0
+    s = npy.maximum(s, 0)
+    zq = npy.tile(zbounds, ncol)
+    part = npy.where(above, 0., npy.clip(zq - top[s, col], 0., dz[s, col]))
+    # integrals at target bounds [levN+1,col]
+    hz = npy.where(above, 0., hcum[s, col] + part).reshape(ncol, levN+1).transpose()
+    dh = hz[1:] - hz[:-1]
+    empty = dh <= 0.
+    fracz = dh/(zbounds[1:] - zbounds[:-1])[:, npy.newaxis]
+    fieldsz = []
+    for x, c in zip(fields, xcum):
+        xz = npy.where(above, 0., c[s, col] + x[s, col]*part).reshape(ncol, levN+1).transpose()
+        fieldsz.append(npy.where(empty, valmask, (xz[1:] - xz[:-1])/npy.where(empty, 1., dh)))
+
+    return fieldsz, fracz
+
+# ------------------------------------------------
+#  Ensemble post-processing
+# ------------------------------------------------
+
+def bowlMask(sigmaGrd, siglimit, valmask, axis=-2, undefined=True):
+    '''
+    The bowlMask() function builds the mask of the points above the bowl (lighter than the
+    density of the bowl) for all columns at once
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - sigmaGrd(rho)             - density axis (increasing)
+    - siglimit(...)             - density of the bowl for each column (e.g. [basin,lat] or [lat,lon]),
+                                  masked or >= valmask/1000 where not defined
+    - valmask                   - mask value
+    - axis <optional>           - position of the density axis in the mask (default: before last axis)
+    - undefined <optional>      - if True, columns where the bowl is not defined are fully masked
+
+    Output:
+    - mask(...,rho,...)         - boolean, True above the bowl, e.g. [basin,rho,lat] or [rho,lat,lon]
+
+    Usage:
+    ------
+    >>> from libDensityCore import bowlMask
+    >>> maskb = bowlMask(sigmaGrd, siglimit, valmask) ; # [basin,rho,lat] from siglimit[basin,lat]
+    >>> field.mask = npy.ma.getmaskarray(field) | maskb ; # field[time,basin,rho,lat]
+
+    Notes:
+    -----
+    - Same mask as the former loop on columns masking levels 0:k, k first level with sigmaGrd >= siglimit
+    '''
+    sigl    = npy.ma.filled(npy.ma.masked_greater_equal(siglimit, valmask/1000.), valmask)
+    defined = sigl < valmask/1000.
+    ndim    = sigl.ndim + 1
+    if axis < 0:
+        axis = ndim + axis
+    shape = [1]*ndim
+    shape[axis] = len(sigmaGrd)
+    sig   = npy.reshape(npy.asarray(sigmaGrd), shape)
+    sigl    = npy.expand_dims(sigl, axis)
+    defined = npy.expand_dims(defined, axis)
+    mask = (sig < sigl) & defined
+    if undefined:
+        mask = mask | ~defined
+    return mask
+
+def ensStatsInit(shape, std=False, maxi=False):
+    '''
+    The ensStatsInit() function initialises running statistics accross ensemble members, so that
+    members can be folded in one at a time (see ensStatsAdd)
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - shape                     - shape of one member field
+    - std <optional>            - if True, also accumulate the sum of squared deviations (for std)
+    - maxi <optional>           - if True, also accumulate the maximum
+
+    Output:
+    - stats                     - dictionary: 'n' number of valid members, 'mean' running mean,
+                                  'M2' sum of squared deviations (std=True), 'max' running max (maxi=True)
+
+    Usage:
+    ------
+    >>> from libDensityCore import ensStatsInit, ensStatsAdd, ensStatsGet
+    >>> stats = ensStatsInit([timN,basN,levN,latN], std=True)
+    >>> for i in range(runN):
+    ...     ensStatsAdd(stats, readMember(i))
+    >>> varAve = ensStatsGet(stats, 'mean', valmask)
+
+    Notes:
+    -----
+    - Memory does not depend on the number of members (float64 mean/M2/max, int32 count)
+    '''
+    stats = {'n':npy.zeros(shape, dtype='int32'), 'mean':npy.zeros(shape, dtype='float64')}
+    if std:
+        stats['M2']  = npy.zeros(shape, dtype='float64')
+    if maxi:
+        stats['max'] = npy.ones(shape, dtype='float64')*(-npy.inf)
+    return stats
+
+def ensStatsAdd(stats, field):
+    '''
+    The ensStatsAdd() function folds one member into running ensemble statistics (Welford update
+    of count, mean and sum of squared deviations, running max), masked points are skipped
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - stats                     - running statistics from ensStatsInit (updated in place)
+    - field                     - member field (masked array or array), same shape as stats
+
+    Output:
+    - stats                     - updated statistics
+
+    Usage:
+    ------
+    >>> ensStatsAdd(stats, isonvar)
+    '''
+    valid = ~npy.ma.getmaskarray(field)
+    x     = npy.ma.filled(field, 0.).astype('float64')
+    stats['n'] += valid
+    delta = npy.where(valid, x - stats['mean'], 0.)
+    stats['mean'] += delta/npy.maximum(stats['n'], 1)
+    if 'M2' in stats:
+        stats['M2'] += delta*npy.where(valid, x - stats['mean'], 0.)
+    if 'max' in stats:
+        npy.maximum(stats['max'], npy.where(valid, x, -npy.inf), stats['max'])
+    return stats
+
+def ensStatsMerge(stats, other, sign=1):
+    '''
+    The ensStatsMerge() function merges the running statistics of two disjoint sets of members
+    (parallel update of count, mean and sum of squared deviations, running max), or removes the
+    members of other from stats (sign=-1), so that ensemble statistics can be updated by sets of members
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - stats                     - running statistics from ensStatsInit/ensStatsAdd (updated in place)
+    - other                     - running statistics of other members (same shape and statistics)
+    - sign <optional>           - 1 adds the members of other, -1 removes them (they must be included in stats)
+
+    Output:
+    - stats                     - updated statistics
+
+    Usage:
+    ------
+    >>> ensStatsMerge(statsMME, statsModel)       ; # add a model
+    >>> ensStatsMerge(statsMME, statsModel, -1)   ; # remove it
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - A running max cannot be removed from (ValueError)
+    - M2 is clamped to 0 after removing members (round-off), and set to 0 where one member is left
+    '''
+    nb = other['n']
+    if sign > 0:
+        na = stats['n']
+        n  = na + nb
+        delta = other['mean'] - stats['mean']
+        stats['mean'] += npy.where(nb > 0, delta*nb/npy.maximum(n, 1), 0.)
+        if 'M2' in stats:
+            stats['M2'] += other['M2'] + npy.where(nb > 0, delta**2*na*nb/npy.maximum(n, 1), 0.)
+        if 'max' in stats:
+            npy.maximum(stats['max'], other['max'], stats['max'])
+    else:
+        if 'max' in stats:
+            raise ValueError('ensStatsMerge: members cannot be removed from a running max')
+        n  = stats['n'] - nb
+        left = n > 0
+        mean = npy.where(left, (stats['n']*stats['mean'] - nb*other['mean'])/npy.maximum(n, 1), 0.)
+        if 'M2' in stats:
+            delta = other['mean'] - mean
+            M2 = stats['M2'] - other['M2'] - delta**2*n*nb/npy.maximum(stats['n'], 1)
+            # round-off can leave M2 slightly negative, and M2 is 0 for a single member
+            stats['M2'][...] = npy.where(n > 1, npy.maximum(M2, 0.), 0.)
+        stats['mean'][...] = mean
+    stats['n'][...] = n
+    return stats
+
+def ensStatsGet(stats, stat, valmask):
+    '''
+    The ensStatsGet() function returns a statistic accross members from running ensemble statistics
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - stats                     - running statistics from ensStatsInit/ensStatsAdd
+    - stat                      - 'mean', 'std' (population std, as genutil.statistics.std) or 'max'
+    - valmask                   - mask value
+
+    Output:
+    - field                     - masked array (masked and set to valmask where no valid member)
+
+    Usage:
+    ------
+    >>> isonVarStd = ensStatsGet(stats, 'std', valmask)
+    '''
+    n = stats['n']
+    if stat == 'std':
+        field = npy.sqrt(npy.maximum(stats['M2'], 0.)/npy.maximum(n, 1))
+    else:
+        field = stats[stat]
+    nomem = n == 0
+    return npy.ma.array(npy.where(nomem, valmask, field), mask=nomem, fill_value=valmask)
+
+# ------------------------------------------------
+#  Time of Emergence
+# ------------------------------------------------
+
+# findToEMulti and findToE are in libToECore.py (python 2 and 3), shared with Yona_analysis/programs/libToE.py
+from libToECore import findToE,findToEMulti
@@ -0,0 +1,835 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+'''
+ libDensityIO.py contains the input/output helpers used by binDensity.py and libDensityPostpro.py
+
+EG  18 Oct 2026     - Started file: asynchronous buffered writer for densityBin outputs
+EG  18 Oct 2026     - Added ChunkStore: directory based chunked array store for monthly outputs
+EG  18 Oct 2026     - Added NetcdfReader: direct netCDF hyperslab reader resolving CDML (.xml) aggregations
+EG  18 Oct 2026     - Added ReadAhead: read of the next time block on a background thread (prefetch)
+EG  18 Oct 2026     - MV2 imported where used (no cdms2 load on import)
+EG  18 Oct 2026     - Added NetcdfWriter: hyperslab writer for outputs computed by blocks (e.g. of levels)
+EG  18 Oct 2026     - Added ensStatsWrite/ensStatsRead: running ensemble statistics stored for later merges
+'''
+
+import ast,gc,json,os,re,threading,traceback
+import xml.etree.ElementTree as ET
+import numpy as npy
+try:
+    from netCDF4 import Dataset
+except ImportError:
+    Dataset = None ; # NetcdfReader/NetcdfWriter not available
+try:
+    import Queue as queue ; # python 2
+except ImportError:
+    import queue
+
+
+class AsyncWriter(object):
+    '''
+    The AsyncWriter() class writes cdms2 variables to open cdms2 files on a
+    background thread, so that compression and I/O of a time chunk overlap with
+    the binning of the next one
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - maxsize <optional>    - size of the bounded write queue (number of variables) - 0 writes
+                              synchronously in the calling thread
+    - nbatch <optional>     - number of time chunks of small (zonal) fields gathered in a single write
+
+    Usage:
+    ------
+    >>> from libDensityIO import AsyncWriter
+    >>> writer = AsyncWriter(maxsize=8, nbatch=4)
+    >>> with writer.lock:
+    >>>     thetao = ft('thetao', time = slice(trmin,trmax))
+    >>> writer.write(outFile_f, depthbini, index = (trmin-tmin)/12)
+    >>> writer.write(outFile_f, dbz, index = (trmin-tmin)/12, batch=True)
+    >>> writer.sync(outFile_f)
+    >>> writer.call(store.writeChunk, 'isondepth', trmin-tmin, data)
+    >>> writer.close()
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - The float32 cast is done in write() so that the queued variable is a snapshot of the
+      caller's array, results are identical to direct outFile_f.write(var.astype('float32'),..)
+    - The netCDF library is not thread safe: all other reads/writes on cdms2 files done while
+      the writer is active must hold writer.lock
+    - Batched variables are written when nbatch consecutive chunks are gathered, or at close()
+    - close() must be called (in a finally clause) to flush the queue and batches, it re-raises
+      any exception caught on the writer thread; when the caller is already handling an error,
+      close(raiseError=False) only prints it so that the original traceback is kept
+    '''
+
+    def __init__(self, maxsize=8, nbatch=1):
+        self.lock    = threading.RLock()
+        self.nbatch  = max(int(nbatch),1)
+        self._batch  = {}   ; # (file,varid) -> [file, index, varid, [variables]]
+        self._order  = []   ; # batch keys in order of first write
+        self._error  = None
+        self._closed = False
+        if maxsize > 0:
+            self._queue  = queue.Queue(maxsize)
+            self._thread = threading.Thread(target=self._run, name='densityBinWriter')
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._queue  = None
+            self._thread = None
+
+    def write(self, fileh, var, index=None, batch=False):
+        '''
+        Queue var (cast to float32) for writing to fileh, appended along time at index
+        (index=None writes a variable without extension). batch=True gathers the variable
+        with the following chunks of the same variable before writing.
+        '''
+        self._check()
+        var = var.astype('float32')
+        if not batch or index is None or self.nbatch == 1:
+            self._put(('write', fileh, var, index))
+            return
+        key = (id(fileh), var.id)
+        if key in self._batch:
+            buf = self._batch[key]
+            # Only gather contiguous chunks
+            if buf[1] + sum([v.shape[0] for v in buf[3]]) != index:
+                self._flushBatch(key)
+        if key not in self._batch:
+            self._batch[key] = [fileh, index, var.id, []]
+            self._order.append(key)
+        self._batch[key][3].append(var)
+        if len(self._batch[key][3]) >= self.nbatch:
+            self._flushBatch(key)
+
+    def call(self, func, *args):
+        '''
+        Queue a call func(*args) on the writer thread (e.g. ChunkStore.writeChunk)
+        '''
+        self._check()
+        self._put(('call', func, args, None))
+
+    def sync(self, fileh):
+        '''
+        Queue a sync of fileh (pending batches are kept until full)
+        '''
+        self._check()
+        self._put(('sync', fileh, None, None))
+
+    def close(self, raiseError=True):
+        '''
+        Flush pending batches and queue, stop the writer thread and re-raise any writer error
+        (printed only if raiseError is False)
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._error is None:
+                for key in list(self._order):
+                    self._flushBatch(key)
+        finally:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+            self._batch = {} ; self._order = [] ; gc.collect()
+        if raiseError:
+            self._check()
+        elif self._error is not None:
+            print ' ** Error on densityBin writer thread (not raised): ',self._error
+
+    # Internals
+    def _flushBatch(self, key):
+        fileh, index, varid, varl = self._batch.pop(key)
+        self._order.remove(key)
+        if len(varl) == 1:
+            var = varl[0]
+        else:
+            # Concatenate along time (the time axis is merged too)
+            import MV2 as mv
+            var = mv.concatenate(varl, axis=0)
+            var.id = varid
+            for att in varl[0].attributes.keys():
+                setattr(var, att, varl[0].attributes[att])
+        del(varl)
+        self._put(('write', fileh, var, index))
+
+    def _put(self, item):
+        if self._queue is None:
+            self._do(item)
+        else:
+            self._queue.put(item)
+            self._check()
+
+    def _do(self, item):
+        task, fileh, var, index = item
+        if task == 'call':
+            fileh(*var)
+            return
+        with self.lock:
+            if task == 'sync':
+                fileh.sync()
+            elif index is None:
+                fileh.write(var)
+            else:
+                fileh.write(var, extend = 1, index = index)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is None:
+                try:
+                    self._do(item)
+                except Exception,err:
+                    traceback.print_exc()
+                    self._error = err
+            # Drop the reference so memory is released as soon as written
+            del(item)
+
+    def _check(self):
+        if self._error is not None:
+            print ' ** Error on densityBin writer thread: ',self._error
+            raise self._error
+
+
+class ChunkStore(object):
+    '''
+    The ChunkStore() class is a directory based chunked array store (Zarr-like) made of
+    plain .npy files and JSON metadata. Arrays are chunked along their first (time)
+    dimension and each chunk is a separate file, so that chunks can be written
+    independently (and concurrently) and read back as memory-mapped slices
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - path                  - store directory
+    - mode <optional>       - 'w' (create, an existing store is removed), 'a' (append) or 'r' (read)
+
+    Layout:
+    ------
+    - path/store.json                   - global attributes and list of arrays
+    - path/<name>/array.json            - shape, chunks, dtype, fill value, axes and attributes of array
+    - path/<name>/<t0>.npy              - chunk starting at index t0 along first dimension
+    - path/axes/<axis>.json|<t0>.npy    - axis values (and attributes), time axis chunked as arrays
+
+    Usage:
+    ------
+    >>> from libDensityIO import ChunkStore
+    >>> store = ChunkStore('out.mo.store', 'w')
+    >>> store.createArray('isondepth', [ntime,nrho,nlat,nlon], 12, ['time','lev','lat','lon'], {'units':'m'})
+    >>> store.writeChunk('isondepth', 0, depthBin)
+    >>> store = ChunkStore('out.mo.store', 'r')
+    >>> depth = store.read('isondepth', slice(24,36))
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - Masked values are written as fill_value and masked again on read
+    - Metadata are written once at creation, writers of different chunks do not share any file
+      (chunks are written to a temporary file and renamed when complete)
+    '''
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        if mode == 'w':
+            if os.path.isdir(path):
+                for root,dirs,files in os.walk(path, topdown=False):
+                    for f in files:
+                        os.remove(os.path.join(root,f))
+                    for d in dirs:
+                        os.rmdir(os.path.join(root,d))
+                os.rmdir(path)
+            os.makedirs(os.path.join(path,'axes'))
+            self.attributes = {}
+            self.arrays     = []
+            self._writeMeta()
+        else:
+            meta = self._readJson(os.path.join(path,'store.json'))
+            self.attributes = meta['attributes']
+            self.arrays     = meta['arrays']
+
+    def setAttributes(self, attributes):
+        '''
+        Add global attributes (dictionary) to the store
+        '''
+        for key in attributes.keys():
+            self.attributes[key] = attributes[key]
+        self._writeMeta()
+
+    def createArray(self, name, shape, chunks, axes, attributes={}, fill_value=1.e20, dtype='float32'):
+        '''
+        Create array name of shape, chunked by chunks along the first dimension
+        '''
+        os.makedirs(os.path.join(self.path,name))
+        meta = {'shape':[int(n) for n in shape], 'chunks':int(chunks), 'dtype':dtype,
+                'fill_value':fill_value, 'axes':list(axes), 'attributes':self._jsonAtts(attributes)}
+        self._writeJson(os.path.join(self.path,name,'array.json'), meta)
+        if name not in self.arrays:
+            self.arrays.append(name)
+            self._writeMeta()
+
+    def setAxis(self, name, values, attributes={}):
+        '''
+        Write (non chunked) axis values and attributes (values=None for a chunked axis,
+        whose values are written with writeChunk)
+        '''
+        if values is not None:
+            npy.save(os.path.join(self.path,'axes',name+'.npy'), npy.asarray(values))
+        self._writeJson(os.path.join(self.path,'axes',name+'.json'), self._jsonAtts(attributes))
+
+    def writeChunk(self, name, index, data):
+        '''
+        Write data (masked array) at index along the first dimension of array name
+        (name can be a time axis in axes/, then data are the axis values)
+        '''
+        if os.path.isdir(os.path.join(self.path,name)):
+            meta = self._readJson(os.path.join(self.path,name,'array.json'))
+            data = npy.ma.filled(npy.ma.asarray(data).astype(meta['dtype']), meta['fill_value'])
+            dirc = os.path.join(self.path,name)
+        else:
+            data = npy.asarray(data)
+            dirc = os.path.join(self.path,'axes',name)
+            if not os.path.isdir(dirc):
+                try:
+                    os.makedirs(dirc)
+                except OSError:
+                    pass ; # created by a concurrent writer
+        fileo = os.path.join(dirc,'%09d.npy' % index)
+        filet = fileo+'.tmp%d' % os.getpid()
+        f = open(filet,'wb')
+        npy.save(f, data)
+        f.close()
+        os.rename(filet, fileo)
+
+    def chunkList(self, name):
+        '''
+        Return the sorted list of chunk start indices written for array (or chunked axis) name
+        '''
+        dirc = os.path.join(self.path,name)
+        if not os.path.isdir(dirc):
+            dirc = os.path.join(self.path,'axes',name)
+        return sorted([int(f[:-4]) for f in os.listdir(dirc) if f.endswith('.npy')])
+
+    def info(self, name):
+        '''
+        Return the metadata of array name
+        '''
+        return self._readJson(os.path.join(self.path,name,'array.json'))
+
+    def axis(self, name):
+        '''
+        Return values and attributes of axis name (chunked axes are concatenated)
+        '''
+        fileo = os.path.join(self.path,'axes',name+'.npy')
+        if os.path.isfile(fileo):
+            values = npy.load(fileo)
+        else:
+            values = npy.concatenate([npy.load(os.path.join(self.path,'axes',name,'%09d.npy' % i))
+                                      for i in self.chunkList(name)])
+        attributes = {}
+        filej = os.path.join(self.path,'axes',name+'.json')
+        if os.path.isfile(filej):
+            attributes = self._readJson(filej)
+        return values, attributes
+
+    def read(self, name, tslice=None):
+        '''
+        Read array name over tslice (slice along the first dimension) as a masked array,
+        chunks are memory-mapped so only the requested slice is read
+        '''
+        meta   = self.info(name)
+        ntot   = meta['shape'][0]
+        if tslice is None:
+            tslice = slice(0,ntot)
+        t0, t1, step = tslice.indices(ntot)
+        out = npy.ma.masked_all([len(range(t0,t1,step))]+meta['shape'][1:], dtype=meta['dtype'])
+        for ic in self.chunkList(name):
+            chunk = npy.load(os.path.join(self.path,name,'%09d.npy' % ic), mmap_mode='r')
+            idx   = [(i,t-ic) for i,t in enumerate(range(t0,t1,step)) if ic <= t < ic+chunk.shape[0]]
+            if idx:
+                out[[i for i,_ in idx]] = npy.array(chunk[[k for _,k in idx]])
+            del(chunk)
+        out = npy.ma.masked_where(out.filled(meta['fill_value']) >= meta['fill_value']/10., out, copy=False)
+        out.fill_value = meta['fill_value']
+        return out
+
+    # Internals
+    def _writeMeta(self):
+        self._writeJson(os.path.join(self.path,'store.json'), {'attributes':self.attributes, 'arrays':self.arrays})
+
+    def _jsonAtts(self, attributes):
+        # numpy scalars and arrays to python types
+        atts = {}
+        for key in attributes.keys():
+            val = attributes[key]
+            if isinstance(val, npy.ndarray):
+                val = val.tolist()
+            elif isinstance(val, npy.generic):
+                val = val.item()
+            atts[key] = val
+        return atts
+
+    def _writeJson(self, fileo, obj):
+        filet = fileo+'.tmp%d' % os.getpid()
+        f = open(filet,'w')
+        json.dump(obj, f, indent=1, sort_keys=True)
+        f.close()
+        os.rename(filet, fileo)
+
+    def _readJson(self, fileo):
+        f = open(fileo,'r')
+        obj = json.load(f)
+        f.close()
+        return obj
+
+
+class ReadAhead(object):
+    '''
+    The ReadAhead() class runs a read function on a background thread so that the
+    next time block is read while the current one is computed (prefetch)
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - func, *args           - read function and its arguments, func(*args) is called on the thread
+
+    Usage:
+    ------
+    >>> from libDensityIO import ReadAhead
+    >>> nextBlock = ReadAhead(readBlock, t1, t2)
+    >>> ... compute block [t0,t1[ ...
+    >>> fields = nextBlock.get()
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - get() waits for the read and returns its result, or re-raises the exception of the read
+    - As for AsyncWriter, cdms2 reads in func and other file accesses must share a lock
+    '''
+
+    def __init__(self, func, *args):
+        self._result = None
+        self._error  = None
+        self._thread = threading.Thread(target=self._run, args=(func, args), name='readAhead')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get(self):
+        '''
+        Wait for the read and return its result
+        '''
+        self._thread.join()
+        if self._error is not None:
+            print ' ** Error on read ahead thread: ',self._error
+            raise self._error
+        result = self._result
+        self._result = None
+        return result
+
+    # Internals
+    def _run(self, func, args):
+        try:
+            self._result = func(*args)
+        except Exception,err:
+            traceback.print_exc()
+            self._error = err
+
+
+def cdmlFileMap(fileName, varName):
+    '''
+    The cdmlFileMap() function resolves a CDML (cdscan .xml) aggregation into the list of
+    underlying netCDF files holding variable varName and their time index ranges
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fileName      - .xml aggregation (or a single netCDF file)
+    - varName       - variable name
+
+    Output:
+    - fileMap       - list of [t0, t1, path], time indices [t0,t1[ of the aggregation held in path
+
+    Usage:
+    ------
+    >>> from libDensityIO import cdmlFileMap
+    >>> cdmlFileMap('cmip5.IPSL-CM5A-LR.historical.r1i1p1.mo.ocn.Omon.thetao.ver-1.latestX.xml','thetao')
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version, parses the cdms_filemap/directory attributes of the dataset
+    - EG  18 Oct 2026 - entries without time range ('-') get the time length of their file
+    - Aggregations split along levels are not supported
+    '''
+    if not fileName.endswith('.xml'):
+        ds = Dataset(fileName)
+        ntime = ds.variables[varName].shape[0]
+        ds.close()
+        return [[0, ntime, fileName]]
+    root = ET.parse(fileName).getroot()
+    directory = root.get('directory')
+    filemap   = root.get('cdms_filemap')
+    for attr in root.findall('attr'):
+        if attr.get('name') == 'directory' and directory is None:
+            directory = attr.text.strip()
+        if attr.get('name') == 'cdms_filemap' and filemap is None:
+            filemap = attr.text.strip()
+    if directory is None:
+        directory = os.path.dirname(fileName)
+    # [[[var1,var2],[[t0,t1,l0,l1,-,file1],...]],...] -> python list of strings
+    fmap = ast.literal_eval(re.sub(r'([^\[\],\s]+)', r"'\1'", filemap))
+    fileMap = []
+    for varList,entries in fmap:
+        if varName not in varList:
+            continue
+        for entry in entries:
+            if entry[2] != '-' or entry[3] != '-':
+                raise ValueError('cdmlFileMap: aggregation split along levels not supported ('+fileName+')')
+            path = entry[-1]
+            if not os.path.isabs(path):
+                path = os.path.join(directory, path)
+            if entry[0] == '-':
+                # no time index range in the map: whole file, length from its time dimension
+                ds = Dataset(path)
+                ntime = ds.variables[varName].shape[0]
+                ds.close()
+                fileMap.append([0, ntime, path])
+            else:
+                fileMap.append([int(entry[0]), int(entry[1]), path])
+    if not fileMap:
+        raise ValueError('cdmlFileMap: '+varName+' not found in '+fileName)
+    fileMap.sort()
+    return fileMap
+
+
+class NetcdfReader(object):
+    '''
+    The NetcdfReader() class reads time chunks of a 4D variable (time,lev,lat,lon) directly
+    from the netCDF files of a CDML aggregation, into a preallocated array. Packed variables are
+    unpacked (scale_factor, add_offset), mask and unit fixes are applied in place (same corrections
+    as maskValCorr/maskVal and fixVarUnits)
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fileName              - .xml aggregation (or netCDF file)
+    - varName               - variable name ('thetao','so','vo'..)
+    - valmask <optional>    - output mask value
+    - fixUnits <optional>   - apply unit corrections (K -> degrees_C, mass fraction -> PSS-78)
+
+    Usage:
+    ------
+    >>> from libDensityIO import NetcdfReader
+    >>> readT  = NetcdfReader(fileT,'thetao')
+    >>> thetao = readT.read(trmin,trmax)                    ; # [time,lev,lat,lon] masked array
+    >>> thetao = readT.read(trmin,trmax,rows=slice(j0,j1))  ; # latitude band
+    >>> timeValues, timeAtts = readT.time(trmin,trmax)
+    >>> lat = readT.dataset().variables['lat'][:]          ; # axes and global attributes (first file)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - EG  18 Oct 2026 - also reads 3D (time,lat,lon) variables (levels is then ignored)
+    - EG  18 Oct 2026 - dataset() gives the first file for axes and global attributes
+    - Files are opened once (when first needed) and kept open until close()
+    - The returned array is a view of a buffer reused by the next read() of the same shape,
+      copy it if it must survive the next read (readers of several files can share one buffer
+      with read(..., out=buffer))
+    - Unit tests mirror durolib.fixVarUnits: so with max and mean < 1 is multiplied by 1000,
+      thetao with max > 50 and mean > 265 is converted from K
+    - EG  18 Oct 2026 - the unit fix is decided once per file (on its first time step) and applied
+      to all chunks and bands of the file, packed (short) variables are unpacked as by cdms
+    '''
+
+    def __init__(self, fileName, varName, valmask=1.e20, fixUnits=True):
+        if Dataset is None:
+            raise ImportError('NetcdfReader requires the netCDF4 module')
+        self.varName  = varName
+        self.valmask  = valmask
+        self.fixUnits = fixUnits
+        self.fileMap  = cdmlFileMap(fileName, varName)
+        self._ds      = {}
+        self._buf     = None
+        self._units   = {} ; # unit fix of each file
+        var = self._var(self.fileMap[0][2])
+        self.shape      = [self.fileMap[-1][1]] + list(var.shape[1:])
+        self.attributes = dict([(att, var.getncattr(att)) for att in var.ncattrs()
+                                if att not in ['scale_factor','add_offset']])
+        self.unitsFixed = False
+        # unpacked values are float (as read by cdms)
+        self._dtype = var.dtype
+        if 'scale_factor' in var.ncattrs() or 'add_offset' in var.ncattrs():
+            self._dtype = npy.dtype('float32')
+
+    def read(self, t0, t1, levels=None, rows=None, cols=None, out=None):
+        '''
+        Read time indices [t0,t1[ (optionally a slice of levels, rows (lat) or columns (lon))
+        into the reader buffer, or into out (array of the shape of the block) if given
+        '''
+        sel = [levels, rows, cols][4-len(self.shape):] ; # no levels for (time,lat,lon) variables
+        sel = [slice(None) if sl is None else sl for sl in sel]
+        shape = [t1-t0] + [len(range(*sl.indices(n))) for sl,n in zip(sel, self.shape[1:])]
+        if out is not None:
+            if list(out.shape) != shape:
+                raise ValueError('NetcdfReader: out has shape '+str(list(out.shape))+', block is '+str(shape))
+            data = out
+        else:
+            if self._buf is None or list(self._buf.shape) != shape:
+                self._buf = None ; gc.collect()
+                self._buf = npy.empty(shape, dtype=self._dtype)
+            data = self._buf
+        for f0,f1,path in self.fileMap:
+            a = max(t0,f0) ; b = min(t1,f1)
+            if a >= b:
+                continue
+            var = self._var(path)
+            block = data[a-t0:b-t0]
+            block[...] = var[(slice(a-f0,b-f0),)+tuple(sel)]
+            self._unpack(var, block)
+            if self.fixUnits:
+                self._fixUnits(path, block)
+        data = npy.ma.masked_equal(data, self.valmask, copy=False)
+        data.fill_value = self.valmask
+        return data
+
+    def time(self, t0, t1):
+        '''
+        Return time values of indices [t0,t1[ and time axis attributes
+        '''
+        values = []
+        for f0,f1,path in self.fileMap:
+            a = max(t0,f0) ; b = min(t1,f1)
+            if a < b:
+                values.append(npy.array(self._dataset(path).variables['time'][a-f0:b-f0]))
+        timev = self._dataset(self.fileMap[0][2]).variables['time']
+        atts  = dict([(att, timev.getncattr(att)) for att in timev.ncattrs() if att in ['units','calendar','long_name','standard_name']])
+        return npy.concatenate(values), atts
+
+    def dataset(self):
+        '''
+        Return the netCDF4 Dataset of the first file (axes and global attributes), closed by close()
+        '''
+        return self._dataset(self.fileMap[0][2])
+
+    def close(self):
+        for path in self._ds.keys():
+            self._ds[path].close()
+        self._ds = {} ; self._buf = None
+
+    # Internals
+    def _dataset(self, path):
+        if path not in self._ds:
+            self._ds[path] = Dataset(path)
+        return self._ds[path]
+
+    def _var(self, path):
+        var = self._dataset(path).variables[self.varName]
+        var.set_auto_maskandscale(False)
+        return var
+
+    def _unpack(self, var, block):
+        # Mask fixes in place: fill/missing values and NaN set to valmask, packed values unpacked
+        masked = npy.isnan(block)
+        for att in ['_FillValue','missing_value']:
+            if att in var.ncattrs():
+                masked |= block == var.getncattr(att)
+        if 'scale_factor' in var.ncattrs():
+            block *= var.getncattr('scale_factor')
+        if 'add_offset' in var.ncattrs():
+            block += var.getncattr('add_offset')
+        masked |= npy.abs(block) > abs(self.valmask)/10
+        block[masked] = self.valmask
+
+    def _fixUnits(self, path, block):
+        # In place version of durolib.fixVarUnits for the ocean variables used here, decided once per
+        # file on its first time step so that all chunks and bands of a file get the same fix
+        if path not in self._units:
+            var   = self._var(path)
+            first = npy.array(var[0:1], dtype='float64')
+            self._unpack(var, first)
+            first = npy.ma.masked_equal(first, self.valmask)
+            fix = None
+            if first.count() > 0:
+                if self.varName in ['so','sos'] and first.max() < 1. and first.mean() < 1.:
+                    fix = 'so'
+                elif self.varName in ['thetao','tos'] and first.max() > 50. and first.mean() > 265.:
+                    fix = 'thetao'
+            self._units[path] = fix
+        fix = self._units[path]
+        if fix is None:
+            return
+        valid = block != self.valmask
+        if fix == 'so':
+            block[valid] *= 1000.
+        else:
+            block[valid] -= 273.15
+        self.unitsFixed = True
+
+
+class NetcdfWriter(object):
+    '''
+    The NetcdfWriter() class writes variables of a netCDF file by hyperslabs (blocks starting at
+    any index along each dimension), so that outputs computed by blocks of levels can be written
+    directly in their final [time,lev,lat,lon] order
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fileName              - netCDF file (an existing file is removed)
+    - comp <optional>       - deflate level (shuffle and deflate as the cdms2 netCDF flags), 0 for no compression
+    - valmask <optional>    - fill value, masked values are written as valmask
+    - attributes <optional> - global attributes
+
+    Usage:
+    ------
+    >>> from libDensityIO import NetcdfWriter
+    >>> out = NetcdfWriter(outFile, comp=1)
+    >>> out.createAxis('time', range(timN), {'units':'years since 1861','axis':'T'})
+    >>> out.createAxis('lev', sigmaGrd[:], {'units':'kg m-3'}, bounds=sigmaGrd.getBounds())
+    >>> out.createVariable('isonpercent', ['time','lev','lat','lon'], {'units':'%'}, chunks=[1,1,latN,lonN])
+    >>> out.write('isonpercent', percent, [0,ib0])  ; # percent[time,ib0:ib1,lat,lon]
+    >>> out.close()
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - write() takes the start index of the block along the leading dimensions (missing ones are 0),
+      the count is the shape of the data
+    - Axes get a bounds_<axis> variable (as written by cdms2) when bounds are given
+    '''
+
+    def __init__(self, fileName, comp=1, valmask=1.e20, attributes={}):
+        if Dataset is None:
+            raise ImportError('NetcdfWriter requires the netCDF4 module')
+        if os.path.isfile(fileName):
+            os.remove(fileName)
+        self.fileName = fileName
+        self.comp     = comp
+        self.valmask  = valmask
+        self._ds      = Dataset(fileName, 'w', format='NETCDF4')
+        if attributes:
+            self._ds.setncatts(attributes)
+
+    def createAxis(self, name, values, attributes={}, bounds=None, unlimited=False):
+        '''
+        Create dimension name and its coordinate variable (and bounds_<name> if bounds are given)
+        '''
+        values = npy.asarray(values)
+        atts   = dict([(att, attributes[att]) for att in attributes.keys() if att[0] != '_' and att != 'bounds'])
+        self._ds.createDimension(name, None if unlimited else len(values))
+        axis = self._ds.createVariable(name, values.dtype, (name,))
+        axis[:] = values
+        if bounds is not None:
+            bounds = npy.asarray(bounds)
+            if 'bound' not in self._ds.dimensions:
+                self._ds.createDimension('bound', 2)
+            axisb = self._ds.createVariable('bounds_'+name, bounds.dtype, (name,'bound'))
+            axisb[:] = bounds
+            atts['bounds'] = 'bounds_'+name
+        axis.setncatts(atts)
+
+    def createVariable(self, name, dims, attributes={}, chunks=None, dtype='float32'):
+        '''
+        Create variable name on dimensions dims (created with createAxis), chunked as chunks
+        '''
+        fill = npy.array(self.valmask, dtype=dtype)
+        var  = self._ds.createVariable(name, dtype, tuple(dims), zlib=self.comp > 0, complevel=max(self.comp,1),
+                                       shuffle=self.comp > 0, chunksizes=chunks, fill_value=fill)
+        var.set_auto_maskandscale(False)
+        atts = dict([(att, attributes[att]) for att in attributes.keys() if att[0] != '_'])
+        atts['missing_value'] = fill
+        var.setncatts(atts)
+
+    def write(self, name, data, start=[]):
+        '''
+        Write data (masked array or array) to the block of name starting at index start
+        '''
+        var  = self._ds.variables[name]
+        data = npy.ma.filled(data, self.valmask).astype(var.dtype)
+        if data.ndim != len(var.dimensions):
+            raise ValueError('NetcdfWriter: '+name+' has '+str(len(var.dimensions))+' dimensions, data has '+str(data.ndim))
+        start = list(start) + [0]*(data.ndim-len(start))
+        var[tuple([slice(i0, i0+n) for i0,n in zip(start, data.shape)])] = data
+
+    def sync(self):
+        self._ds.sync()
+
+    def close(self):
+        self._ds.close()
+
+
+def ensStatsWrite(fileName, stats, meta={}):
+    '''
+    The ensStatsWrite() function stores running ensemble statistics (ensStatsInit/ensStatsAdd) to
+    disk, so that they can be merged later with other members or models (ensStatsMerge)
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fileName              - .npz file (written then renamed, a partial file is never read)
+    - stats                 - dictionary of running statistics (name -> ensStatsInit dictionary)
+    - meta <optional>       - dictionary of json serialisable information (files, years, attributes..)
+
+    Usage:
+    ------
+    >>> from libDensityIO import ensStatsWrite, ensStatsRead
+    >>> ensStatsWrite(outFile+'.partials.npz', {'isonso.ave':statsAve}, {'years':years})
+    >>> stats, meta = ensStatsRead(outFile+'.partials.npz')
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - Compressed, mean and M2 are stored in float32 when this is exact (e.g. statistics of one member)
+    '''
+    arrays = {'meta':npy.array(json.dumps(meta, sort_keys=True))}
+    for name in stats.keys():
+        for stat in stats[name].keys():
+            a = stats[name][stat]
+            if a.dtype == 'float64' and npy.array_equal(a.astype('float32'), a):
+                a = a.astype('float32')
+            arrays[name+'|'+stat] = a
+    filet = fileName[:-4]+'.tmp%d.npz' % os.getpid()
+    npy.savez_compressed(filet, **arrays)
+    os.rename(filet, fileName)
+
+def ensStatsRead(fileName):
+    '''
+    Read running ensemble statistics written by ensStatsWrite, returns [stats, meta]
+    '''
+    npz   = npy.load(fileName)
+    stats = {}
+    for key in npz.files:
+        if key == 'meta':
+            continue
+        name,stat = key.split('|')
+        a = npz[key]
+        if stat != 'n':
+            a = a.astype('float64')
+        stats.setdefault(name, {})[stat] = a
+    meta = json.loads(str(npz['meta']))
+    npz.close()
+    return stats, meta
@@ -1,47 +1,263 @@
 import os,sys,gc,glob
-import cdms2 as cdm
-import cdutil as cdu
-import MV2 as mv
 import numpy as npy
 from string import replace
-from genutil import statistics
-from libToE import findToE
+from libDensityCore import bowlMask,ensStatsAdd,ensStatsGet,ensStatsInit,ensStatsMerge,findToEMulti,maskVal ; # numpy only kernels
+from libDensityIO import NetcdfReader,NetcdfWriter,ensStatsRead,ensStatsWrite
 import time as timc
+# cdms2, cdutil, MV2 and genutil are imported in the functions using them (lazy imports)
 
 
 
-def maskVal(field,valmask):
+def readEnsemble2D(listFiles, inDir, varList, varFill, years, mme, valmask):
     '''
-    The maskVal() function applies a mask to an array provided
+    The readEnsemble2D() function reads the members of a rhon/lat density bined ensemble one at a time:
+    each member file (and its 1D sibling) is opened once and each variable is read with a single
+    contiguous time slice. It is a generator: only one member is held in memory
 
     Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
-    Co-author: Paul J. Durack : pauldurack@llnl.gov : @durack1.
 
-    Created on Sun Sep 14 21:13:30 2014
+    Created on Sun Oct 18 2026
 
     Inputs:
+    -------
+    - listFiles(str)         - the list of files to be read
+    - inDir(str)             - input directory where files are stored
+    - varList(str)           - variables to read
+    - varFill                - fill value of each variable (valmask keeps the mask)
+    - years(t1,t2)           - years for slice read (t2 <= 0: last -t2 years of each member)
+    - mme(bool)              - multi-model mean (read <var>Agree and <var>Bowl fields)
+    - valmask                - mask value
+
+    Output (yields for each member):
+    - mem                    - dictionary with
+                               'var', 'agree', 'bowl2D': dictionaries of [time,basin,rho,lat] arrays (per variable)
+                               'percent': non-masked bins of first variable (last year) [basin,rho,lat]
+                               'bowl': ptopsigma of 1D file [time,basin,lat] (not mme)
+                               'atts': (id, long_name, units) per variable, 'model': model of the member,
+                               'window': [t1,t2] read for the member, 'tmax': length of the member time axis
+                               stops before the member if members have different time axes
+
+    Usage:
     ------
-    - field     - 1D/2D/3D array
-    - valmask    - 1D scalar of mask value
+    >>> from libDensityPostpro import readEnsemble2D
+    >>> for mem in readEnsemble2D(listFiles, inDir, ['isondepth','isonso'], [0.,valmask], [0,150], False, valmask):
+    ...     ensStatsAdd(stats, mem['var']['isonso'])
+
+    Notes:
+    -----
+    - EG 18 Oct 2026   - Initial function write (reads of mmeAveMsk2D moved out of the loop on variables)
+    - EG 18 Oct 2026   - yield members one at a time (memory independant of the number of members)
+    '''
+    import cdms2 as cdm
+    import MV2 as mv
+
+    t1 = years[0]
+    t2 = years[1]
+    if t2 <= 0:
+        useLastYears = True
+        t2 = -t2
+    else:
+        useLastYears = False
+    t20  = t2
+    timN = t2-t1
+    varsig = 'ptopsigma'
+    for i,fileName in enumerate(listFiles):
+        ft     = cdm.open(inDir+'/'+fileName)
+        mem    = {'var':{}, 'agree':{}, 'bowl2D':{}, 'atts':{}, 'model':fileName.split('.')[1]}
+        timeax = ft.getAxis('time')
+        file1d = replace(inDir+'/'+fileName,'2D','1D')
+        if os.path.isfile(file1d):
+            f1d = cdm.open(file1d)
+        else:
+            print 'ERROR:',file1d,'missing (if mme, run 1D first)'
+            sys.exit(1)
+        tmax = timeax.shape[0]
+        if i == 0:
+            tmax0 = tmax
+        #adapt [t1,t2] time bounds to piControl last NN years
+        if useLastYears:
+            t1 = tmax-t20
+            t2 = tmax
+        else:
+            if tmax != tmax0:
+                print 'wrong time axis: exiting...'
+                ft.close() ; f1d.close()
+                return
+        for iv,var in enumerate(varList):
+            isonRead = ft(var, time = slice(t1,t1+timN))
+            if varFill[iv] != valmask:
+                mem['var'][var] = npy.ma.array(isonRead.filled(varFill[iv]), dtype='float32')
+            else:
+                mem['var'][var] = npy.ma.array(isonRead, dtype='float32')
+            mem['atts'][var] = [isonRead.id, isonRead.long_name, isonRead.units]
+            # percentage of non-masked points accros MME (mask of last year of first variable)
+            if iv == 0:
+                maskvar = npy.ma.getmaskarray(mv.masked_values(isonRead.data[-1],valmask))
+                mem['percent'] = npy.float32(npy.equal(maskvar,0))
+            if mme:
+                mem['agree'][var]  = ft(var+'Agree', time = slice(t1,t2))
+                mem['bowl2D'][var] = ft(var+'Bowl' , time = slice(t1,t2))
+            del(isonRead)
+        if not mme:
+            mem['bowl'] = f1d(varsig, time = slice(t1,t2))
+        ft.close()
+        f1d.close()
+        mem['window'] = [t1,t2]
+        mem['tmax']   = tmax
+        yield mem
+        del(mem)
+
+def _partialKey(fileIn, years):
+    # model ensemble file (name, size, mtime) and years read for the MME
+    st = os.stat(fileIn)
+    return [os.path.basename(fileIn), st.st_size, int(st.st_mtime), list(years)]
+
+def _mmeMerge(listFiles, inDir, outDir, outFile, years, mmePartial):
+    # merge of the partial aggregates of the models, mmePartial(fileName) -> partial, meta (see mmeMerge2D)
+    fileAgg = outDir+'/'+outFile[:-3]+'.partials.npz'
+    stats = None
+    meta  = {'members':{}, 'years':list(years), 'tmax':None, 'atts':None}
+    if os.path.isfile(fileAgg):
+        stats, meta = ensStatsRead(fileAgg)
+        if meta['years'] != list(years):
+            stats = None
+            meta  = {'members':{}, 'years':list(years), 'tmax':None, 'atts':None}
+    changed = False
+    # remove models no longer in listFiles or changed since the merge
+    for fileName in meta['members'].keys():
+        key = meta['members'][fileName]['key']
+        if fileName in listFiles and _partialKey(inDir+'/'+fileName, years) == key:
+            continue
+        filePartial = inDir+'/'+fileName[:-3]+'.partials.npz'
+        partial = None
+        if os.path.isfile(filePartial):
+            partial, metaf = ensStatsRead(filePartial)
+        if partial is None or metaf['key'] != key:
+            print ' ** partials of',fileName,'not available: merge all models again'
+            stats = None
+            meta  = {'members':{}, 'years':list(years), 'tmax':None, 'atts':None}
+            break
+        print ' Remove ',fileName,'from MME'
+        for name in stats.keys():
+            ensStatsMerge(stats[name], partial[name], -1)
+        del(meta['members'][fileName]) ; changed = True
+    # add new models
+    for fileName in listFiles:
+        if fileName in meta['members']:
+            continue
+        partial, metaf = mmePartial(fileName)
+        if years[1] > 0:
+            if meta['tmax'] is None:
+                meta['tmax'] = metaf['tmax']
+            elif metaf['tmax'] != meta['tmax']:
+                print 'wrong time axis: exiting...'
+                return None, meta
+        print ' Add    ',fileName,'to MME'
+        if stats is None:
+            stats = partial
+        else:
+            for name in stats.keys():
+                ensStatsMerge(stats[name], partial[name])
+        meta['members'][fileName] = {'key':metaf['key'], 'window':metaf['window']}
+        meta['atts'] = metaf['atts']
+        del(partial) ; changed = True
+    if changed and stats is not None:
+        ensStatsWrite(fileAgg, stats, meta)
+
+    return stats, meta
+
+def mmePartial2D(fileName, inDir, varList, varFill, years, valmask):
+    '''
+    The mmePartial2D() function returns the partial aggregates of one model to a rhon/lat multi-model
+    mean: running statistics (count, mean, sum of squared deviations) of the model ensemble mean of each
+    variable, of its sign agreement (<var>Agree) and bowl (<var>Bowl) fields and of its non-masked bins.
+    They are stored next to the model ensemble file (<file>.partials.npz) and read from there while the
+    model file and years are unchanged
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    -------
+    - fileName(str)          - model ensemble mean file (mm output of mmeAveMsk2D)
+    - inDir(str)             - directory of fileName
+    - varList, varFill       - variables and fill values (as in mmeAveMsk2D)
+    - years(t1,t2)           - years for slice read (t2 <= 0: last -t2 years)
+    - valmask                - mask value
 
     Output:
-    - field     - 1D/2D/3D masked array
+    - partial                - dictionary of running statistics: 'percent', '<var>.ave', '<var>.agree', '<var>.bowl'
+    - meta                   - dictionary: 'key' (model file and years), 'atts', 'window', 'tmax'
 
     Usage:
     ------
-    >>> from binDensity import maskVal
-    >>> maskedVariable = maskVal(unMaskedVariable,valmask)
+    >>> from libDensityPostpro import mmePartial2D
+    >>> partial, meta = mmePartial2D(fileName, inDir, ['isondepth','isonso'], [0.,valmask], [0,145], valmask)
 
     Notes:
     -----
-    - PJD 15 Sep 2014 -
+    - EG 18 Oct 2026   - Initial function write
+    '''
+    fileIn      = inDir+'/'+fileName
+    filePartial = fileIn[:-3]+'.partials.npz'
+    key = _partialKey(fileIn, years)
+    if os.path.isfile(filePartial):
+        partial, meta = ensStatsRead(filePartial)
+        if meta['key'] == key:
+            return partial, meta
+    for mem in readEnsemble2D([fileName], inDir, varList, varFill, years, True, valmask):
+        shape   = list(mem['var'][varList[0]].shape)
+        partial = {'percent':ensStatsAdd(ensStatsInit(mem['percent'].shape), mem['percent'])}
+        for var in varList:
+            partial[var+'.ave']   = ensStatsAdd(ensStatsInit(shape), mem['var'][var])
+            partial[var+'.agree'] = ensStatsAdd(ensStatsInit(shape), mem['agree'][var])
+            partial[var+'.bowl']  = ensStatsAdd(ensStatsInit(shape, std=True), mem['bowl2D'][var])
+        meta = {'key':key, 'atts':mem['atts'], 'window':mem['window'], 'tmax':mem['tmax']}
+    ensStatsWrite(filePartial, partial, meta)
+    return partial, meta
+
+def mmeMerge2D(listFiles, inDir, outDir, outFile, varList, varFill, years, valmask):
     '''
-    field [npy.isnan(field.data)] = valmask
-    field._FillValue = valmask
-    field = mv.masked_where(field > valmask/10, field)
-    return field
+    The mmeMerge2D() function merges the partial aggregates of the models of a rhon/lat multi-model mean
+    (mmePartial2D). The merged aggregates are stored next to the MME file (<outFile>.partials.npz) with
+    the list of models: models removed from (or changed in) listFiles are subtracted, new ones are added,
+    so that adding or removing a model costs one model read and a merge
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    -------
+    - listFiles(str)         - the list of model ensemble mean files
+    - inDir(str)             - input directory where files are stored
+    - outDir(str)            - output directory
+    - outFile(str)           - MME output file
+    - varList, varFill       - variables and fill values (as in mmeAveMsk2D)
+    - years(t1,t2)           - years for slice read
+    - valmask                - mask value
+
+    Output:
+    - stats                  - dictionary of running statistics accross models (as mmePartial2D), None if
+                               models have different time axes
+    - meta                   - dictionary: 'members' (model file -> key and window), 'years', 'tmax', 'atts'
 
-def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl, ToeType, debug=True):
+    Usage:
+    ------
+    >>> from libDensityPostpro import mmeMerge2D
+    >>> stats, meta = mmeMerge2D(listFiles, inDir, outDir, outFile, varList, varFill, [0,145], valmask)
+
+    Notes:
+    -----
+    - EG 18 Oct 2026   - Initial function write
+    - Models whose partial aggregates were rebuilt since the last merge can not be subtracted: all
+      partials are then merged again (no model file read if they are up to date)
+    '''
+    return _mmeMerge(listFiles, inDir, outDir, outFile, years,
+                     lambda fileName: mmePartial2D(fileName, inDir, varList, varFill, years, valmask))
+
+def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl, ToeType, debug=True, partials=True):
     '''
     The mmeAveMsk2D() function averages rhon/lat density bined files with differing masks
     It ouputs
@@ -67,6 +283,8 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
     - ToeType(str)           - ToE type ('F': none, 'histnat')
                                -> requires running first mm+mme without ToE to compute Stddev
     - debug <optional>       - boolean value
+    - partials <optional>    - mme: merge the partial aggregates of the models (mmeMerge2D) instead of
+                               reading all model files
 
     Notes:
     -----
@@ -78,12 +296,21 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
     - EG 07 Oct 2016   - add 3D file support
     - EG 21 Nov 2016   - move 3D support to new function
     - EG 10 jan 2017   - added timeBowl option
+    - EG 18 Oct 2026   - members read once for all variables with bulk time slices (readEnsemble2D)
+    - EG 18 Oct 2026   - mask above bowl built once per ensemble (bowlMask) instead of loops on lat/basin
+    - EG 18 Oct 2026   - members folded one at a time into running statistics (ensStatsAdd): memory
+                         does not depend on the number of members
+    - EG 18 Oct 2026   - ToE 1 and 2 computed together (findToEMulti)
+    - EG 18 Oct 2026   - mme from per model partial aggregates stored next to the model files (partials):
+                         only added or changed models are read
 
     - TODO :
-                 - remove loops
                  - add computation of ToE per model (toe 1 and toe 2) see ticket #50
                  - add isonhtc (see ticket #48)
     '''
+    import cdms2 as cdm
+    import cdutil as cdu
+    import MV2 as mv
 
     # CDMS initialisation - netCDF compression
     comp = 1 # 0 for no compression
@@ -102,12 +329,7 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
     t1 = years[0]
     t2 = years[1]
     if t2 <= 0:
-        useLastYears = True
         t2 = -t2
-    else:
-        useLastYears = False
-    t10 = t1
-    t20 = t2
     # Bound of period average to remove
     peri1 = timeInt[0]
     peri2 = timeInt[1]
@@ -138,14 +360,6 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
     valmask = isond0.missing_value[0]
     varList = ['isondepth','isonpers','isonso','isonthetao','isonthick','isonvol']
     varFill = [0.,0.,valmask,valmask,0.,0.]
-    # init arrays (2D rho/lat)
-    percent  = npy.ma.ones([runN,timN,basN,levN,latN], dtype='float32')*0.
-    #minbowl  = npy.ma.ones([basN,latN], dtype='float32')*1000.
-    varbowl  = npy.ma.ones([runN,timN,basN,latN], dtype='float32')*1.
-    #varList = ['isondepth']
-    #print ' !!! ### Testing one variable ###'
-    #varList = ['isonthetao']
-
     # init time axis
     time       = cdm.createAxis(npy.float32(range(timN)))
     time.id    = 'time'
@@ -156,96 +370,104 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
     ensembleAxis.id    = 'members'
     ensembleAxis.units = 'N'
 
-    # loop on variables
-    for iv,var in enumerate(varList):
-
-        # Array inits (2D rho/lat 3D rho/lat/lon)
-            #shapeR = [basN,levN,latN]
-        isonvar  = npy.ma.ones([runN,timN,basN,levN,latN], dtype='float32')*valmask
-        vardiff,varbowl2D = [npy.ma.ones(npy.ma.shape(isonvar)) for _ in range(2)]
-        varstd,varToE1,varToE2 =  [npy.ma.ones([runN,basN,levN,latN], dtype='float32')*valmask for _ in range(3)]
-        varones  = npy.ma.ones([runN,timN,basN,levN,latN], dtype='float32')*1.
-
-        print ' Variable ',iv, var
-        # loop over files to fill up array
-        for i,file in enumerate(listFiles):
-            ft      = cdm.open(inDir[0]+'/'+file)
-            model = file.split('.')[1]
-            timeax  = ft.getAxis('time')
-            file1d = replace(inDir[0]+'/'+file,'2D','1D')
-            if os.path.isfile(file1d):
-                f1d = cdm.open(file1d)
-            else:
-                print 'ERROR:',file1d,'missing (if mme, run 1D first)'
-                sys.exit(1)
-            tmax = timeax.shape[0]
-            if i == 0:
-                tmax0 = tmax
-            #adapt [t1,t2] time bounds to piControl last NN years
-            if useLastYears:
-                t1 = tmax-t20
-                t2 = tmax
-            else:
-                if tmax != tmax0:
-                    print 'wrong time axis: exiting...'
-                    return
-
-            # read array
-            # loop over time/density for memory management
-            for it in range(timN):
-                t1r = t1 + it
-                t2r = t1r + 1
-                isonRead = ft(var,time = slice(t1r,t2r))
-                if varFill[iv] != valmask:
-                    isonvar[i,it,...] = isonRead.filled(varFill[iv])
-                else:
-                    isonvar[i,it,...] = isonRead
-            # compute percentage of non-masked points accros MME
-            if iv == 0:
-                maskvar = mv.masked_values(isonRead.data,valmask).mask
-                percent[i,...] = npy.float32(npy.equal(maskvar,0))
+    # Running ensemble statistics: members are read (in one pass each) and folded in one at a time
+    shape  = [timN,basN,levN,latN]
+    shapeR = [basN,levN,latN]
+    stats  = {}
+    for var in varList:
+        # average accross members and sign agreement (mme: average of <var>Agree)
+        stats[var] = {'ave':ensStatsInit(shape), 'agree':ensStatsInit(shape)}
+        if mme:
+            # average and intermodel stddev of <var>Bowl
+            stats[var]['bowl'] = ensStatsInit(shape, std=True)
+        else:
+            # max of Std dev of all members
+            stats[var]['std']  = ensStatsInit(shapeR, maxi=True)
+    statsPercent = ensStatsInit(shapeR)
+    statsBowl    = ensStatsInit([timN,basN,latN])
+    if ToeType == 'histnat':
+        varToE1,varToE2 = [dict((var,npy.ma.ones([runN,basN,levN,latN], dtype='float32')*valmask) for var in varList) for _ in range(2)]
+    atts = {}
+
+    nmem = 0
+    listMembers = listFiles
+    if mme and partials:
+        # merge the partial aggregates of the models (only new or changed models are read)
+        listMembers = []
+        aggr, metaAggr = mmeMerge2D(listFiles, inDir[0], outDir, outFile, varList, varFill, years, valmask)
+        if aggr is not None:
+            nmem = runN
+            statsPercent = aggr['percent']
+            for var in varList:
+                stats[var] = {'ave':aggr[var+'.ave'], 'agree':aggr[var+'.agree'], 'bowl':aggr[var+'.bowl']}
+            atts = dict([(var, [str(att) for att in metaAggr['atts'][var]]) for var in varList])
+            [t1,t2] = metaAggr['members'][listFiles[-1]]['window']
+            del(aggr)
+    for i,mem in enumerate(readEnsemble2D(listMembers, inDir[0], varList, varFill, years, mme, valmask)):
+        nmem = i+1
+        if i == 0:
+            atts = mem['atts']
+            if ToeType == 'histnat' and not mme:
+                # Mean and Std dev from histnat
+                filehn  = glob.glob(inDir[1]+'/cmip5.'+mem['model']+'.*zon2D*')[0]
+                #filehn = replace(outFile,'historical','historicalNat')
+                fthn = cdm.open(filehn)
+                varhn = {}
+        # percentage of non-masked points and bowl position
+        ensStatsAdd(statsPercent, mem['percent'])
+        if not mme:
+            ensStatsAdd(statsBowl, mem['bowl'])
+        # loop on variables
+        for iv,var in enumerate(varList):
+            isonvar = mem['var'][var]
+            ensStatsAdd(stats[var]['ave'], isonvar)
             if mme:
                 # if mme then just accumulate Bowl, Agree fields
-                varst = var+'Agree'
-                vardiff[i,...] = ft(varst,time = slice(t1,t2))
-                varb = var+'Bowl'
-                varbowl2D[i,...] = ft(varb,time = slice(t1,t2))
+                ensStatsAdd(stats[var]['agree'], mem['agree'][var])
+                ensStatsAdd(stats[var]['bowl'] , mem['bowl2D'][var])
             else:
                 # Compute difference with average of first initN years
-                varinit = cdu.averager(isonvar[i,peri1:peri2,...],axis=0)
-                for t in range(timN):
-                    vardiff[i,t,...] = isonvar[i,t,...] - varinit
-                vardiff[i,...].mask = isonvar[i,...].mask
-                # Read bowl and truncate 2D field above bowl
-                if iv == 0:
-                    bowlRead = f1d(varsig,time = slice(t1,t2))
-                    varbowl[i,...] = bowlRead
+                varinit = cdu.averager(isonvar[peri1:peri2,...],axis=0)
+                vardiff = npy.ma.array(isonvar - varinit, mask = npy.ma.getmaskarray(isonvar))
+                # Sign of difference
+                vardiffsg = npy.ma.array(npy.copysign(1.,vardiff.filled(0.)), mask = npy.ma.getmaskarray(vardiff))
+                ensStatsAdd(stats[var]['agree'], vardiffsg)
                 # Compute Stddev
-                varstd[i,...] = npy.ma.std(isonvar[i,...], axis=0)
+                ensStatsAdd(stats[var]['std'], npy.ma.std(isonvar, axis=0))
                 # Compute ToE
                 if ToeType == 'histnat':
-                    # Read mean and Std dev from histnat
                     if i == 0:
-                        filehn  = glob.glob(inDir[1]+'/cmip5.'+model+'.*zon2D*')[0]
-                        #filehn = replace(outFile,'historical','historicalNat')
-                        fthn = cdm.open(filehn)
                         varmeanhn = fthn(var)
                         varst = var+'Std'
                         varmaxstd = fthn(varst)
-                    toemult = 1.
-                    signal = npy.reshape(isonvar[i,...]-varmeanhn,(timN,basN*levN*latN))
-                    noise = npy.reshape(varmaxstd,(basN*levN*latN))
-                    varToE1[i,...] = npy.reshape(findToE(signal, noise, toemult),(basN,levN,latN))
-                    toemult = 2.
-                    varToE2[i,...] = npy.reshape(findToE(signal, noise, toemult),(basN,levN,latN))
-            ft.close()
-            f1d.close()
-        # <-- end of loop on files
+                        varhn[var] = [varmeanhn, npy.reshape(varmaxstd,(basN*levN*latN))]
+                    [varmeanhn, noise] = varhn[var]
+                    signal = npy.reshape(isonvar-varmeanhn,(timN,basN*levN*latN))
+                    # toemult 1 and 2 in one pass
+                    toe = findToEMulti(signal, noise, [1.,2.])
+                    varToE1[var][i,...] = npy.reshape(toe[0],(basN,levN,latN))
+                    varToE2[var][i,...] = npy.reshape(toe[1],(basN,levN,latN))
+        [t1,t2] = mem['window']
+        del(mem,isonvar)
+    # <--- end of loop on members
+    if ToeType == 'histnat' and not mme and nmem > 0:
+        fthn.close()
+    if nmem < runN:
+        outFile_f.close()
+        return
+
+    # loop on variables
+    for iv,var in enumerate(varList):
+
+        [isonId, isonLongName, isonUnits] = atts[var]
+
+        print ' Variable ',iv, var
 
         # Compute percentage of bin presence
         # Only keep points where percent > 50%
         if iv == 0:
-            percenta = (cdu.averager(percent,axis=0))*100.
+            percenta = ensStatsGet(statsPercent, 'mean', valmask)*100.
+            percenta = npy.ma.repeat(percenta[npy.newaxis,...], timN, axis=0)
             percenta = mv.masked_less(percenta, 50)
             percentw = cdm.createVariable(percenta, axes = [time,axesList[1],axesList[2],axesList[3]], id = 'isonpercent')
             percentw._FillValue = valmask
@@ -255,20 +477,19 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
 
         # Sign of difference
         if mme:
-            vardiffsgSum = cdu.averager(vardiff, axis=0)
+            vardiffsgSum = ensStatsGet(stats[var]['agree'], 'mean', valmask)
             vardiffsgSum = cdm.createVariable(vardiffsgSum , axes =[time,axesList[1],axesList[2],axesList[3]] , id = 'foo')
             vardiffsgSum = maskVal(vardiffsgSum, valmask)
             vardiffsgSum.mask = percentw.mask
         else:
-            vardiffsg = npy.copysign(varones,vardiff)
             # average signs
-            vardiffsgSum = cdu.averager(vardiffsg, axis=0)
+            vardiffsgSum = ensStatsGet(stats[var]['agree'], 'mean', valmask)
             vardiffsgSum = mv.masked_greater(vardiffsgSum, 10000.)
             vardiffsgSum.mask = percentw.mask
             vardiffsgSum._FillValue = valmask
 
         # average variable accross members
-        isonVarAve = cdu.averager(isonvar, axis=0)
+        isonVarAve = ensStatsGet(stats[var]['ave'], 'mean', valmask)
         isonVarAve = cdm.createVariable(isonVarAve , axes =[time,axesList[1],axesList[2],axesList[3]] , id = 'foo')
         # mask
         if varFill[iv] == valmask:
@@ -279,12 +500,12 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
         # Only keep points with rhon >  bowl-delta_rho
         delta_rho = 0.
         if mme: # start from average of <var>Agree
-            isonVarBowl = cdu.averager(varbowl2D, axis=0)
+            isonVarBowl = ensStatsGet(stats[var]['bowl'], 'mean', valmask)
             isonVarBowl = cdm.createVariable(isonVarBowl , axes =[time,axesList[1],axesList[2],axesList[3]] , id = 'foo')
             isonVarBowl = maskVal(isonVarBowl, valmask)
             isonVarBowl.mask = percentw.mask
             # Compute intermodel stddev
-            isonVarStd = statistics.std(varbowl2D, axis=0)
+            isonVarStd = ensStatsGet(stats[var]['bowl'], 'std', valmask)
             isonVarStd = cdm.createVariable(isonVarStd , axes =[time,axesList[1],axesList[2],axesList[3]] , id = 'foo')
             isonVarStd = maskVal(isonVarStd, valmask)
             isonVarStd.mask = percentw.mask
@@ -299,66 +520,51 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
                 bowlRead = f1d(varsig,time = slice(t1,t2))
                 f1d.close()
                 siglimit = cdu.averager(bowlRead, axis=0)  - delta_rho
-            # TODO: remove loop by building global array with 1/0
-            for il in range(latN):
-                for ib in range(basN):
-                    #if ib == 2:
-                    #    print il, siglimit[ib,il]
-                    if siglimit[ib,il] < valmask/1000.:
-                         # if mme bowl density defined, mask above bowl
-                        index = (npy.argwhere(sigmaGrd[:] >= siglimit[ib,il]))
-                        isonVarBowl [:,ib,0:index[0],il].mask = True
-                        isonVarStd  [:,ib,0:index[0],il].mask = True
-                        vardiffsgSum[:,ib,0:index[0],il].mask = True
-                    else:
-                        # mask all points
-                        isonVarBowl [:,ib,:,il].mask = True
-                        isonVarStd  [:,ib,:,il].mask = True
-                        vardiffsgSum[:,ib,:,il].mask = True
+                # if mme bowl density defined, mask above bowl, else mask all points [basin,rho,lat]
+                # (same for all variables)
+                maskBowl = bowlMask(sigmaGrd[:], siglimit, valmask)
+            isonVarBowl.mask  = npy.ma.getmaskarray(isonVarBowl)  | maskBowl
+            isonVarStd.mask   = npy.ma.getmaskarray(isonVarStd)   | maskBowl
+            vardiffsgSum.mask = npy.ma.getmaskarray(vardiffsgSum) | maskBowl
         else:
             isonVarBowl = isonVarAve*1. # start from variable
             isonVarStd  = isonVarAve*1. # start from variable
             if iv == 0:
-                siglimit = cdu.averager(varbowl, axis=0) # average accross members
+                siglimit = ensStatsGet(statsBowl, 'mean', valmask) # average accross members
                 # Average bowl in time
                 if timeBowl == 'mean':
                     siglimit = cdu.averager(siglimit, axis=0) - delta_rho
                 # or take largest sigma over time
                 else:
                     siglimit = npy.ma.max(siglimit, axis=0) - delta_rho
-            # TODO: remove loop by building global array with 1/0
-            for il in range(latN):
-                for ib in range(basN):
-                    if siglimit[ib,il] < valmask/1000.:
-                        # if bowl density defined, mask above bowl
-                        index = (npy.argwhere(sigmaGrd[:] >= siglimit[ib,il]))
-                        isonVarBowl[:,ib,0:index[0],il].mask = True
-                        vardiffsgSum[:,ib,0:index[0],il].mask = True
-                    else:
-                        # mask all points
-                        vardiffsgSum[:,ib,:,il].mask = True
+                # if bowl density defined, mask above bowl [basin,rho,lat] (same for all variables)
+                maskBowl = bowlMask(sigmaGrd[:], siglimit, valmask, undefined=False)
+                # agreement also masked where bowl is not defined
+                maskBowlAll = bowlMask(sigmaGrd[:], siglimit, valmask)
+            isonVarBowl.mask  = npy.ma.getmaskarray(isonVarBowl)  | maskBowl
+            vardiffsgSum.mask = npy.ma.getmaskarray(vardiffsgSum) | maskBowlAll
 
             isonVarBowl = maskVal(isonVarBowl, valmask)
             # Find max of Std dev of all members
-            isonVarStd = npy.ma.max(varstd, axis=0)
+            isonVarStd = ensStatsGet(stats[var]['std'], 'max', valmask)
             # mask
             if varFill[iv] == valmask:
                 isonVarStd = maskVal(isonVarStd, valmask)
 
         # Write
-        isonave = cdm.createVariable(isonVarAve, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonRead.id)
-        isonave.long_name = isonRead.long_name
-        isonave.units     = isonRead.units
-        isonavediff = cdm.createVariable(vardiffsgSum, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'Agree')
-        isonavediff.long_name = isonRead.long_name
-        isonavediff.units     = isonRead.units
-        isonavebowl = cdm.createVariable(isonVarBowl, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'Bowl')
-        isonavebowl.long_name = isonRead.long_name
-        isonavebowl.units     = isonRead.units
+        isonave = cdm.createVariable(isonVarAve, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonId)
+        isonave.long_name = isonLongName
+        isonave.units     = isonUnits
+        isonavediff = cdm.createVariable(vardiffsgSum, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonId+'Agree')
+        isonavediff.long_name = isonLongName
+        isonavediff.units     = isonUnits
+        isonavebowl = cdm.createVariable(isonVarBowl, axes = [time,axesList[1],axesList[2],axesList[3]], id = isonId+'Bowl')
+        isonavebowl.long_name = isonLongName
+        isonavebowl.units     = isonUnits
         if not mme:
-            isonmaxstd = cdm.createVariable(isonVarStd, axes = [axesList[1],axesList[2],axesList[3]], id = isonRead.id+'Std')
-            isonmaxstd.long_name = isonRead.long_name
-            isonmaxstd.units     = isonRead.units
+            isonmaxstd = cdm.createVariable(isonVarStd, axes = [axesList[1],axesList[2],axesList[3]], id = isonId+'Std')
+            isonmaxstd.long_name = isonLongName
+            isonmaxstd.units     = isonUnits
 
         outFile_f.write(    isonave.astype('float32'))
         outFile_f.write(isonavediff.astype('float32'))
@@ -367,27 +573,31 @@ def mmeAveMsk2D(listFiles, years, inDir, outDir, outFile, timeInt, mme, timeBowl
             outFile_f.write( isonmaxstd.astype('float32'))
 
         if ToeType == 'histnat':
-            isontoe1 = cdm.createVariable(varToE1, axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'ToE1')
-            isontoe1.long_name = 'ToE 1 for '+isonRead.long_name
+            isontoe1 = cdm.createVariable(varToE1[var], axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonId+'ToE1')
+            isontoe1.long_name = 'ToE 1 for '+isonLongName
             isontoe1.units     = 'Year'
-            isontoe2 = cdm.createVariable(varToE2, axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'ToE2')
-            isontoe2.long_name = 'ToE 2 for '+isonRead.long_name
+            isontoe2 = cdm.createVariable(varToE2[var], axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonId+'ToE2')
+            isontoe2.long_name = 'ToE 2 for '+isonLongName
             isontoe2.units     = 'Year'
             outFile_f.write(isontoe1.astype('float32'))
             outFile_f.write(isontoe2.astype('float32'))
+            varToE1[var] = None ; varToE2[var] = None
 
         if mme:
-            isonvarstd = cdm.createVariable(isonVarStd , axes =[time,axesList[1],axesList[2],axesList[3]] , id = isonRead.id+'ModStd')
-            isonvarstd.long_name = isonRead.long_name+' intermodel std'
-            isonvarstd.units     = isonRead.units
+            isonvarstd = cdm.createVariable(isonVarStd , axes =[time,axesList[1],axesList[2],axesList[3]] , id = isonId+'ModStd')
+            isonvarstd.long_name = isonLongName+' intermodel std'
+            isonvarstd.units     = isonUnits
             outFile_f.write(isonvarstd.astype('float32'))
 
+        # release running statistics of this variable
+        stats[var] = None
+
     # <--- end of loop on variables
 
     outFile_f.close()
     fi.close()
 
-def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType, debug=True):
+def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType, debug=True, memMax=2.):
     '''
     The mmeAveMsk3D() function averages rhon/lat density bined files with differing masks
     It ouputs
@@ -411,22 +621,27 @@ def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType,
     - mme(bool)              - multi-model mean (will read in single model ensemble stats)
     - ToeType(str)           - ToE type ('F': none, 'histnat')
                                -> requires running first mm+mme without ToE to compute Stddev
+                               (histnat mm file cmip5.<model>.*3D* in inDir[1], with <var>Bowl and <var>Std)
     - debug <optional>       - boolean value
+    - memMax <optional>      - memory budget (GB) setting the number of density levels treated at once
 
     Notes:
     -----
     - EG 21 Nov 2016   - Initial function write
+    - EG 18 Oct 2026   - members folded one at a time into running statistics (ensStatsAdd)
+    - EG 18 Oct 2026   - member files opened once, read by blocks of levels sized to memMax, output
+                         written by hyperslabs in [time,rho,lat,lon] order (no ncpdq needed)
+    - EG 18 Oct 2026   - ToE per member computed out-of-core by tiles (streamToE3D)
 
     - TODO :
                  - add computation of ToE per model (toe 1 and toe 2) see ticket #50
                  - add isonhtc (see ticket #48)
     '''
+    import cdms2 as cdm
+    import MV2 as mv
 
-    # CDMS initialisation - netCDF compression
+    # netCDF compression (as cdms2 Shuffle/Deflate/DeflateLevel flags)
     comp = 1 # 0 for no compression
-    cdm.setNetcdfShuffleFlag(comp)
-    cdm.setNetcdfDeflateFlag(comp)
-    cdm.setNetcdfDeflateLevelFlag(comp)
     cdm.setAutoBounds('on')
     # Numpy initialisation
     npy.set_printoptions(precision=2)
@@ -462,11 +677,6 @@ def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType,
     #    listFiles = listFiles[0:2]
     #    print ' !!! ### Testing 3 models ###',  listFiles
 
-    # Declare and open files for writing
-    if os.path.isfile(outDir+'/'+outFile):
-        os.remove(outDir+'/'+outFile)
-    outFile_f = cdm.open(outDir+'/'+outFile,'w')
-
     #timN = isond0.shape[0]
     timN = t2-t1
     runN = len(listFiles)
@@ -477,178 +687,144 @@ def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType,
 
     varList = ['isondepthg','persistmxy','sog','thetaog','isonthickg']
     varFill = [valmask,valmask,valmask,valmask,valmask]
-    percent  = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*0.
-    varbowl  = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*1.
     #varList = ['isondepthg']
     #print ' !!! ### Testing one variable ###', varList
 
-    # init sigma axis
-    sigma = cdm.createAxis(npy.float32(range(1)))
-    sigma.id = axesList[1].id
-    sigma.units = axesList[1].units
-    sigma.designateTime()
-    # init time axis
-    time       = cdm.createAxis(npy.float32(range(timN)))
-    time.id    = 'time'
-    time.units = 'years since 1861'
-    # init ensemble axis
-    ensembleAxis       = cdm.createAxis(npy.float32(range(runN)))
-    ensembleAxis.id    = 'members'
-    ensembleAxis.units = 'N'
-    # Output axis
-    sigmaList = [sigma,axesList[2],axesList[3]] ; # sigma, lat, lon
-    sigmaTimeList = [sigma,time,axesList[2],axesList[3]] ; # sigma, time, lat, lon
-    # init arrays
-    isonvar  = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*valmask
-    varbowl2D  = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*valmask
-    varstd,varToE1,varToE2 =  [npy.ma.ones([runN,latN,lonN], dtype='float32')*valmask for _ in range(3)]
-
-    # Loop on density levels (for memory management, becomes UNLIMITED axis and requires a ncpq to reorder dimensions)
-
-    delta_ib = 1
-    print ' Sigma index:'
-    for ib in range(levN):
-        ib1 = ib + delta_ib
+    # Open member files once
+    fts = []
+    for i,file in enumerate(listFiles):
+        ft     = cdm.open(inDir[0]+'/'+file)
+        timeax = ft.getAxis('time')
+        if i == 0:
+            tmax0 = timeax.shape[0]
+        tmax = timeax.shape[0]
+        if tmax != tmax0:
+            print 'wrong time axis: exiting...'
+            for ft in fts+[ft]:
+                ft.close()
+            fi.close()
+            return
+        fts.append(ft)
+    # Variable ids and attributes
+    atts = {}
+    for var in varList:
+        if nobowl:
+            varb = var+'Bowl'
+        else:
+            varb = var
+        atts[var] = [varb, fts[0][varb].long_name, fts[0][varb].units]
+
+    # Only keep points with rhon >  bowl-delta_rho
+    delta_rho = 0.
+    if not mme:
+        # Read bowl to truncate field above bowl: average accross members [time,lat,lon]
+        statsBowl = ensStatsInit([timN,latN,lonN])
+        for ft in fts:
+            ensStatsAdd(statsBowl, ft(varsig,time = slice(t1,t2)))
+        siglimit = ensStatsGet(statsBowl, 'mean', valmask) - delta_rho
+        del(statsBowl)
+
+    # Declare and open files for writing: axes and variables in [time,rho,lat,lon] order
+    out = NetcdfWriter(outDir+'/'+outFile, comp=comp, valmask=valmask)
+    out.createAxis('time', npy.float32(range(timN)), {'units':'years since 1861', 'axis':'T'})
+    for axis in axesList[1:]:
+        out.createAxis(axis.id, axis[:], axis.attributes, bounds=axis.getBounds())
+    levId = axesList[1].id ; latId = axesList[2].id ; lonId = axesList[3].id
+    out.createAxis('members', npy.float32(range(runN)), {'units':'N'})
+    timeList  = ['time',levId,latId,lonId]
+    chunks    = [1,1,latN,lonN]
+    out.createVariable('isonpercent', timeList, {'long_name':'percentage of MME bin', 'units':'%'}, chunks=chunks)
+    for var in varList:
+        [isonId, isonLongName, isonUnits] = atts[var]
+        if mme:
+            out.createVariable(isonId, timeList, {'long_name':isonLongName, 'units':isonUnits}, chunks=chunks)
+            out.createVariable(isonId+'Std', timeList, {'long_name':isonLongName+' intermodel std', 'units':isonUnits}, chunks=chunks)
+        else:
+            out.createVariable(isonId+'Bowl', timeList, {'long_name':isonLongName, 'units':isonUnits}, chunks=chunks)
+            out.createVariable(isonId+'Std', [levId,latId,lonId], {'long_name':isonLongName, 'units':isonUnits}, chunks=chunks[1:])
+        if ToeType == 'histnat' and not mme:
+            out.createVariable(isonId+'ToE1', ['members',levId,latId,lonId], {'long_name':'ToE 1 for '+isonLongName, 'units':'Year'}, chunks=chunks)
+            out.createVariable(isonId+'ToE2', ['members',levId,latId,lonId], {'long_name':'ToE 2 for '+isonLongName, 'units':'Year'}, chunks=chunks)
+
+    # Loop on blocks of density levels (memory management): about 80 bytes per point of a level
+    # for running statistics, member read and temporaries
+    delta_ib = int(memMax*1.e9/(timN*latN*lonN*(80.+8*mme)))
+    delta_ib = max(1, min(levN, delta_ib))
+    print ' Sigma index (blocks of',delta_ib,'levels):'
+    for ib in range(0, levN, delta_ib):
+        ib1 = min(ib + delta_ib, levN)
+        levB = ib1 - ib
         print ib,
-        tim0 = timc.clock()
         # loop on variables
         for iv,var in enumerate(varList):
-            if nobowl:
-                varb = var+'Bowl'
-            else:
-                varb = var
+            [isonId, isonLongName, isonUnits] = atts[var]
             if ib == 0:
-                print ' Variable ',iv, varb
-            # loop over files to fill up array
-            for i,file in enumerate(listFiles):
-                tim01 = timc.clock()
-                ft      = cdm.open(inDir[0]+'/'+file)
-                model = file.split('.')[1]
-                timeax  = ft.getAxis('time')
-                if i == 0:
-                    tmax0 = timeax.shape[0]
-                tmax = timeax.shape[0]
-                if tmax != tmax0:
-                    print 'wrong time axis: exiting...'
-                    return
-                # read array
-                isonRead = ft(varb,time = slice(t1,t2), lev = slice(ib,ib1)).squeeze()
+                print ' Variable ',iv, isonId
+            # running statistics accross members (mme: average and intermodel std)
+            statsVar = ensStatsInit([timN,levB,latN,lonN], std=mme)
+            statsStd = ensStatsInit([levB,latN,lonN], maxi=True)
+            if iv == 0:
+                statsPercent = ensStatsInit([timN,levB,latN,lonN])
+            # loop over files to fold members in
+            for i,ft in enumerate(fts):
+                # read block of levels [time,rho,lat,lon]
+                isonRead = ft(isonId,time = slice(t1,t2), lev = slice(ib,ib1))
                 if varFill[iv] != valmask:
-                    isonvar[i,...] = isonRead.filled(varFill[iv])
+                    isonvar = npy.ma.array(isonRead.filled(varFill[iv]), dtype='float32')
                 else:
-                    isonvar[i,...] = isonRead
-                tim02 = timc.clock()
+                    isonvar = npy.ma.array(isonRead, dtype='float32')
+                # mme: also accumulates Bowl field and intermodel Std (same field as variable)
+                ensStatsAdd(statsVar, isonvar)
                 # compute percentage of non-masked points accros MME
                 if iv == 0:
-                    maskvar = mv.masked_values(isonRead.data,valmask).mask
-                    percent[i,...] = npy.float32(npy.equal(maskvar,0))
-                tim03 = timc.clock()
-                if mme:
-                    # if mme then just accumulate Bowl, Agree and Std fields
+                    maskvar = npy.ma.getmaskarray(mv.masked_values(isonRead.data,valmask))
+                    ensStatsAdd(statsPercent, npy.float32(npy.equal(maskvar,0)))
+                # if mme then just accumulate Bowl, Agree and Std fields (done above)
+                #if mme:
                     #varst = var+'Agree'
-                    #vardiff[i,...] = ft(varst,time = slice(t1,t2),lev = slice(ib,ib1)).squeeze()
-                    isonRead = ft(varb,time = slice(t1,t2),lev = slice(ib,ib1)).squeeze()
-                    varbowl2D[i,...] = isonRead
-                else:
+                    #vardiff[i,...] = ft(varst,time = slice(t1,t2),lev = slice(ib,ib1))
+                if not mme:
                     # Compute difference with average of first initN years
-                    #varinit = cdu.averager(isonvar[i,peri1:peri2,...],axis=0)
-                    #for t in range(timN):
-                    #    vardiff[i,t,...] = isonvar[i,t,...] - varinit
-                    #vardiff[i,...].mask = isonvar[i,...].mask
-                    # Read bowl to truncate field above bowl
-                    if ib == 0 and iv == 0:
-                        varbowl[i,...] = ft(varsig,time = slice(t1,t2))
-                        #varbowl[i,...] = bowlRead
+                    #varinit = cdu.averager(isonvar[peri1:peri2,...],axis=0)
+                    #vardiff = isonvar - varinit
                     # Compute Stddev
-                    varstd[i,...] = npy.ma.std(isonvar[i,...], axis=0)
-                    # Compute ToE
-                    if ToeType == 'histnat':
-                        toto=1
-                        # TODO
-                        # Read mean and Std dev from histnat
-                        #    if i == 0:
-                        #        filehn  = glob.glob(inDir[1]+'/cmip5.'+model+'.*zon2D*')[0]
-                        #        #filehn = replace(outFile,'historical','historicalNat')
-                        #        fthn = cdm.open(filehn)
-                        #        varmeanhn = fthn(var)
-                        #        varst = var+'Std'
-                        #        varmaxstd = fthn(varst)
-                        #    toemult = 1.
-                        #    signal = npy.reshape(isonvar[i,...]-varmeanhn,(timN,basN*levN*latN))
-                        #    noise = npy.reshape(varmaxstd,(basN*levN*latN))
-                        #    varToE1[i,...] = npy.reshape(findToE(signal, noise, toemult),(basN,levN,latN))
-                        #    toemult = 2.
-                        #    varToE2[i,...] = npy.reshape(findToE(signal, noise, toemult),(basN,levN,latN))
-                tim04 = timc.clock()
-                ft.close()
-                #print 'ib, section 1 timing',ib, tim02-tim01,tim03-tim02,tim04-tim03
+                    ensStatsAdd(statsStd, npy.ma.std(isonvar, axis=0))
+                    # ToE computed after the loop on levels, by tiles (streamToE3D)
+                del(isonRead,isonvar)
             # <-- end of loop on files (i)
 
-            tim1 = timc.clock()
-
             # Compute percentage of bin presence
             # Only keep points where percent > 50%
             if iv == 0:
-                percenta = (cdu.averager(percent,axis=0))*100.
-                percenta = mv.masked_less(percenta, 50)
-                percenta = npy.reshape(percenta,[delta_ib,timN,latN,lonN])
-                percentw = cdm.createVariable(percenta, axes = sigmaTimeList, id = 'isonpercent')
-                percentw._FillValue = valmask
-                percentw.long_name = 'percentage of MME bin'
-                percentw.units     = '%'
-                outFile_f.write(percentw.astype('float32'), extend = 1, index = ib)
+                percenta = ensStatsGet(statsPercent, 'mean', valmask)*100.
+                percenta = npy.ma.masked_less(percenta, 50)
+                percentMask = npy.ma.getmaskarray(percenta)
+                out.write('isonpercent', percenta, [0,ib])
+                del(statsPercent)
 
             # Sign of difference
             #if mme:
-            #    vardiffsgSum = cdu.averager(vardiff, axis=0)
-            #    vardiffsgSum = cdm.createVariable(vardiffsgSum , axes = sigmaTimeList , id = 'foo')
+            #    vardiffsgSum = ensStatsGet(statsAgree, 'mean', valmask)
             #    vardiffsgSum = maskVal(vardiffsgSum, valmask)
-            #    vardiffsgSum.mask = percentw.mask
+            #    vardiffsgSum.mask = percentMask
             #else:
-            #    vardiffsg = npy.copysign(varones,vardiff)
-            #    # average signs
-            #    vardiffsgSum = cdu.averager(vardiffsg, axis=0)
-            #    vardiffsgSum = mv.masked_greater(vardiffsgSum, 10000.)
-            #    vardiffsgSum.mask = percentw.mask
-            #    vardiffsgSum._FillValue = valmask
-
-            # average variable accross members
-            isonVarAve = cdu.averager(isonvar, axis=0)
-            isonVarAve = npy.reshape(isonVarAve,[delta_ib,timN,latN,lonN])
-            isonVarAve = cdm.createVariable(isonVarAve , axes = sigmaTimeList , id = 'foo')
-            # mask
-            if varFill[iv] == valmask:
-                isonVarAve = maskVal(isonVarAve, valmask)
+            #    vardiffsgSum = ensStatsGet(statsAgree, 'mean', valmask)
+            #    vardiffsgSum = npy.ma.masked_greater(vardiffsgSum, 10000.)
+            #    vardiffsgSum.mask = percentMask
 
-            isonVarAve.mask = percentw.mask
-            tim2 = timc.clock()
-
-            # Only keep points with rhon >  bowl-delta_rho
-            delta_rho = 0.
             # mme case
             if mme: # start from average of <var>Agree
-                isonVarBowl = cdu.averager(varbowl2D, axis=0)
-                isonVarBowl = npy.reshape(isonVarBowl,[delta_ib,timN,latN,lonN])
-                isonVarBowl = cdm.createVariable(isonVarBowl , axes = sigmaTimeList , id = 'foo')
+                isonVarBowl = ensStatsGet(statsVar, 'mean', valmask)
                 isonVarBowl = maskVal(isonVarBowl, valmask)
-                isonVarBowl.mask = percentw.mask
+                isonVarBowl.mask = percentMask
                 # Compute intermodel stddev
-                isonVarStd = statistics.std(varbowl2D, axis=0)
-                isonVarStd = npy.reshape(isonVarStd,[delta_ib,timN,latN,lonN])
-                isonVarStd = cdm.createVariable(isonVarStd , axes = sigmaTimeList , id = 'foo')
+                isonVarStd = ensStatsGet(statsVar, 'std', valmask)
                 isonVarStd = maskVal(isonVarStd, valmask)
-                isonVarStd.mask = percentw.mask
+                isonVarStd.mask = percentMask
 
                 # Write
-                isonvarbowlw = cdm.createVariable(isonVarBowl , axes = sigmaTimeList , id = isonRead.id)
-                isonvarbowlw.long_name = isonRead.long_name
-                isonvarbowlw.units     = isonRead.units
-                isonvarstdw = cdm.createVariable(isonVarStd , axes = sigmaTimeList , id = isonRead.id+'Std')
-                isonvarstdw.long_name = isonRead.long_name+' intermodel std'
-                isonvarstdw.units     = isonRead.units
-
-                outFile_f.write(isonvarbowlw.astype('float32'), extend = 1, index = ib)
-                outFile_f.write(isonvarstdw.astype('float32'), extend = 1, index = ib)
+                out.write(isonId, isonVarBowl, [0,ib])
+                out.write(isonId+'Std', isonVarStd, [0,ib])
 
                 #if ib == 0 and iv == 0:
                 #    # TODO review
@@ -662,100 +838,230 @@ def mmeAveMsk3D(listFiles, years, inDir, outDir, outFile, timeInt, mme, ToeType,
                 #    bowlRead = f1d(varsig,time = slice(t1,t2),lev = slice(ib,ib1))
                 #    f1d.close()
                 #    siglimit = cdu.averager(bowlRead, axis=0)  - delta_rho
-                # TODO: remove loop by building global array with 1/0
-                #if sw2d == 1:
-                #    for il in range(latN):
-                #        for ib in range(basN):
-                #            #if ib == 2:
-                #            #    print il, siglimit[ib,il]
-                #            if siglimit[ib,il] < valmask/1000.:
-                #                 # if mme bowl density defined, mask above bowl
-                #                index = (npy.argwhere(sigmaGrd[:] >= siglimit[ib,il]))
-                #                isonVarBowl [:,ib,0:index[0],il].mask = True
-                #                isonVarStd  [:,ib,0:index[0],il].mask = True
-                #                vardiffsgSum[:,ib,0:index[0],il].mask = True
-                #            else:
-                #                # mask all points
-                #                isonVarBowl [:,ib,:,il].mask = True
-                #                isonVarStd  [:,ib,:,il].mask = True
-                #                vardiffsgSum[:,ib,:,il].mask = True
+                #    isonVarBowl.mask = isonVarBowl.mask | bowlMask(sigmaGrd[ib:ib1], siglimit, valmask, axis=0)
             # mm case
             else:
-                isonVarBowl = isonVarAve*1. # start from variable
-                #isonVarStd  = isonVarAve*1. # start from variable
-                if ib == 0 and iv == 0:
-                    # build bowl position
-                    siglimit = cdu.averager(varbowl, axis=0) # average accross members
-                    siglimit = npy.reshape(siglimit,[timN*latN*lonN]) - delta_rho
-                if iv == 0:
-                    sigarr = siglimit*1.
-                    sigarr[:] = sigmaGrd[ib]
-                # test
-                i = 60
-                j = 60
-                ij = j*lonN+i
-                isonVarBowl = npy.reshape(isonVarBowl,[timN*latN*lonN])
-                #vardiffsgSum = npy.reshape(vardiffsgSum,[timN*latN*lonN])
-
-                isonVarBowl.mask = npy.where(sigarr < siglimit, True, isonVarBowl.mask)
-                #vardiffsgSum.mask = npy.where(sigarr < siglimit, True, vardiffsgSum.mask)
-
-                isonVarBowl = npy.reshape(isonVarBowl,[timN,latN,lonN])
-                #vardiffsgSum = npy.reshape(vardiffsgSum,[timN,latN,lonN])
+                # average variable accross members
+                isonVarAve = ensStatsGet(statsVar, 'mean', valmask)
+                # mask
+                if varFill[iv] == valmask:
+                    isonVarAve = maskVal(isonVarAve, valmask)
+                isonVarAve.mask = percentMask
 
+                isonVarBowl = isonVarAve*1. # start from variable
+                # mask above (time varying) bowl [time,rho,lat,lon]
+                isonVarBowl.mask = npy.ma.getmaskarray(isonVarBowl) | bowlMask(sigmaGrd[ib:ib1], siglimit, valmask, axis=1)
                 isonVarBowl = maskVal(isonVarBowl, valmask)
-                #vardiffsgSum = maskVal(vardiffsgSum, valmask)
                 # Find max of Std dev of all members
-                isonVarStd = npy.ma.max(varstd, axis=0)
+                isonVarStd = ensStatsGet(statsStd, 'max', valmask)
                 # mask
                 isonVarStd = maskVal(isonVarStd, valmask)
 
                 # Write
-                #isonave = cdm.createVariable(isonVarAve, axes = sigmaTimeList, id = isonRead.id)
-                #isonave.long_name = isonRead.long_name
-                #isonave.units     = isonRead.units
-                #vardiffsgSum = npy.reshape(vardiffsgSum,[delta_ib,timN,latN,lonN])
-                #isonavediff = cdm.createVariable(vardiffsgSum, axes = sigmaTimeList, id = isonRead.id+'Agree')
-                #isonavediff.long_name = isonRead.long_name
-                #isonavediff.units     = isonRead.units
-                isonVarBowl = npy.reshape(isonVarBowl,[delta_ib,timN,latN,lonN])
-                isonavebowl = cdm.createVariable(isonVarBowl, axes = sigmaTimeList, id = isonRead.id+'Bowl')
-                isonavebowl.long_name = isonRead.long_name
-                isonavebowl.units     = isonRead.units
-                isonVarStd = npy.reshape(isonVarStd,[delta_ib,latN,lonN])
-                isonmaxstd = cdm.createVariable(isonVarStd, axes = sigmaList, id = isonRead.id+'Std')
-                isonmaxstd.long_name = isonRead.long_name
-                isonmaxstd.units     = isonRead.units
-
-                #outFile_f.write(    isonave.astype('float32'), extend = 1, index = ib)
-                #outFile_f.write(isonavediff.astype('float32'), extend = 1, index = ib)
-                outFile_f.write(isonavebowl.astype('float32'), extend = 1, index = ib)
-                outFile_f.write(isonmaxstd.astype('float32'), extend = 1, index = ib)
-
-            tim3 = timc.clock()
-
-            if ToeType == 'histnat':
-                isontoe1 = cdm.createVariable(varToE1, axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'ToE1')
-                isontoe1.long_name = 'ToE 1 for '+isonRead.long_name
-                isontoe1.units     = 'Year'
-                isontoe2 = cdm.createVariable(varToE2, axes = [ensembleAxis,axesList[1],axesList[2],axesList[3]], id = isonRead.id+'ToE2')
-                isontoe2.long_name = 'ToE 2 for '+isonRead.long_name
-                isontoe2.units     = 'Year'
-                outFile_f.write(isontoe1.astype('float32'), extend = 1, index = ib)
-                outFile_f.write(isontoe2.astype('float32'), extend = 1, index = ib)
-
-            tim4 = timc.clock()
+                #out.write(isonId, isonVarAve, [0,ib])
+                #out.write(isonId+'Agree', vardiffsgSum, [0,ib])
+                out.write(isonId+'Bowl', isonVarBowl, [0,ib])
+                out.write(isonId+'Std', isonVarStd, [ib])
+
+            del(statsVar,statsStd)
         # <--- end of loop on variables
 
-        #print 'ib, timing',ib, tim01-tim0,tim1-tim01,tim2-tim1,tim3-tim2,tim4-tim3
     # <--- end of loop on density
     print ' '
+    for ft in fts:
+        ft.close()
 
-    outFile_f.close()
+    # Compute ToE (out-of-core, by tiles) against mean and Std dev from histnat
+    if ToeType == 'histnat' and not mme:
+        model  = listFiles[0].split('.')[1]
+        filehn = glob.glob(inDir[1]+'/cmip5.'+model+'.*3D*')[0]
+        streamToE3D(listFiles, inDir[0], filehn, [atts[var][0] for var in varList], [t1,t2], out, memMax, valmask)
+
+    out.close()
     fi.close()
 
 
-def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, ToeType, fullTS, debug=True):
+def streamToE3D(listFiles, inDir, fileHn, varList, years, out, memMax=2., valmask=1.e20):
+    '''
+    The streamToE3D() function computes the ToE (toemult 1 and 2) of each member of a rhon/lat/lon density
+    bined ensemble out-of-core: member signals and the histNat mean are read by spatial tiles (blocks of
+    levels and latitude rows), signal minus histNat mean is compared to the histNat noise tile by tile and
+    the ToE maps are written as each tile is done
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    -------
+    - listFiles(str)         - the list of member files
+    - inDir(str)             - input directory where member files are stored
+    - fileHn(str)            - histNat ensemble file: mean <var>Bowl [time,rho,lat,lon] and noise <var>Std [rho,lat,lon]
+    - varList(str)           - variables (ids in the member files)
+    - years(t1,t2)           - years for slice read of members
+    - out                    - NetcdfWriter holding <var>ToE1 and <var>ToE2 [members,rho,lat,lon]
+    - memMax <optional>      - memory budget (GB) setting the tile size
+    - valmask <optional>     - mask value
+
+    Usage:
+    ------
+    >>> from libDensityPostpro import streamToE3D
+    >>> streamToE3D(listFiles, inDir, fileHn, ['isondepthgBowl'], [0,145], out)
+
+    Notes:
+    -----
+    - EG 18 Oct 2026   - Initial function write
+    - Only one tile of the histNat mean and of one member are in memory (members share a read buffer),
+      plus the 3D noise of the variable
+    - ToE is the time index in the member window (timN where not reached, see findToEMulti)
+    '''
+    import cdms2 as cdm
+
+    t1   = years[0]
+    t2   = years[1]
+    timN = t2-t1
+    fthn = cdm.open(fileHn)
+    levN, latN, lonN = fthn[varList[0]+'Std'].shape
+    # tile size: about 24 bytes per point and time (member, histNat mean, signal, ratio)
+    npts = max(1, int(memMax*1.e9/(timN*24.)))
+    if npts >= latN*lonN:
+        levB = min(levN, npts/(latN*lonN))
+        latB = latN
+    else:
+        levB = 1
+        latB = max(1, min(latN, npts/lonN))
+    print ' ToE tiles of',levB,'levels x',latB,'latitudes'
+
+    for var in varList:
+        print ' ToE for ',var
+        noise   = fthn(var+'Std')
+        readHn  = NetcdfReader(fileHn, var+'Bowl', valmask, fixUnits=False)
+        readers = [NetcdfReader(inDir+'/'+fileName, var, valmask, fixUnits=False) for fileName in listFiles]
+        buf     = None
+        for k0 in range(0, levN, levB):
+            k1 = min(k0+levB, levN)
+            for j0 in range(0, latN, latB):
+                j1 = min(j0+latB, latN)
+                hnMean = readHn.read(0, timN, levels=slice(k0,k1), rows=slice(j0,j1))
+                noiseT = noise[k0:k1,j0:j1]
+                if buf is None or buf.shape != hnMean.shape:
+                    buf = npy.empty(hnMean.shape, dtype=hnMean.dtype)
+                for i,reader in enumerate(readers):
+                    signal  = reader.read(t1, t2, levels=slice(k0,k1), rows=slice(j0,j1), out=buf)
+                    signal -= hnMean
+                    toe = findToEMulti(signal, noiseT, [1.,2.])
+                    out.write(var+'ToE1', toe[0][npy.newaxis], [i,k0,j0])
+                    out.write(var+'ToE2', toe[1][npy.newaxis], [i,k0,j0])
+                    del(signal,toe)
+        for reader in readers+[readHn]:
+            reader.close()
+        del(noise,buf)
+    fthn.close()
+
+def mmePartial1D(fileName, inDir, varList, years, valmask):
+    '''
+    The mmePartial1D() function returns the partial aggregates of one model to a 1D (bowl and persistent
+    ocean) or lat/lon (bowl) multi-model mean: running statistics of the model ensemble mean of each
+    variable, of its sign agreement (<var>Agree) and of its non-masked bins. They are stored next to the
+    model ensemble file (<file>.partials.npz) and read from there while the model file and years are unchanged
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    -------
+    - fileName(str)          - model ensemble mean file (mm output of mmeAveMsk1D)
+    - inDir(str)             - directory of fileName
+    - varList                - variables (as in mmeAveMsk1D)
+    - years(t1,t2)           - years for slice read (t2 <= 0: last -t2 years)
+    - valmask                - mask value
+
+    Output:
+    - partial                - dictionary of running statistics: 'percent', '<var>.ave', '<var>.agree'
+    - meta                   - dictionary: 'key' (model file and years), 'atts', 'window', 'tmax'
+
+    Usage:
+    ------
+    >>> from libDensityPostpro import mmePartial1D
+    >>> partial, meta = mmePartial1D(fileName, inDir, ['ptopdepth','ptopsigma'], [0,145], valmask)
+
+    Notes:
+    -----
+    - EG 18 Oct 2026   - Initial function write
+    '''
+    fileIn      = inDir+'/'+fileName
+    filePartial = fileIn[:-3]+'.partials.npz'
+    key = _partialKey(fileIn, years)
+    if os.path.isfile(filePartial):
+        partial, meta = ensStatsRead(filePartial)
+        if meta['key'] == key:
+            return partial, meta
+    import cdms2 as cdm
+    import MV2 as mv
+
+    ft   = cdm.open(fileIn)
+    tmax = ft.getAxis('time').shape[0]
+    t1 = years[0]
+    t2 = years[1]
+    #adapt [t1,t2] time bounds to piControl last NN years
+    if t2 <= 0:
+        t1 = tmax+t2
+        t2 = tmax
+    partial = {}
+    atts    = {}
+    for iv,var in enumerate(varList):
+        isonRead = ft(var, time = slice(t1,t2))
+        # percentage of non-masked points accros MME (mask of first variable)
+        if iv == 0:
+            maskvar = npy.ma.getmaskarray(mv.masked_values(isonRead.data,valmask))
+            partial['percent'] = ensStatsAdd(ensStatsInit(maskvar.shape), npy.float32(npy.equal(maskvar,0)))
+        partial[var+'.ave']   = ensStatsAdd(ensStatsInit(isonRead.shape), isonRead)
+        partial[var+'.agree'] = ensStatsAdd(ensStatsInit(isonRead.shape), ft(var+'Agree', time = slice(t1,t2)))
+        atts[var] = [isonRead.id, isonRead.long_name, isonRead.units]
+        del(isonRead)
+    ft.close()
+    meta = {'key':key, 'atts':atts, 'window':[t1,t2], 'tmax':tmax}
+    ensStatsWrite(filePartial, partial, meta)
+    return partial, meta
+
+def mmeMerge1D(listFiles, inDir, outDir, outFile, varList, years, valmask):
+    '''
+    The mmeMerge1D() function merges the partial aggregates of the models of a 1D or lat/lon multi-model
+    mean (mmePartial1D), as mmeMerge2D: only models added to or changed in listFiles are read
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    -------
+    - listFiles(str)         - the list of model ensemble mean files
+    - inDir(str)             - input directory where files are stored
+    - outDir(str)            - output directory
+    - outFile(str)           - MME output file
+    - varList                - variables (as in mmeAveMsk1D)
+    - years(t1,t2)           - years for slice read
+    - valmask                - mask value
+
+    Output:
+    - stats                  - dictionary of running statistics accross models (as mmePartial1D), None if
+                               models have different time axes
+    - meta                   - dictionary: 'members' (model file -> key and window), 'years', 'tmax', 'atts'
+
+    Usage:
+    ------
+    >>> from libDensityPostpro import mmeMerge1D
+    >>> stats, meta = mmeMerge1D(listFiles, inDir, outDir, outFile, varList, [0,145], valmask)
+
+    Notes:
+    -----
+    - EG 18 Oct 2026   - Initial function write
+    '''
+    return _mmeMerge(listFiles, inDir, outDir, outFile, years,
+                     lambda fileName: mmePartial1D(fileName, inDir, varList, years, valmask))
+
+def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, ToeType, fullTS, debug=True, partials=True):
     '''
     The mmeAveMsk1D() function averages rhon or scalar density bined files with differing masks
     It ouputs the MME and a percentage of non-masked bins
@@ -774,17 +1080,24 @@ def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, To
     - mme(bool)              - multi-model mean (will read in single model ensemble stats)
     - FfllTS                 - 0/1: if 1, uses full time serie (ignores years(t1,t2))
     - debug <optional>       - boolean value
+    - partials <optional>    - mme: merge the partial aggregates of the models (mmeMerge1D) instead of
+                               reading all model files (not with fullTS)
 
     Notes:
     -----
     - EG 25 Nov 2014   - Initial function write
     - EG  9 Dec 2014   - Add agreement on difference with init period - save as <var>Agree
     - EG 04 Oct 2016   - Add 3D files support
+    - EG 18 Oct 2026   - mme from per model partial aggregates stored next to the model files (partials):
+                         only added or changed models are read
 
     TODO:
     ------
 
     '''
+    import cdms2 as cdm
+    import cdutil as cdu
+    import MV2 as mv
 
     # CDMS initialisation - netCDF compression
     comp = 1 ; # 0 for no compression
@@ -859,12 +1172,12 @@ def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, To
         varList = ['ptopdepth','ptopsigma','ptopso','ptopthetao','volpers','salpers','tempers']
         #varList = ['ptopdepth']
         varDim  = [1,1,1,1,0,0,0]
-        percent  = npy.ma.ones([runN,timN,basN,latN], dtype='float32')*0.
+        percentShape = [timN,basN,latN]
     elif sw2d == 2:
         varList = ['ptopdepthxy','ptopsigmaxy','ptopsoxy','ptopthetaoxy']
         #varList = ['ptopdepthxy']
         varDim  = [2,2,2,2]
-        percent  = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*0.
+        percentShape = [timN,latN,lonN]
 
     varFill = [valmask,valmask,valmask,valmask,valmask,valmask,valmask,valmask,valmask]
 
@@ -872,29 +1185,43 @@ def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, To
     axis0D = [time,axesList[1]]
     print ' timN = ',timN
 
+    memN     = runN
+    listRead = listFiles
+    aggr     = None
+    if mme and partials and not fullTS:
+        # merge the partial aggregates of the models (only new or changed models are read), the MME
+        # is then filled in as a single member
+        aggr, metaAggr = mmeMerge1D(listFiles, inDir[0], outDir, outFile, varList, years, valmask)
+        if aggr is None:
+            outFile_f.close()
+            return
+        memN     = 1
+        listRead = []
+    percent = npy.ma.ones([memN]+percentShape, dtype='float32')*0.
+
     # loop on 1D variables
     for iv,var in enumerate(varList):
         ti0 = timc.clock()
 
         # Array inits
         if varDim[iv] == 2:
-            isonvar = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*valmask
-            vardiff = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*valmask
-            varones = npy.ma.ones([runN,timN,latN,lonN], dtype='float32')*1.
+            isonvar = npy.ma.ones([memN,timN,latN,lonN], dtype='float32')*valmask
+            vardiff = npy.ma.ones([memN,timN,latN,lonN], dtype='float32')*valmask
+            varones = npy.ma.ones([memN,timN,latN,lonN], dtype='float32')*1.
             axisVar = axis1D
         elif varDim[iv] == 1:
-            isonvar = npy.ma.ones([runN,timN,basN,latN], dtype='float32')*valmask
-            vardiff = npy.ma.ones([runN,timN,basN,latN], dtype='float32')*valmask
-            varones = npy.ma.ones([runN,timN,basN,latN], dtype='float32')*1.
+            isonvar = npy.ma.ones([memN,timN,basN,latN], dtype='float32')*valmask
+            vardiff = npy.ma.ones([memN,timN,basN,latN], dtype='float32')*valmask
+            varones = npy.ma.ones([memN,timN,basN,latN], dtype='float32')*1.
             axisVar = axis1D
         else:
-            isonvar = npy.ma.ones([runN,timN,basN], dtype='float32')*valmask
-            vardiff = npy.ma.ones([runN,timN,basN], dtype='float32')*valmask
-            varones = npy.ma.ones([runN,timN,basN], dtype='float32')*1.
+            isonvar = npy.ma.ones([memN,timN,basN], dtype='float32')*valmask
+            vardiff = npy.ma.ones([memN,timN,basN], dtype='float32')*valmask
+            varones = npy.ma.ones([memN,timN,basN], dtype='float32')*1.
             axisVar = axis0D
         print ' Variable ',iv, var, varDim[iv]
         # loop over files to fill up array
-        for ic,file in enumerate(listFiles):
+        for ic,file in enumerate(listRead):
             ft      = cdm.open(inDir[0]+'/'+file)
             timeax  = ft.getAxis('time')
             try:
@@ -1008,7 +1335,14 @@ def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, To
                 vardiff[ic,...].mask = isonvar[ic,...].mask
 
             ft.close()
+            varAtts = [isonRead.id, isonRead.long_name, isonRead.units]
         # <-- end of loop on files
+        if aggr is not None:
+            isonvar[0,...] = ensStatsGet(aggr[var+'.ave'], 'mean', valmask)
+            vardiff[0,...] = ensStatsGet(aggr[var+'.agree'], 'mean', valmask)
+            if iv == 0:
+                percent[0,...] = ensStatsGet(aggr['percent'], 'mean', valmask)
+            varAtts = [str(att) for att in metaAggr['atts'][var]]
         # TODO remove masked points at longitudes 0 or 180deg for some models
         # if ptopdepthxy, keep for ptopsigmaxy computation (reconstruct from isondepthg and ptopdepthxy)
         if var =='ptopdepthxy':
@@ -1047,12 +1381,12 @@ def mmeAveMsk1D(listFiles, sw2d, years, inDir, outDir, outFile, timeInt, mme, To
         isonVarAve.mask = percentw.mask
 
         # Write
-        isonave = cdm.createVariable(isonVarAve, axes = axisVar, id = isonRead.id)
-        isonave.long_name = isonRead.long_name
-        isonave.units     = isonRead.units
-        isonavediff = cdm.createVariable(vardiffsgSum, axes = axisVar, id = isonRead.id+'Agree')
-        isonavediff.long_name = isonRead.long_name
-        isonavediff.units     = isonRead.units
+        isonave = cdm.createVariable(isonVarAve, axes = axisVar, id = varAtts[0])
+        isonave.long_name = varAtts[1]
+        isonave.units     = varAtts[2]
+        isonavediff = cdm.createVariable(vardiffsgSum, axes = axisVar, id = varAtts[0]+'Agree')
+        isonavediff.long_name = varAtts[1]
+        isonavediff.units     = varAtts[2]
 
         outFile_f.write(isonave.astype('float32'))
         outFile_f.write(isonavediff.astype('float32'))
@@ -0,0 +1,90 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+'''
+ libToECore.py contains the numpy only Time of Emergence (ToE) kernels, shared by the density binning
+ post-processing (python 2: libDensityCore.py, libToE.py, libDensityPostpro.py) and the analysis
+ programs of Yona_analysis/programs (python 3: libToE.py), so that there is a single implementation
+
+EG  18 Oct 2026     - Started file: findToEMulti, findToE (moved from libDensityCore.py)
+'''
+
+import numpy as npy
+
+
+def findToEMulti(signal, noise, mults, tidx=None, unemerged=None):
+    '''
+    The findToEMulti() function computes the Time of Emergence (ToE) for several thresholds at once:
+    ToE is the first time index of the last period during which abs(signal) >= mult*noise
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - signal[time,space]        - signal (or signal[time]), masked points never emerge
+    - noise                     - scalar or noise[space], or [noise1,noise2] if tidx is given
+    - mults                     - list of multipliers of noise (thresholds)
+    - tidx <optional>           - time index of noise change: noise1 used before tidx, noise2 after
+    - unemerged <optional>      - value where ToE is not reached (default: timN)
+
+    Output:
+    - toe[mult,space]           - ToE index for each multiplier (toe[mult] for signal[time])
+
+    Usage:
+    ------
+    >>> from libToECore import findToEMulti
+    >>> toe = findToEMulti(signal, noise, [1.,2.], unemerged=valmask)
+    >>> toe = findToEMulti(signal, [noise1,noise2], [2.], tidx=145)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version, replaces the tile/argwhere/flipud algorithm of findToE
+    - The ratio abs(signal)/noise is computed once and reduced by a single reverse cumulative
+      minimum along time: the last period above mult*noise is where this minimum is >= mult,
+      its length gives ToE for all multipliers (no tiling of noise)
+    - Points above the threshold over the whole period have ToE = 0 (findToE gave timN)
+    '''
+    timN  = signal.shape[0]
+    shape = signal.shape[1:]
+    ratio = npy.abs(npy.reshape(npy.ma.getdata(signal), (timN,-1)))
+    if ratio.dtype.kind != 'f':
+        ratio = ratio.astype('float64')
+    if tidx is None:
+        noises = [[0, timN, noise]]
+    else:
+        noises = [[0, tidx, noise[0]], [tidx, timN, noise[1]]]
+    for t0,t1,nois in noises:
+        # masked noise: never emerge
+        nois = npy.ma.filled(npy.ma.asarray(nois, dtype=ratio.dtype), -1.)
+        if nois.size > 1:
+            nois = npy.reshape(nois, (1,-1))
+        seg = ratio[t0:t1]
+        zero = (seg == 0.) & (nois == 0.)
+        with npy.errstate(divide='ignore', invalid='ignore'):
+            seg /= nois
+        seg[zero] = npy.inf ; # 0 >= mult*0
+    ratio[npy.isnan(ratio)] = -1.
+    ratio[npy.reshape(npy.ma.getmaskarray(signal), ratio.shape)] = -1.
+    # minimum of the ratio from each time to the end (reverse cumulative pass)
+    npy.minimum.accumulate(ratio[::-1], axis=0, out=ratio[::-1])
+    toe = []
+    for mult in mults:
+        # length of the last period above threshold
+        nlast = npy.sum(ratio >= mult, axis=0)
+        toek  = timN - nlast
+        if unemerged is not None:
+            toek = npy.where(nlast == 0, unemerged, toek)
+        toe.append(npy.reshape(toek, shape))
+    return npy.array(toe)
+
+def findToE(signal, noise, mult, unemerged=None):
+    '''
+    define Time of Emergence (ToE) from last time index at which signal is larger than mult*noise
+        signal is [time,space]
+        noise is [space]
+        mult is float
+        unemerged is the value where ToE is not reached (default timN)
+    (one threshold of findToEMulti)
+    '''
+    return findToEMulti(signal, noise, [mult], unemerged=unemerged)[0]
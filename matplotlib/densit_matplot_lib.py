@@ -266,14 +266,24 @@ def bluecol():
 
 # - average in lat/rho domain
 
+def domainIndex(domain, lat, rho):
+    '''
+    Index bounds [ridx1, ridx2, lidx1, lidx2] of a [latmin, latmax, rhomin, rhomax] box on the rho/lat grids
+    The box average is taken over [ridx1:ridx2] and [lidx1:lidx2] (as in averageDom)
+    Returns None if the box is not defined or does not intersect the grid
+    (same as domainIndex in Yona_analysis/programs/maps_matplot_lib.py, which also has the batched averageDomains)
+    '''
+    if domain is None:
+        return None
+    latidx = np.flatnonzero((lat >= domain[0]) & (lat <= domain[1]))
+    rhoidx = np.flatnonzero((rho >= domain[2]) & (rho <= domain[3]))
+    if latidx.size == 0 or rhoidx.size == 0:
+        return None
+    return [rhoidx[0], rhoidx[-1], latidx[0], latidx[-1]]
+
 def averageDom(field, dim, domain, lat, rho):
 
-    latidx = np.argwhere((lat >= domain[0]) & (lat <= domain[1])).transpose()
-    rhoidx = np.argwhere((rho >= domain[2]) & (rho <= domain[3])).transpose()
-    lidx1 = latidx[0][0];
-    lidx2 = latidx[0][-1]
-    ridx1 = rhoidx[0][0];
-    ridx2 = rhoidx[0][-1]
+    ridx1, ridx2, lidx1, lidx2 = domainIndex(domain, lat, rho)
     if dim == 3:
         vara = np.ma.average(field[:, ridx1:ridx2, :], axis=1)
         var_ave = np.ma.average(vara[:, lidx1:lidx2], axis=1)
@@ -283,10 +293,56 @@ def averageDom(field, dim, domain, lat, rho):
 
     return var_ave
 
+def binToZ(fieldr, depthr, volumr, targetz, v='S'):
+    '''
+    Assign every isopycnal to its target z layer [targetz[k],targetz[k+1]) with a sorted search and compute
+    the volume-weighted mean of the field in each layer (sum of the field for volume, v='V')
+    - fieldr, depthr, volumr: [..., density, latitude] (any leading dimensions, e.g. time, basin)
+    Returns fieldz, volumez [..., depth, latitude], masked where the layer is empty or gets a masked value
+    (the last target level is always masked)
+    '''
+    targetz = np.asarray(targetz, dtype='float64')
+    fieldr = np.ma.asarray(fieldr)
+    lead = fieldr.shape[:-2]
+    rhoN, latN = fieldr.shape[-2:]
+    levN = len(targetz)
+    colN = int(np.prod(lead))
+    shape = (colN, rhoN, latN)
+
+    depth = np.reshape(np.ma.filled(np.ma.asarray(depthr, dtype='float64'), np.nan), shape)
+    kz = np.searchsorted(targetz, depth, side='right') - 1
+    ok = (kz >= 0) & (kz < levN-1) & ~np.isnan(depth)
+    if v != 'V':
+        volum = np.reshape(np.ma.filled(np.ma.asarray(volumr, dtype='float64'), 0.), shape)
+        ok &= volum != 0.
+    else:
+        volum = np.ones(shape)
+
+    # flat index of the [column, z, lat] cell of each isopycnal
+    idx = (np.arange(colN)[:, None, None]*levN + kz)*latN + np.arange(latN)[None, None, :]
+    idx = idx[ok]
+    cellN = colN*levN*latN
+    field = np.reshape(fieldr.filled(0.), shape)
+    fsum = np.bincount(idx, weights=(field*volum)[ok], minlength=cellN)
+    vsum = np.bincount(idx, weights=volum[ok], minlength=cellN)
+    bad = np.bincount(idx, weights=np.reshape(np.ma.getmaskarray(fieldr), shape)[ok], minlength=cellN)
+
+    if v != 'V':
+        empty = (vsum == 0.) | (bad > 0)
+        fieldz = fsum/np.where(empty, 1., vsum)
+    else:
+        empty = (fsum == 0.) | (bad > 0)
+        fieldz = fsum
+    shapez = lead + (levN, latN)
+    fieldz = np.ma.array(np.reshape(fieldz, shapez), mask=np.reshape(empty, shapez), dtype='float32')
+    volumez = np.ma.array(np.reshape(vsum, shapez), mask=np.reshape(empty, shapez), dtype='float32')
+
+    return fieldz, volumez
+
 def remapToZ(fieldr,depthr,volumr, valmask, targetz):
     '''
     The remaToZ() function remaps a density bined zonal field back to z
-    It starts from the surface and computes the mean field for each z level, using the zonal volume of isopycnals for weighting
+    It computes the mean field for each z level, using the zonal volume of isopycnals for weighting
 
     Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
 
@@ -294,14 +350,14 @@ def remapToZ(fieldr,depthr,volumr, valmask, targetz):
 
     Inputs:
     ------
-    - fieldr     - field (T or S)       - 3D density,latitude,time array
-    - depthr     - depth of isopycnals  - 3D density,latitude,time array
-    - volumr     - volume of isopycnals - 3D density,latitude,time array
+    - fieldr     - field (T or S)       - 4D time,basin,density,latitude array
+    - depthr     - depth of isopycnals  - 4D time,basin,density,latitude array
+    - volumr     - volume of isopycnals - 4D time,basin,density,latitude array
     - valmaks    - value of masked points
     - targetz    - target z grid        - 1D
 
     Output:
-    - fieldz    - 3D depth,latitude,time array
+    - fieldz    - 4D time,basin,depth,latitude array (valmask where no data)
 
     Usage:
     ------
@@ -309,69 +365,14 @@ def remapToZ(fieldr,depthr,volumr, valmask, targetz):
     Notes:
     -----
     - EG 18 Aug 2016   - Initial function write
+    - EG 18 Oct 2026   - Vectorized with binToZ (same as Yona_analysis/programs/maps_matplot_lib.py), all
+                         times and basins are now remapped; depthr is no longer modified
    '''
+    # points at valmask are missing
+    fieldr = np.ma.masked_greater_equal(fieldr, valmask/10.)
+    depthr = np.ma.masked_greater_equal(depthr, valmask/10.)
+    volumr = np.ma.masked_greater_equal(volumr, valmask/10.)
 
-    latN = fieldr.shape[3]
-    rhoN = fieldr.shape[2]
-    basN = fieldr.shape[1]
-    timN = fieldr.shape[0]
-
-    levN = len(targetz)
+    fieldz = binToZ(fieldr, depthr, volumr, targetz)[0]
 
-    # init fieldx array
-    fieldz  = np.ma.ones([timN, basN, levN, latN], dtype='float32')*valmask
-    fieldz_vol = np.ma.ones([levN], dtype='float32')*valmask
-    volumez = np.ma.ones([levN], dtype='float32')*valmask
-    # Method 1: loop on vertical levels of target grid - may lead to levels missing data
-    method = 1
-    if method == 1:
-        #for t in range(timN):
-        for t in range(1):
-            for j in range(latN):
-                for k in range(levN-1):
-                    field_int = 0.
-                    volum_int = 0.
-                    for r in range(rhoN):
-                        if volumr[t,0,r,j] <> 0:
-                            if depthr[t,0,r,j] >= targetz[k] and depthr[t,0,r,j] < targetz[k+1]:
-                                field_int = field_int + fieldr[t,0,r,j]*volumr[t,0,r,j]
-                                volum_int = volum_int + volumr[t,0,r,j]
-                                depthr[t,0,r,j] = -100. # to speed up search for next depths
-                    if volum_int <> 0.:
-                        fieldz[t,0,k,j] = field_int / volum_int
-    # Method 2: interpolation (reverse of what was done in binDensity.py:)
-    # interpolate depth(z) (=z_zt=zzm) to depth(s) at s_s densities (=z_s) using density(z) (=s_z=szm)
-    # for i in range(lonN*latN):
-    #     if nomask[i]:
-    #         z_s [0:N_s,i] = npy.interp(s_s[:,i], szm[:,i], zzm[:,i], right = valmask) ; # depth - consider spline
-    #         c1_s[0:N_s,i] = npy.interp(z_s[0:N_s,i], zzm[:,i], c1m[:,i], right = valmask) ; # thetao
-    #         c2_s[0:N_s,i] = npy.interp(z_s[0:N_s,i], zzm[:,i], c2m[:,i], right = valmask) ; # so
-    if method == 2:
-        #for t in range(timN):
-        for t in range(1):
-            for j in range(latN-1):
-                print 'j=',j
-                nomask = np.argwhere(volumr[t,0,:,j] < valmask/10.)
-                print nomask
-                if len(nomask) >= 2:
-                    print depthr[t,0,nomask,j], fieldr[t,0,nomask,j]
-                    print 'vol:',volumr[t,0,nomask,j]
-                    depr = depthr[t,0,nomask,j]
-                    fxvol = fieldr[t,0,nomask,j]*volumr[t,0,nomask,j]
-                    volr = volumr[t,0,nomask,j]
-                    print len(fxvol), len(depr), len(targetz)
-                    fieldz_vol[:] = np.interp(targetz,depr,fxvol, right=valmask)
-                    volumez[:]    = np.interp(targetz,depr,volr, right=valmask)
-                    print 'fld_*vol_interp:',fieldz_vol
-                    print 'volumez:', volumez
-                    for k in range(levN):
-                        if volumez[k] <> 0.:
-                            fieldz[t,0,k,j] = fieldz_vol[k]/volumez[k]
-                    print fieldz[t,0,:,j]
-
-
-
-
-
-
-    return fieldz
+    return fieldz.filled(valmask)
@@ -15,6 +15,8 @@ warnings.filterwarnings("ignore")
 # May 2016   : add obs support
 # Nov 2016   : add 3D files support
 # Jan 2017   : add picontrol and 1pctCo2 support
+# Oct 2026   : MME (2D) merged from per model partial aggregates (mmePartials)
+# Oct 2026   : MME (1D) merged from per model partial aggregates (mmePartials)
 #
 # TODO : add arguments to proc for INIT part (exper, raw, fullTS, test, keepfiles, oneD/twoD, mm/mme, ToE...) or per step
 #
@@ -68,6 +70,10 @@ exper = 'rcp85'
 # Time mean/max bowl calculation used to mask out bowl
 timeBowl = 'max'
 
+# MME from per model partial aggregates (<file>.partials.npz next to the mm files): adding or removing
+# a model only reads that model (1D and zonal 2D files, the lat/lon 3D MME still reads all models)
+mmePartials = True
+
 if twoD:
     correctF = False # already done for oneD
 # ToE
@@ -387,7 +393,7 @@ if mme:
             print ' -> IGNORE: mme of',outFile,'already in',outdir
         else:
             if dim == 1:
-                mmeAveMsk2D(listens,idxtime,indir,outdir,outFile,timeInt,mme,timeBowl,ToeType)
+                mmeAveMsk2D(listens,idxtime,indir,outdir,outFile,timeInt,mme,timeBowl,ToeType,partials=mmePartials)
             elif dim ==2:
                 mmeAveMsk3D(listens,idxtime,indir,outdir,outFile,timeInt,mme,ToeType)
             print 'Wrote ',outdir+'/'+outFile
@@ -396,7 +402,7 @@ if mme:
         if os.path.isfile(outdir+'/'+outFile1) & keepFiles:
             print ' -> IGNORE: mme of',outFile1,'already in',outdir
         else:
-            mmeAveMsk1D(listens1,dim,idxtime,indir,outdir,outFile1,timeInt,mme,ToeType,False)
+            mmeAveMsk1D(listens1,dim,idxtime,indir,outdir,outFile1,timeInt,mme,ToeType,False,partials=mmePartials)
             print 'Wrote ',outdir+'/'+outFile1
 tcpu1 = timc.clock()
 
@@ -0,0 +1,55 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Test the MME from per model partial aggregates (mmeMerge1D, mmeMerge2D): after adding models and
+# removing all but one, the merged statistics must equal those of the remaining model, with a finite
+# intermodel std that is 0 where one model is left
+#
+# Oct 2026 EG
+#
+# ----------------------------------------
+#
+import os,shutil,tempfile
+import numpy as npy
+from libDensityCore import ensStatsAdd,ensStatsGet,ensStatsInit
+from libDensityIO import ensStatsWrite
+from libDensityPostpro import _partialKey,mmeMerge1D,mmeMerge2D
+
+valmask = 1.e20
+years   = [0,4]
+shape   = [4,2,6,5]
+rs      = npy.random.RandomState(7)
+workDir = tempfile.mkdtemp()
+
+def model(fileName, names):
+    # model ensemble mean file and its partial aggregates (as written by mmePartial1D/mmePartial2D)
+    open(workDir+'/'+fileName,'w').write(fileName)
+    partial = {'percent':ensStatsAdd(ensStatsInit(shape[1:]), npy.float32(rs.rand(*shape[1:]) > 0.2))}
+    for name in names:
+        field = npy.ma.array(npy.float32(rs.randn(*shape)*1.e3+1.e4), mask=rs.rand(*shape) < 0.1)
+        partial[name] = ensStatsAdd(ensStatsInit(shape, std=name.endswith('.bowl')), field)
+    ensStatsWrite(workDir+'/'+fileName[:-3]+'.partials.npz', partial,
+                  {'key':_partialKey(workDir+'/'+fileName, years), 'atts':{}, 'window':years, 'tmax':years[1]})
+    return partial
+
+try:
+    for dim,merge,names in [['1D', lambda files: mmeMerge1D(files, workDir, workDir, 'mme_1D.nc', ['ptopdepth'], years, valmask),
+                             ['ptopdepth.ave','ptopdepth.agree']],
+                            ['2D', lambda files: mmeMerge2D(files, workDir, workDir, 'mme_2D.nc', ['isonso'], [valmask], years, valmask),
+                             ['isonso.ave','isonso.agree','isonso.bowl']]]:
+        files = ['cmip5.model%d.%s.nc' % (i,dim) for i in range(3)]
+        partials = [model(fileName, names) for fileName in files]
+        merge(files)
+        # remove two models: one left
+        stats, meta = merge(files[:1])
+        assert sorted(meta['members'].keys()) == files[:1]
+        for name in names:
+            ref = ensStatsGet(partials[0][name], 'mean', valmask)
+            ave = ensStatsGet(stats[name], 'mean', valmask)
+            assert (ave.mask == ref.mask).all() and npy.allclose(ave.filled(0), ref.filled(0), rtol=1.e-6)
+            if 'M2' in stats[name]:
+                std = ensStatsGet(stats[name], 'std', valmask)
+                assert npy.isfinite(std.data).all() and (std.filled(0) == 0).all()
+        print ' ',dim,'MME partials test passed'
+finally:
+    shutil.rmtree(workDir)
@@ -0,0 +1,159 @@
+#!/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Remap the density binned 3D outputs of densityBin back to depth levels
+
+Reads the [time,rho,lat,lon] target grid outputs of binDensity.densityBin (isondepthg, isonthickg
+and binned fields thetaog, sog..) and writes the fields on depth levels [time,lev,lat,lon]
+- T or S(x,y,z,t) (thickness weighted mean of the isopycnal layers in each depth level)
+- fraction of each depth level filled by isopycnal layers
+
+Python version (for full 4D fields) of Remapping_rho_vers_z.m
+---------------------------------------------------------------------------------
+EG  18 Oct 2026     - Started file: remapRhoToZ, streaming over time chunks, optional process pool
+"""
+
+import gc,timeit
+import multiprocessing as mp
+from libDensityCore import remapColumns
+from libDensityIO import NetcdfReader,NetcdfWriter
+import numpy as npy
+
+# Turn off numpy warnings
+npy.seterr(all='ignore')
+
+# Remap globals - inherited by forked worker processes
+_remapJobs = []
+_remapArgs = None
+
+def _remapChunk(i):
+    '''
+    Read time chunk i of the current remap and remap all its columns to depth (pool worker)
+    '''
+    t0, t1 = _remapJobs[i]
+    inFile, varList, depthVar, thickVar, zbounds, valmask = _remapArgs
+    tic = timeit.default_timer()
+    data = []
+    for var in [depthVar, thickVar] + varList:
+        reader = NetcdfReader(inFile, var, valmask=valmask, fixUnits=False)
+        data.append(reader.read(t0, t1).filled(valmask).astype('float64'))
+        reader.close()
+    timN, rhoN, latN, lonN = data[0].shape
+    # [time,rho,lat,lon] -> columns [rho,time*lat*lon]
+    cols = [x.transpose(1,0,2,3).reshape(rhoN, timN*latN*lonN) for x in data]
+    del data
+    fieldsz, fracz = remapColumns(cols[0], cols[1], cols[2:], zbounds, valmask)
+    levN = len(zbounds) - 1
+    out = [x.reshape(levN, timN, latN, lonN).transpose(1,0,2,3).astype('float32') for x in fieldsz + [fracz]]
+    return t0, out, timeit.default_timer() - tic
+
+def remapRhoToZ(inFile,outFile,zbounds,varList=['thetaog','sog'],depthVar='isondepthg',thickVar='isonthickg',nproc=1,memMax=2.,valmask=1.e20,comp=1,debug=True):
+    '''
+    The remapRhoToZ() function remaps the density binned fields of a densityBin output file
+    to depth levels. Each depth level gets the thickness weighted mean of the isopycnal layers
+    it overlaps, so that heat and salt contents are conserved on each water column
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - inFile                    - densityBin output file (or .xml aggregation) with [time,rho,lat,lon] variables
+    - outFile                   - output netCDF file
+    - zbounds                   - bounds of target depth levels (levN+1 increasing values, in m)
+    -> options:
+    - varList <optional>        - binned fields to remap (default ['thetaog','sog'])
+    - depthVar <optional>       - depth of isopycnals (default 'isondepthg')
+    - thickVar <optional>       - thickness of isopycnals (default 'isonthickg')
+    - nproc <optional>          - number of processes (1 = time chunks processed in sequence)
+    - memMax <optional>         - memory per time chunk (GB), sets the number of years read at once
+    - valmask <optional>        - mask value
+    - comp <optional>           - deflate level of outFile (0 for no compression)
+    - debug <optional>          - print progress
+
+    Output:
+    - outFile with the fields of varList [time,lev,lat,lon] and 'fracz' (fraction of each level filled)
+
+    Usage:
+    ------
+    >>> from remapRhoToZ import remapRhoToZ
+    >>> zbounds = npy.concatenate([npy.arange(0,200,10),npy.arange(200,1000,50),npy.arange(1000,5500,500)])
+    >>> remapRhoToZ(inFile,outFile,zbounds,nproc=4)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - Remapping_rho_vers_z.m computes the depth of the isopycnals filling a zonal section; here all
+      columns of the target grid are remapped at once (remapColumns) for several fields
+    - Time chunks are read, remapped and written one at a time (or nproc at a time), worker processes
+      are forked and return the remapped chunk to the parent which writes it
+    - Levels below the bottom or above the bowl (no isopycnal layer) are valmask, partly filled levels
+      are averaged over their filled part (see fracz)
+    '''
+    global _remapJobs, _remapArgs
+    te0 = timeit.default_timer()
+    zbounds = npy.asarray(zbounds, dtype='float64')
+    levN = len(zbounds) - 1
+    reader = NetcdfReader(inFile, depthVar, valmask=valmask, fixUnits=False)
+    timN, rhoN, latN, lonN = reader.shape
+    timeValues, timeAtts = reader.time(0, timN)
+    # horizontal axes from the first file of inFile
+    fileh = reader.dataset()
+    dims  = fileh.variables[depthVar].dimensions
+    axes  = []
+    for dim in dims[2:]:
+        axis = fileh.variables[dim]
+        axes.append([dim, npy.array(axis[:]), dict([(att, axis.getncattr(att)) for att in axis.ncattrs()])])
+    attsList = [NetcdfReader(inFile, var, valmask=valmask, fixUnits=False).attributes for var in varList]
+    reader.close()
+
+    # Time chunks from memMax: input columns (float64) and outputs
+    sizeYear = (2+len(varList))*rhoN*latN*lonN*8. + (len(varList)+1)*levN*latN*lonN*12.
+    tchunk = int(max(min(memMax*1.e9/sizeYear, timN), 1))
+    _remapJobs = [[t0, min(t0+tchunk, timN)] for t0 in range(0, timN, tchunk)]
+    _remapArgs = [inFile, varList, depthVar, thickVar, zbounds, valmask]
+    if debug:
+        print ' remapRhoToZ:',inFile
+        print '   ',timN,'times in',len(_remapJobs),'chunks of',tchunk,', rho/lat/lon:',rhoN,latN,lonN,', levels:',levN
+
+    out = NetcdfWriter(outFile, comp=comp, valmask=valmask,
+                       attributes={'history':'Remapped to depth from density bins with remapRhoToZ: '+inFile})
+    out.createAxis('time', timeValues, timeAtts, unlimited=True)
+    out.createAxis('lev', 0.5*(zbounds[1:]+zbounds[:-1]),
+                   {'units':'m','long_name':'ocean depth coordinate','positive':'down','axis':'Z'},
+                   bounds=npy.array([zbounds[:-1], zbounds[1:]]).transpose())
+    for dim,values,atts in axes:
+        out.createAxis(dim, values, atts)
+    outDims = ['time','lev'] + [dim for dim,values,atts in axes]
+    for var,atts in zip(varList, attsList):
+        out.createVariable(var, outDims, atts, chunks=[1,1,latN,lonN])
+    out.createVariable('fracz', outDims, {'long_name':'fraction of depth level filled by isopycnal layers','units':'1'},
+                       chunks=[1,1,latN,lonN])
+
+    def _write(result):
+        t0, fields, cpu = result
+        for var,x in zip(varList + ['fracz'], fields):
+            out.write(var, x, [t0])
+        out.sync()
+        if debug:
+            print '   times',t0,'to',t0+fields[0].shape[0],'remapped (CPU',cpu,'s)'
+
+    nproc = max(min(nproc, len(_remapJobs)), 1)
+    try:
+        if nproc > 1:
+            pool = mp.Pool(processes=nproc)
+            try:
+                for result in pool.imap(_remapChunk, range(len(_remapJobs))):
+                    _write(result)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for i in range(len(_remapJobs)):
+                _write(_remapChunk(i))
+    finally:
+        out.close()
+        _remapJobs = [] ; _remapArgs = None ; gc.collect()
+    if debug:
+        print ' remapRhoToZ elapsed: ',timeit.default_timer() - te0,'->',outFile
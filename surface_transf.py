@@ -17,44 +17,268 @@ This script computes water mass transformation from surface buoyancy fluxes in d
 
  Following Walin (1982) and Speer and Tziperman (1992)computes density bins and indexes T,S values from the vertical z
  Uses McDougall and Jackett 2005 EOS (IDL routine provided by G. Madec)
- Uses python seawater package (https://github.com/ocefpaf/python-seawater)
+ Uses EOS-80 coefficients at p=0 as in the python seawater package (https://github.com/ocefpaf/python-seawater)
 ---------------------------------------------------------------------------------
 
 EG   8 Oct 2014     - Started file
 PJD 22 Nov 2014     - Updated to comment out unused statements and imports
+EG  18 Oct 2026     - Transformation binned with bincounts on all bins and basins at once (transfBin)
+EG  18 Oct 2026     - Fields read, computed and written by time blocks (tchunk) with read ahead of the next block
+EG  18 Oct 2026     - Fused surface density and density flux kernel (surfDensFlux) replacing sw.alpha/cp/beta
+EG  18 Oct 2026     - Multi-domain transformation in a single pass with a domain axis (surfDomainMasks)
+EG  18 Oct 2026     - Grid setup shared by the members of a model (surfTransfGrid, surfTransfBatch)
+EG  18 Oct 2026     - Kernels (transfBin, surfDensFlux, surfDomainMasks) moved to libDensityCore, lazy imports
+EG  18 Oct 2026     - Area of density bins written per basin (areabin)
 
 - TODO:
     - add ekman pumping bining (cf wcurl in densit)
-    - add time chunks (as in binDensity.py) to deal with CPU/memory balance
-        - read variables in time loop
-        - add extension in outputs files
 
 
 @author: eguil
 """
 
-import cdms2 as cdm
-import MV2 as mv
-import os, resource
+import gc, os, resource, threading, timeit
+import multiprocessing as mp
 import numpy as npy
-import cdutil as cdu
 
-from binDensity import maskVal
-from binDensity import eosNeutral
-from binDensity import rhonGrid
-from binDensity import computeAreaScale
+from libDensityCore import maskVal, rhonGrid, computeAreaScale
+from libDensityCore import transfBin, surfDensFlux, surfDomainBands, surfDomainMasks ; # re-exported
 import time as timc
-import ESMP
-from cdms2 import CdmsRegrid
-from durolib import fixVarUnits
-import seawater as sw
+from libDensityIO import ReadAhead
+# cdms2, MV2, ESMP and durolib are imported in the functions using them (lazy imports)
 
 #
 # inits
 # -----
 #
 
-def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, debug=True, timeint='all',noInterp=False, domain='global'):
+def readSurfBlock(ftos, fsos, fhef, fwfo, varNames, t0, t1, lock):
+    '''
+    The readSurfBlock() function reads the surface fields of surfTransf for time indices [t0,t1[
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - ftos, fsos, fhef, fwfo    - open cdms2 files of tos, sos, heat and fresh water flux
+    - varNames[4]               - names of the variables
+    - t0, t1                    - time indices to read
+    - lock                      - lock shared with the other accesses to cdms2 files (reads are done on a thread)
+
+    Output:
+    - tos, sos, qnet, emp(time,lat,lon) - fields of the block
+    - empsw                     - 0 (fresh water flux is either wfo or wfos)
+
+    Usage:
+    ------
+    >>> from surface_transf import readSurfBlock
+    >>> tos, sos, qnet, emp, empsw = readSurfBlock(ftos, fsos, fhef, fwfo, varNames, 0, 120, lock)
+    '''
+    tos_name, sos_name, hef_name, wfo_name = varNames[0:4]
+    with lock:
+        tos  = ftos(tos_name , time = slice(t0,t1))
+        sos  = fsos(sos_name , time = slice(t0,t1))
+        qnet = fhef(hef_name , time = slice(t0,t1))
+        try:
+            emp  = fwfo(wfo_name , time = slice(t0,t1))
+            empsw = 0
+        except Exception,err:
+            emp  = fwfo('wfos' , time = slice(t0,t1))
+            if t0 == 0:
+                print ' Reading concentration dillution fresh water flux'
+            empsw = 0
+    return tos, sos, qnet, emp, empsw
+
+def surfTransfGrid(fileTos, tosName, noInterp=False, domain='global', debug=False):
+    '''
+    The surfTransfGrid() function prepares the grid dependent quantities used by surfTransf()
+    (density grid and axis, target grid, area and basin masks, domain masks and regridder)
+    so they can be shared by all the members of a model
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - fileTos(time,lat,lon)     - 3D SST array (source grid)
+    - tosName                   - name of SST variable
+    - noInterp, domain <optional> - as in surfTransf
+    - debug <optional>          - boolean value
+
+    Output:
+    - grid                      - dictionary of grid quantities, passed to surfTransf(...,grid=grid)
+
+    Usage:
+    ------
+    >>> from surface_transf import surfTransfGrid
+    >>> grid = surfTransfGrid(file_tos, 'tos')
+    >>> surfTransf(file_fx, file_tos, file_sos, file_hef, file_wfo, varNames, outFile, grid=grid)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version (setup moved out of surfTransf)
+    - The regridder is built with missing = 1.e20, surfTransf builds its own if a member
+      has another missing value
+    '''
+    import cdms2 as cdm
+    import ESMP
+    from cdms2 import CdmsRegrid
+    ftos  = cdm.open(fileTos)
+    tos   = ftos(tosName , time = slice(0,1))
+    tos_h = ftos[tosName]
+    if debug:
+        print tos_h
+    #
+    # Read input grid
+    ingrid = tos.getGrid()
+    N_i = int(tos.shape[2])
+    N_j = int(tos.shape[1])
+    #
+
+    # Define sigma grid 
+    rho_min = 22
+    rho_int = 25
+    rho_max = 29
+    del_s1  = 0.1
+    del_s2  = 0.05
+    sigrid, s_sax, del_s, N_s = rhonGrid(rho_min, rho_int, rho_max, del_s1, del_s2)
+    #
+    # Density axis of outputs
+    s_axis = cdm.createAxis(s_sax, id = 'rhon')
+    s_axis.long_name = 'Neutral density'
+    s_axis.units = 'kg m-3 (anomaly, minus 1000)'
+    s_axis.designateLevel()
+    #
+    # target horizonal grid for interp 
+    if noInterp:
+        outgrid = ingrid
+        fileg = '/data/vestella/Masks/Mask_Convect_Atlantic_40N.nc'
+        gt = cdm.open(fileg)
+        maskr = gt('mask_part')
+        maski = maskr[...]
+        gt.close
+        #maski = tos[0,...].mask
+        fileg = '/data/vestella/Masks/Mask_Convect_GS.nc'
+        gt = cdm.open(fileg)
+        maskr = gt('mask_part')
+        maskAtl = maskr[...]
+        gt.close
+        fileg = '/data/vestella/Masks/Mask_Convect_SI.nc'
+        gt = cdm.open(fileg)
+        maskr = gt('mask_part')
+        maskPac = maskr[...]
+        gt.close
+        fileg = '/data/vestella/Masks/Mask_Convect_LS.nc'
+        gt = cdm.open(fileg)
+        maskr = gt('mask_part')
+        maskInd = maskr[...]
+        gt.close
+
+        # Read area of target grid and zonal sums
+        areai = npy.ma.ones([N_j, N_i], dtype='float32')*0.
+        fileg = '/data/igcmg/database/grids/ORCA2.3_area.nc'
+        gt = cdm.open(fileg)
+        arear = gt('area')
+        arear_h = gt['area']
+        areai = arear.data[:,:]
+
+        loni  = tos_h.getLongitude()
+        lati  = tos_h.getLatitude()
+
+        Nii   = int(loni.shape[1])
+        Nji   = int(lati.shape[0])
+
+        gt.close
+    else:
+        # Interpolate on WOA grid
+        #fileg = '/work/guilyardi/Density_bining/WOD13_masks.nc'
+        #fileg = '/export/durack1/git/Density_bining/140807_WOD13_masks.nc'
+        fileg = '170224_WOD13_masks.nc'
+        gt = cdm.open(fileg)
+        maskg = gt('basinmask3')
+        outgrid = maskg.getGrid()
+        # global mask
+        maski = maskg.mask
+        # regional masks
+        maskAtl = maski*1 ; maskAtl[...] = False
+        idxa = npy.argwhere(maskg == 1).transpose()
+        maskAtl[idxa[0],idxa[1]] = True
+        maskPac = maski*1 ; maskPac[...] = False
+        idxp = npy.argwhere(maskg == 2).transpose()
+        maskPac[idxp[0],idxp[1]] = True
+        maskInd = maski*1 ; maskInd[...] = False
+        idxi = npy.argwhere(maskg == 3).transpose()
+        maskInd[idxi[0],idxi[1]] = True
+        #masks = [maski, maskAtl, maskPac, maskInd]
+        loni    = maskg.getLongitude()
+        lati    = maskg.getLatitude()
+        Nii     = int(loni.shape[0])
+        Nji     = int(lati.shape[0])
+        # Compute area of target grid and zonal sums
+        areai, scalex, scaley = computeAreaScale(loni[:], lati[:])
+        #areai = gt('basinmask3_area')
+        #print areai.shape
+        #print areai[:,90]
+        gt.close()
+
+    # Domains (latitude bands or masks) x basins (Global, Atl, Pac, Ind) binned in the same pass
+    lat2d = npy.array(lati[:])
+    if lat2d.ndim == 1:
+        lat2d = npy.tile(lat2d, Nii).reshape(Nii, Nji).transpose()
+    [domNames, domMasks, domMulti] = surfDomainMasks(domain, lat2d)
+    ndom = len(domNames)
+    print ' Domain : ',domNames
+    basinIds   = ['', 'Atl', 'Pac', 'Ind']
+    basinNames = ['', 'Atl. ', 'Pac. ', 'Ind. ']
+    nbas   = len(basinIds)
+    masks  = []
+    for dmask in domMasks:
+        for bmask in [None, maskAtl, maskPac, maskInd]:
+            if bmask is None:
+                masks.append(dmask)
+            elif dmask is None:
+                masks.append(bmask)
+            else:
+                masks.append((npy.ma.filled(bmask, 0) != 0) & dmask)
+    nmask = len(masks)
+    # area weights of domain integrals (one row per domain/basin)
+    areaw = npy.ma.filled(areai, 0.).ravel().astype('float64')
+    wmask = npy.ones([nmask, Nji*Nii])
+    for k in range(nmask):
+        if masks[k] is not None:
+            wmask[k] = npy.ma.filled(masks[k], 0).ravel() != 0
+    wmask = wmask*areaw
+    if domMulti:
+        d_axis = cdm.createAxis(npy.arange(ndom, dtype='float32'), id = 'domain')
+        d_axis.long_name = 'Domain'
+        d_axis.names = ' '.join(domNames)
+        axes2d = [d_axis, s_axis]
+        axes1d = [d_axis]
+    else:
+        axes2d = [s_axis]
+        axes1d = []
+
+    #
+    # Interpolation init (regrid)
+    if noInterp == False:
+        ESMP.ESMP_Initialize()
+        regridObj = CdmsRegrid(ingrid, outgrid, npy.dtype('float32'), missing = 1.e20, regridMethod = 'linear', regridTool = 'esmf')
+    else:
+        regridObj = None
+    ftos.close()
+
+    grid = {'ingrid':ingrid, 'N_i':N_i, 'N_j':N_j, 'outgrid':outgrid, 'maski':maski, 'maskAtl':maskAtl,
+            'maskPac':maskPac, 'maskInd':maskInd, 'areai':areai, 'loni':loni, 'lati':lati, 'Nii':Nii,
+            'Nji':Nji, 'sigrid':sigrid, 'del_s':del_s, 'N_s':N_s, 'del_s1':del_s1, 'del_s2':del_s2,
+            's_axis':s_axis, 'domNames':domNames, 'ndom':ndom, 'basinIds':basinIds, 'basinNames':basinNames,
+            'nbas':nbas, 'masks':masks, 'nmask':nmask, 'wmask':wmask, 'domMulti':domMulti, 'axes2d':axes2d,
+            'axes1d':axes1d, 'regridObj':regridObj}
+    return grid
+
+def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, debug=True, timeint='all',noInterp=False, domain='global', tchunk=120, grid=None):
     '''
     The surfTransf() function takes files and variable arguments and creates
     density bined surface transformation fields which are written to a specified outfile
@@ -75,8 +299,12 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     - debug <optional>          - boolean value
     - timeint <optional>        - specify temporal step for binning <init_idx>,<ncount>
     - noInterp <optional>       - if true no interpolation to target grid
-    - domain <optional>         - specify domain for averaging when interpolated to WOA grid ('global','north',
-                                  'north40', 'south' for now)
+    - domain <optional>         - specify domain for averaging ('global','north', 'north40', 'south',
+                                  [latmin, latmax] or (name, mask)), or a list of domains (or a domain mask
+                                  stack) all binned in the same pass and written along a domain axis
+    - tchunk <optional>         - number of months read, computed and written at once (memory independent
+                                  of record length, the next block is read while the current one is computed)
+    - grid <optional>           - grid quantities from surfTransfGrid (built from fileTos if not given)
 
     Outputs:
     --------
@@ -94,8 +322,20 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     - PJD 22 Nov 2014   - Code cleanup
     - EG   4 Oct 2017   - code on ciclad, more cleanup and options
     - EG  12 Sep 2018   - Add North vs. South calculation
+    - EG  18 Oct 2026   - Loop on density bins replaced by transfBin
+    - EG  18 Oct 2026   - Time blocks of tchunk months (read ahead, outputs extended along time),
+                          3D density fluxes only allocated if written (writedenflx)
+    - EG  18 Oct 2026   - Density fluxes of each block computed with surfDensFlux
+    - EG  18 Oct 2026   - Several domains x basins binned in one pass (surfDomainMasks), domain axis
+                          if a list of domains is given, global values restricted to the domain
+    - EG  18 Oct 2026   - Grid setup in surfTransfGrid, optional shared grid (surfTransfBatch),
+                          outFile only created once complete (written as .part first)
 
     '''
+    import cdms2 as cdm
+    import MV2 as mv
+    from cdms2 import CdmsRegrid
+    from durolib import fixVarUnits
     # Keep track of time (CPU and elapsed)
     cpu0 = timc.clock()
     #
@@ -127,6 +367,8 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     fwfo  = cdm.open(fileWfo)
     #timeax = ftos.getAxis('time')
     timeax = ftos.getAxis('time_counter')
+    if timeax is None:
+        timeax = ftos.getAxis('time')
     #print 'timeax'
     #print timeax
     #
@@ -162,569 +404,272 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     hef_name = varNames[2]
     wfo_name = varNames[3]
 
-    if debugp:
-        print' Read ',tos_name, sos_name,tmin,tmax
-    tos = ftos(tos_name , time = slice(tmin,tmax))
-    sos = fsos(sos_name , time = slice(tmin,tmax))
-    if debugp:
-        print' Read ',hef_name, wfo_name
-    qnet = fhef(hef_name, time = slice(tmin,tmax))
-    try:
-        emp  = fwfo(wfo_name , time = slice(tmin,tmax))
-        empsw = 0
-    except Exception,err:
-        emp  = fwfo('wfos' , time = slice(tmin,tmax))
-        print ' Reading concentration dillution fresh water flux'
-        empsw = 0
-    tos_h = ftos[tos_name]
-    if debugp:
-        print tos_h
+    # Fields are read by time blocks of tchunk months (first month read here for grid and mask value)
+    tos = ftos(tos_name , time = slice(tmin,tmin+1))
     #
-    # Read input grid
-    ingrid = tos.getGrid()
-    #
-    # Read cell area
-    #ff = cdm.open(fileFx)
-    #area = ff('areacello')
-    #ff.close()
-    #areain = area.data
-    #
-    # Define dimensions
-    N_i = int(tos.shape[1])
-    N_j = int(tos.shape[0])
-    #
-    # Define sigma grid 
-    rho_min = 22
-    rho_int = 25
-    rho_max = 29
-    del_s1  = 0.1
-    del_s2  = 0.05
-    sigrid, s_sax, del_s, N_s = rhonGrid(rho_min, rho_int, rho_max, del_s1, del_s2)
+    # Grid, masks, domains and regridder (shared by the members of a model in surfTransfBatch)
+    if grid is None:
+        grid = surfTransfGrid(fileTos, tos_name, noInterp=noInterp, domain=domain, debug=debugp)
+    ingrid      = grid['ingrid']
+    outgrid     = grid['outgrid']
+    maski       = grid['maski']
+    areai       = grid['areai']
+    loni        = grid['loni']
+    lati        = grid['lati']
+    Nii         = grid['Nii']
+    Nji         = grid['Nji']
+    sigrid      = grid['sigrid']
+    del_s       = grid['del_s']
+    N_s         = grid['N_s']
+    del_s1      = grid['del_s1']
+    del_s2      = grid['del_s2']
+    ndom        = grid['ndom']
+    basinIds    = grid['basinIds']
+    basinNames  = grid['basinNames']
+    nbas        = grid['nbas']
+    masks       = grid['masks']
+    nmask       = grid['nmask']
+    wmask       = grid['wmask']
+    domMulti    = grid['domMulti']
+    axes2d      = grid['axes2d']
+    axes1d      = grid['axes1d']
+    regridObj   = grid['regridObj']
     print
     print ' ==> model:', modeln
     #
     # File output inits
     #
-    s_axis = cdm.createAxis(s_sax, id = 'rhon')
-    s_axis.long_name = 'Neutral density'
-    s_axis.units = 'kg m-3 (anomaly, minus 1000)'
-    s_axis.designateLevel()
-    #
     # Write 3D density flux ?
     #
     writedenflx = False
     #
-    # Monthly transformation
+    # Monthly transformation (written under a temporary name, renamed once complete)
     if os.path.exists(outFile):
         os.remove(outFile)
-    outFile_f = cdm.open(outFile,'w')
+    outFilePart = os.path.splitext(outFile)[0]+'.part'+os.path.splitext(outFile)[1]
+    outFile_f = cdm.open(outFilePart,'w')
     # Define dimensions
     N_i = int(tos.shape[2])
     N_j = int(tos.shape[1])
-    N_t = int(tos.shape[0])
+    N_t = tmax - tmin
     print ' ==> dimensions N_t, N_j, N_i:', N_t, N_j, N_i
+    print ' ==> time blocks of', tchunk, 'months'
+    # Read masking value (EC-EARTH mask fix applied on each time block)
+    ecfix = False
     try:
         valmask = tos.missing_value
         if valmask == None:
-            print 'EC-EARTH missing_value fix'
-            valmask = 1.e20            
-            sos = mv.masked_equal(sos,0.)
-            print sos.count()
-            sos.data[:] = sos.filled(valmask)
-            tos.mask = sos.mask
-            tos.data[:] = tos.filled(valmask)
-            qnet.mask = sos.mask
-            qnet.data[:] = qnet.filled(valmask)
-            emp.mask = sos.mask
-            emp.data[:] = emp.filled(valmask)
+            ecfix = True
     except Exception,err:
         print 'Exception: ',err
         if 'EC-EARTH' == modeln:
-            print 'EC-EARTH missing_value fix'
-            valmask = 1.e20
-            sos = mv.masked_equal(sos,0.)
-            print sos.count()
-            sos.data[:] = sos.filled(valmask)
-            tos.mask = sos.mask
-            tos.data[:] = tos.filled(valmask)
-            qnet.mask = sos.mask
-            qnet.data[:] = qnet.filled(valmask)
-            emp.mask = sos.mask
-            emp.data[:] = emp.filled(valmask)
-    # Read masking value
-    # added if wfcorr == masked values everywhere
-    emp.mask = sos.mask
-    emp.data[:] = emp.filled(valmask)
-
-    # Test variable units
-    [sos,sosFixed] = fixVarUnits(sos,'sos',True)#,'logfile.txt')
-    if sosFixed:
-        print '     sos: units corrected'
-    [tos,tosFixed] = fixVarUnits(tos,'thetao',True)#,'logfile.txt')
-    if tosFixed:
-        print '     tos: units corrected'        
+            ecfix = True
+    if ecfix:
+        print 'EC-EARTH missing_value fix'
+        valmask = 1.e20
+    # Test member against shared grid
+    if N_i != grid['N_i'] or N_j != grid['N_j']:
+        print '** Input variables and grid have different dimensions, exiting..'
+        outFile_f.close()
+        os.remove(outFilePart)
+        return
+    if noInterp == False and valmask != 1.e20:
+        regridObj = CdmsRegrid(ingrid, outgrid, npy.dtype('float32'), missing = valmask, regridMethod = 'linear', regridTool = 'esmf')
+    del(tos)
     # Physical inits
     #P = 0          # surface pressure
     # find non-masked points
     #maskin = mv.masked_values(tos.data[0], valmask).mask 
     #nomask = npy.equal(maskin,0)
     #
-    # target horizonal grid for interp 
-    if noInterp:
-        outgrid = ingrid
-        fileg = '/data/vestella/Masks/Mask_Convect_Atlantic_40N.nc'
-        gt = cdm.open(fileg)
-        maskr = gt('mask_part')
-        maski = maskr[...]
-        gt.close
-        #maski = tos[0,...].mask
-        fileg = '/data/vestella/Masks/Mask_Convect_GS.nc'
-        gt = cdm.open(fileg)
-        maskr = gt('mask_part')
-        maskAtl = maskr[...]
-        gt.close
-        fileg = '/data/vestella/Masks/Mask_Convect_SI.nc'
-        gt = cdm.open(fileg)
-        maskr = gt('mask_part')
-        maskPac = maskr[...]
-        gt.close
-        fileg = '/data/vestella/Masks/Mask_Convect_LS.nc'
-        gt = cdm.open(fileg)
-        maskr = gt('mask_part')
-        maskInd = maskr[...]
-        gt.close
-
-        # Read area of target grid and zonal sums
-        areai = npy.ma.ones([N_j, N_i], dtype='float32')*0.
-        fileg = '/data/igcmg/database/grids/ORCA2.3_area.nc'
-        gt = cdm.open(fileg)
-        arear = gt('area')
-        arear_h = gt['area']
-        areai = arear.data[:,:]
-
-        loni  = tos_h.getLongitude()
-        lati  = tos_h.getLatitude()
-
-        Nii   = int(loni.shape[1])
-        Nji   = int(lati.shape[0])
-
-        gt.close
-    else:
-        # Interpolate on WOA grid
-        #fileg = '/work/guilyardi/Density_bining/WOD13_masks.nc'
-        #fileg = '/export/durack1/git/Density_bining/140807_WOD13_masks.nc'
-        fileg = '170224_WOD13_masks.nc'
-        gt = cdm.open(fileg)
-        maskg = gt('basinmask3')
-        outgrid = maskg.getGrid()
-        # global mask
-        maski = maskg.mask
-        # regional masks
-        maskAtl = maski*1 ; maskAtl[...] = False
-        idxa = npy.argwhere(maskg == 1).transpose()
-        maskAtl[idxa[0],idxa[1]] = True
-        maskPac = maski*1 ; maskPac[...] = False
-        idxp = npy.argwhere(maskg == 2).transpose()
-        maskPac[idxp[0],idxp[1]] = True
-        maskInd = maski*1 ; maskInd[...] = False
-        idxi = npy.argwhere(maskg == 3).transpose()
-        maskInd[idxi[0],idxi[1]] = True
-        #masks = [maski, maskAtl, maskPac, maskInd]
-        loni    = maskg.getLongitude()
-        lati    = maskg.getLatitude()
-        Nii     = int(loni.shape[0])
-        Nji     = int(lati.shape[0])
-        # Compute area of target grid and zonal sums
-        areai, scalex, scaley = computeAreaScale(loni[:], lati[:])
-        #areai = gt('basinmask3_area')
-        #print areai.shape
-        #print areai[:,90]
-        gt.close()
-
-        # Reduce domain to North/South ?
-        print ' Domain : ',domain
-        if domain == 'north':
-            lati2d = npy.tile(lati, Nii).reshape(Nii, Nji).transpose()
-            indn = npy.argwhere(lati2d <= 0).transpose()
-            maski  [indn[0],indn[1]] = False
-            maskAtl[indn[0],indn[1]] = False
-            maskPac[indn[0],indn[1]] = False
-            maskInd[indn[0],indn[1]] = False
-        elif domain == 'north40':
-            lati2d = npy.tile(lati, Nii).reshape(Nii,Nji).transpose()
-            indn = npy.argwhere(lati2d <= 40).transpose()
-            maski  [indn[0],indn[1]] = False
-            maskAtl[indn[0],indn[1]] = False
-            maskPac[indn[0],indn[1]] = False
-            maskInd[indn[0],indn[1]] = False
-        elif domain == 'south':
-            lati2d = npy.tile(lati, Nii).reshape(Nii,Nji).transpose()
-            indn = npy.argwhere(lati2d >= 0).transpose()
-            maski  [indn[0],indn[1]] = False
-            maskAtl[indn[0],indn[1]] = False
-            maskPac[indn[0],indn[1]] = False
-            maskInd[indn[0],indn[1]] = False
-
-    #
-    # init arrays
-    tmp     = npy.ma.ones([N_t, Nji, Nii], dtype='float32')*valmask 
-    denflx  = tmp.copy() # Total density flux
-    denflxh = tmp.copy() # heat flux contrib
-    denflxw = tmp.copy() # E-P contrib
-    rhon    = tmp.copy() # surface density
-    tmpi    = npy.ma.ones([Nji, Nii], dtype='float32')*valmask 
-    tost    = tmpi.copy()
-    sost    = tmpi.copy()
-    heft    = tmpi.copy()
-    empt    = tmpi.copy()
-    # Global
-    atmp    = npy.ma.ones([N_t, N_s+1], dtype='float32')*valmask 
-    transf  = atmp.copy() # Total tranformation
-    transfh = atmp.copy() # Heat flux tranformation
-    transfw = atmp.copy() # Water flux tranformation
-    areabin = atmp.copy() # surface of bin
-    transfh = maskVal(transfh, valmask)
-    transfw = maskVal(transfw, valmask)
-    transf  = maskVal(transf , valmask)
-    areabin = maskVal(areabin, valmask)
-    # Basin
-    transfa  = atmp.copy() # Total tranformation
-    transfha = atmp.copy() # Heat flux tranformation
-    transfwa = atmp.copy() # Water flux tranformation
-    areabina = atmp.copy() # surface of bin
-    transfha = maskVal(transfha, valmask)
-    transfwa = maskVal(transfwa, valmask)
-    transfa  = maskVal(transfa , valmask)
-    areabina = maskVal(areabina, valmask)
-    #
-    transfp  = atmp.copy() # Total tranformation
-    transfhp = atmp.copy() # Heat flux tranformation
-    transfwp = atmp.copy() # Water flux tranformation
-    areabinp = atmp.copy() # surface of bin
-    transfhp = maskVal(transfhp, valmask)
-    transfwp = maskVal(transfwp, valmask)
-    transfp  = maskVal(transfp , valmask)
-    areabinp = maskVal(areabinp, valmask)
-    #
-    transfi  = atmp.copy() # Total tranformation
-    transfhi = atmp.copy() # Heat flux tranformation
-    transfwi = atmp.copy() # Water flux tranformation
-    areabini = atmp.copy() # surface of bin
-    transfhi = maskVal(transfhi, valmask)
-    transfwi = maskVal(transfwi, valmask)
-    transfi  = maskVal(transfi , valmask)
-    areabini = maskVal(areabini, valmask)
-    #
-    tmp = npy.ma.ones((N_t))*valmask
-    intHeatFlx  = tmp.copy() # integral heat flux
-    intWatFlx   = tmp.copy() # integral E-P
-    intHeatFlxa = tmp.copy() # integral heat flux Atl
-    intWatFlxa  = tmp.copy() # integral E-P Atl
-    intHeatFlxp = tmp.copy() # integral heat flux Pac
-    intWatFlxp  = tmp.copy() # integral E-P Pac
-    intHeatFlxi = tmp.copy() # integral heat flux Ind
-    intWatFlxi  = tmp.copy() # integral E-P Ind
-    #
-    # Interpolation init (regrid)
-    if noInterp == False:
-        ESMP.ESMP_Initialize()
-        regridObj = CdmsRegrid(ingrid, outgrid, denflxh.dtype, missing = valmask, regridMethod = 'linear', regridTool = 'esmf')
     # init integration intervals
     dt   = 1./float(N_t) 
 
-
-    # Bin on density grid
-    for t in range(N_t):
-        if noInterp:
-            tost = tos [t,:,:]
-            sost = sos [t,:,:]
-            heft = qnet[t,:,:]
-            empt = emp [t,:,:]
-        else:
-            tost = regridObj(tos [t,:,:])
-            sost = regridObj(sos [t,:,:])
-            heft = regridObj(qnet[t,:,:])
-            empt = regridObj(emp [t,:,:])
-
-        tost.mask = maski
-        sost.mask = maski
-        heft.mask = maski
-        empt.mask = maski
-        tost = maskVal(tost, valmask)
-        sost = maskVal(sost, valmask)
-        heft = maskVal(heft, valmask)
-        empt = maskVal(empt, valmask)
-        # define basin heat and water fluxes
-        hefta = heft*1.
-        heftp = heft*1.
-        hefti = heft*1.
-        #
-        empta = empt*1.
-        emptp = empt*1.
-        empti = empt*1.
-        #
-        # Compute density
-        rhon[t,...] = eosNeutral(tost.data, sost.data) - 1000.
-        rhon[t,...].mask  = maski
-        rhon[t,...] = maskVal(rhon[t,...], valmask)
-        rhonl = rhon.data[t,...]
-        # Compute buoyancy/density flux as mass fluxes in kg/m2/s (SI units)
-        #  convwf : kg/m2/s = mm/s -> m/s
-        convwf = 1.e-3
-        pres = tost.data*0.
-        denflxh[t,...] = (-sw.alpha(sost.data,tost.data,pres)/sw.cp(sost.data,tost.data,pres))*heft.data
-        if empsw == 0:
-            denflxw[t,...] = (rhonl+1000.)*sw.beta(sost.data,tost.data,pres)*sost.data*empt.data*convwf
-        else:
-            denflxw[t,...] = (rhonl+1000.)*sw.beta(sost.data,tost.data,pres)*empt.data*convwf            
-        denflx [t,...] = denflxh[t,...] + denflxw[t,...]
-        denflx [t,...].mask  = maski
-        denflxh[t,...].mask  = maski
-        denflxw[t,...].mask  = maski
-        denflx [t,...] = maskVal(denflx [t,...], valmask)
-        denflxh[t,...] = maskVal(denflxh[t,...], valmask)
-        denflxw[t,...] = maskVal(denflxw[t,...], valmask)
-        dflxh = denflxh.data[t,:,:]
-        dflxw = denflxw.data[t,:,:]
+    # Time blocks: fields of block tb+1 are read on a background thread while block tb is computed
+    nblock = (N_t + tchunk - 1)/tchunk
+    lock = threading.Lock()
+    nextBlock = ReadAhead(readSurfBlock, ftos, fsos, fhef, fwfo, varNames, tmin, min(tmin+tchunk,tmax), lock)
+    for tb in range(nblock):
+        t0 = tmin + tb*tchunk
+        t1 = min(t0 + tchunk, tmax)
+        nt = t1 - t0
+        if debugp:
+            print ' Time block ',tb+1,'/',nblock,' (',t0,t1-1,')'
+        [tos, sos, qnet, emp, empsw] = nextBlock.get()
+        if tb+1 < nblock:
+            nextBlock = ReadAhead(readSurfBlock, ftos, fsos, fhef, fwfo, varNames, t1, min(t1+tchunk,tmax), lock)
+        if ecfix:
+            sos = mv.masked_equal(sos,0.)
+            print sos.count()
+            sos.data[:] = sos.filled(valmask)
+            tos.mask = sos.mask
+            tos.data[:] = tos.filled(valmask)
+            qnet.mask = sos.mask
+            qnet.data[:] = qnet.filled(valmask)
+            emp.mask = sos.mask
+            emp.data[:] = emp.filled(valmask)
+        # added if wfcorr == masked values everywhere
+        emp.mask = sos.mask
+        emp.data[:] = emp.filled(valmask)
+
+        # Test variable units
+        [sos,sosFixed] = fixVarUnits(sos,'sos',True)#,'logfile.txt')
+        if sosFixed and tb == 0:
+            print '     sos: units corrected'
+        [tos,tosFixed] = fixVarUnits(tos,'thetao',True)#,'logfile.txt')
+        if tosFixed and tb == 0:
+            print '     tos: units corrected'
+        with lock:
+            timeblk = timeaxis.subAxis(t0-tmin, t1-tmin)
         #
-        # Transformation (integral of density flux on density outcrops)
-        for ks in range(N_s-1):
-            # find indices of points in density bin
-            # Global
-            idxbin = npy.argwhere( (rhonl >= sigrid[ks]) & (rhonl < sigrid[ks+1]) ).transpose()
-            idj = idxbin[0] ; idi = idxbin[1]
-            transfh[t,ks] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            transfw[t,ks] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            areabin[t,ks] = cdu.averager(areai[idj,idi], axis=0, action='sum')
-
-            # Basin
-            #print maskAtl.shape
-            #print maskAtl
-            #print rhonl.shape
-            #print rhonl
-
-            idxbina = npy.argwhere( (rhonl*maskAtl >= sigrid[ks]) & (rhonl*maskAtl < sigrid[ks+1]) ).transpose()
-            idj = idxbina[0] ; idi = idxbina[1]
-            #print t,ks,dflxh.shape,areai.shape,idj,idi
-            transfha[t,ks] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            transfwa[t,ks] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            areabina[t,ks] = cdu.averager(areai[idj,idi], axis=0, action='sum')
+        # init arrays of time block (3D density fluxes only kept if written)
+        # transformation and area of bin (time, domain x basin, rhon)
+        atmp    = npy.ones([nt, nmask, N_s+1])*valmask
+        transfh = atmp.copy() # Heat flux tranformation
+        transfw = atmp.copy() # Water flux tranformation
+        areabin = atmp.copy() # surface of bin
+        del(atmp)
+        # integral heat flux and E-P (time, domain x basin)
+        intHeatFlx = npy.ones([nt, nmask])*valmask
+        intWatFlx  = npy.ones([nt, nmask])*valmask
+
+        # Regrid and mask month by month, domain integrals of fluxes
+        tosb, sosb, hefb, empb = [npy.ones([nt, Nji, Nii], dtype='float32') for _ in range(4)]
+        for t in range(nt):
+            if noInterp:
+                tost = tos [t,:,:]
+                sost = sos [t,:,:]
+                heft = qnet[t,:,:]
+                empt = emp [t,:,:]
+            else:
+                tost = regridObj(tos [t,:,:])
+                sost = regridObj(sos [t,:,:])
+                heft = regridObj(qnet[t,:,:])
+                empt = regridObj(emp [t,:,:])
+
+            tost.mask = maski
+            sost.mask = maski
+            heft.mask = maski
+            empt.mask = maski
+            tost = maskVal(tost, valmask)
+            sost = maskVal(sost, valmask)
+            heft = maskVal(heft, valmask)
+            empt = maskVal(empt, valmask)
+            tosb[t] = tost.data
+            sosb[t] = sost.data
+            hefb[t] = heft.data
+            empb[t] = empt.data
             #
-            idxbinp = npy.argwhere( (rhonl*maskPac >= sigrid[ks]) & (rhonl*maskPac < sigrid[ks+1]) ).transpose()
-            idj = idxbinp[0] ; idi = idxbinp[1]
-            transfhp[t,ks] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            transfwp[t,ks] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            areabinp[t,ks] = cdu.averager(areai[idj,idi], axis=0, action='sum')
+            # domain integrals (all domains and basins)
+            # heat flux (conv W -> PW)
+            convt  = 1.e-15
+            intHeatFlx[t] = npy.dot(wmask, npy.ma.filled(heft, 0.).ravel())*dt*convt
+            # fw flux (conv mm -> m and m3/s to Sv)
+            convw = 1.e-3*1.e-6
+            intWatFlx [t] = npy.dot(wmask, npy.ma.filled(empt, 0.).ravel())*dt*convw
+
+            if debugp and t == 0 and tb == 0:
+                print '    integral Q flux ',t,intHeatFlx[t,0:nbas]
+                print '    integral W flux ',t,intWatFlx [t,0:nbas]
+        #
+        # Surface density and buoyancy/density fluxes as mass fluxes in kg/m2/s (SI units)
+        # for the whole block (fused seawater coefficients at p=0)
+        [rhonb, dflxhb, dflxwb] = surfDensFlux(tosb, sosb, hefb, empb, valmask, empsw)
+        del(tosb, sosb, hefb, empb)
+        if writedenflx:
+            maskb = npy.resize(maski, rhonb.shape)
+            rhon    = npy.ma.array(rhonb         , mask = maskb)
+            denflxh = npy.ma.array(dflxhb        , mask = maskb)
+            denflxw = npy.ma.array(dflxwb        , mask = maskb)
+            denflx  = npy.ma.array(dflxhb + dflxwb, mask = maskb)
+
+        # Bin on density grid
+        for t in range(nt):
             #
-            idxbini = npy.argwhere( (rhonl*maskInd >= sigrid[ks]) & (rhonl*maskInd < sigrid[ks+1]) ).transpose()
-            idj = idxbini[0] ; idi = idxbini[1]
-            transfhi[t,ks] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            transfwi[t,ks] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-            areabini[t,ks] = cdu.averager(areai[idj,idi], axis=0, action='sum')
-            
-        # last bin
-        # Global
-        idxbin = npy.argwhere( (rhonl >= sigrid[N_s-1])).transpose()
-        idj = idxbin[0] ; idi = idxbin[1]
-        transfh[t,N_s] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        transfw[t,N_s] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        areabin[t,N_s] = cdu.averager(areai[idj,idi], axis=0, action='sum')
-        # Basins
-        idxbina = npy.argwhere( (rhonl*maskAtl >= sigrid[N_s-1])).transpose()
-        idj = idxbina[0] ; idi = idxbina[1]
-        transfha[t,N_s] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        transfwa[t,N_s] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        areabina[t,N_s] = cdu.averager(areai[idj,idi], axis=0, action='sum')
-        # 
-        idxbinp = npy.argwhere( (rhonl*maskPac >= sigrid[N_s-1])).transpose()
-        idj = idxbinp[0] ; idi = idxbinp[1]
-        transfhp[t,N_s] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        transfwp[t,N_s] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        areabinp[t,N_s] = cdu.averager(areai[idj,idi], axis=0, action='sum')
-        # 
-        idxbini = npy.argwhere( (rhonl*maskInd >= sigrid[N_s-1])).transpose()
-        idj = idxbini[0] ; idi = idxbini[1]
-        transfhi[t,N_s] = cdu.averager(dflxh[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        transfwi[t,N_s] = cdu.averager(dflxw[idj,idi] * areai[idj,idi], axis=0, action='sum')/del_s[ks]
-        areabini[t,N_s] = cdu.averager(areai[idj,idi], axis=0, action='sum')
+            # Transformation (integral of density flux on density outcrops)
+            # all bins, domains and basins in one pass
+            [transfh[t], transfw[t], areabin[t]] = transfBin(rhonb[t], dflxhb[t], dflxwb[t], areai, masks, sigrid, del_s, valmask)
+        # index N_s-1 is not used
+        transfh[:,:,N_s-1] = valmask
+        transfw[:,:,N_s-1] = valmask
+        areabin[:,:,N_s-1] = valmask
         # Total transformation
-        transf[t,:] = transfh[t,:] + transfw[t,:]        
-        transfa[t,:] = transfha[t,:] + transfwa[t,:]        
-        transfp[t,:] = transfhp[t,:] + transfwp[t,:]        
-        transfi[t,:] = transfhi[t,:] + transfwi[t,:] 
+        transf = transfh + transfw
         # Formation = divergence of transformation in density space
         # done in postpro:  form [t,ks] = -(transf [t,ks+1] - transf [t,ks])
-        #
-        # domain integrals
-        # heat flux (conv W -> PW)
-        convt  = 1.e-15
-            
-        intHeatFlx [t] = cdu.averager(npy.reshape(heft*areai , (Nji*Nii)), action='sum')*dt*convt
-        intHeatFlxa[t] = cdu.averager(npy.reshape(hefta*areai*maskAtl, (Nji*Nii)), action='sum')*dt*convt
-        intHeatFlxp[t] = cdu.averager(npy.reshape(heftp*areai*maskPac, (Nji*Nii)), action='sum')*dt*convt
-        intHeatFlxi[t] = cdu.averager(npy.reshape(hefti*areai*maskInd, (Nji*Nii)), action='sum')*dt*convt
-        # fw flux (conv mm -> m and m3/s to Sv)
-        convw = 1.e-3*1.e-6
-        intWatFlx [t]  = cdu.averager(npy.reshape(empt*areai , (Nji*Nii)), action='sum')*dt*convw
-        intWatFlxa[t]  = cdu.averager(npy.reshape(empta*areai*maskAtl, (Nji*Nii)), action='sum')*dt*convw
-        intWatFlxp[t]  = cdu.averager(npy.reshape(emptp*areai*maskPac, (Nji*Nii)), action='sum')*dt*convw
-        intWatFlxi[t]  = cdu.averager(npy.reshape(empti*areai*maskInd, (Nji*Nii)), action='sum')*dt*convw
-
-        if debugp and t == 0:
-            print '    integral Q flux ',t,intHeatFlx [t], intHeatFlxa[t], intHeatFlxp[t], intHeatFlxi[t]
-            print '    integral W flux ',t,intWatFlx [t], intWatFlxa[t], intWatFlxp[t], intWatFlxi[t]
-      
-    # Wash mask over variables
-    maskt        = mv.masked_values(rhon, valmask).mask
-    denflx.mask  = maskt
-    denflxh.mask = maskt
-    denflxw.mask = maskt
-    denflx       = maskVal(denflx , valmask)
-    denflxh      = maskVal(denflxh, valmask)
-    denflxw      = maskVal(denflxw, valmask)
-
-    #maskin       = mv.masked_values(transf, valmask).mask
-    transfh._FillValue = valmask
-    transfw._FillValue = valmask
-    transf._FillValue  = valmask
-    transfh      = maskVal(transfh, valmask)
-    transfw      = maskVal(transfw, valmask)
-    transf       = maskVal(transf , valmask)
-    #
-    #maskin       = mv.masked_values(transfa, valmask).mask
-    transfha._FillValue = valmask
-    transfwa._FillValue = valmask
-    transfa._FillValue  = valmask
-    transfha      = maskVal(transfha, valmask)
-    transfwa      = maskVal(transfwa, valmask)
-    transfa       = maskVal(transfa , valmask)
-    #
-    #maskin       = mv.masked_values(transfp, valmask).mask
-    transfhp._FillValue = valmask
-    transfwp._FillValue = valmask
-    transfp._FillValue  = valmask
-    transfhp      = maskVal(transfhp, valmask)
-    transfwp      = maskVal(transfwp, valmask)
-    transfp       = maskVal(transfp , valmask)
-    #
-    #maskin       = mv.masked_values(transfi, valmask).mask
-    transfhi._FillValue = valmask
-    transfwi._FillValue = valmask
-    transfi._FillValue  = valmask
-    transfhi      = maskVal(transfhi, valmask)
-    transfwi      = maskVal(transfwi, valmask)
-    transfi       = maskVal(transfi , valmask)
-       
-    #+ create a basins variables (loop on n masks)
+        del(rhonb, dflxhb, dflxwb)
+
+        # Wash mask over variables
+        if writedenflx:
+            maskt        = mv.masked_values(rhon, valmask).mask
+            denflx.mask  = maskt
+            denflxh.mask = maskt
+            denflxw.mask = maskt
+            denflx       = maskVal(denflx , valmask)
+            denflxh      = maskVal(denflxh, valmask)
+            denflxw      = maskVal(denflxw, valmask)
 
-    #
-    # Output files as netCDF
-    # Density flux (3D: time, lon, lat)
-    convw = 1.e6
-    if writedenflx:
-        rhon    = cdm.createVariable(rhon          , axes = [timeaxis, lati, loni], id = 'densurf')
-        denFlx  = cdm.createVariable(denflx*convw  , axes = [timeaxis, lati, loni], id = 'denflux')
-        denFlxh = cdm.createVariable(denflxh*convw , axes = [timeaxis, lati, loni], id = 'hdenflx')
-        denFlxw = cdm.createVariable(denflxw*convw , axes = [timeaxis, lati, loni], id = 'wdenflx')
-        denFlx.long_name   = 'Surface density'
-        denFlx.units       = 'kg.m-3 (anomaly, minus 1000)'
-        denFlx.long_name   = 'Total density flux'
-        denFlx.units       = '1.e-6 kg/m2/s'
-        denFlxh.long_name  = 'Heat density flux'
-        denFlxh.units      = '1.e-6 kg/m2/s'
-        denFlxw.long_name  = 'Water density flux'
-        denFlxw.units      = '1.e-6 kg/m2/s'
-    #
-    # Transformation (2D: time, sigma)
-    convw = 1.e-6
-    totTransf   = cdm.createVariable(transf*convw  , axes = [timeaxis, s_axis], id = 'trsftot')
-    hefTransf   = cdm.createVariable(transfh*convw , axes = [timeaxis, s_axis], id = 'trsfhef')
-    wfoTransf   = cdm.createVariable(transfw*convw , axes = [timeaxis, s_axis], id = 'trsfwfo')
-    totTransfa  = cdm.createVariable(transfa*convw , axes = [timeaxis, s_axis], id = 'trsftotAtl')
-    hefTransfa  = cdm.createVariable(transfha*convw, axes = [timeaxis, s_axis], id = 'trsfhefAtl')
-    wfoTransfa  = cdm.createVariable(transfwa*convw, axes = [timeaxis, s_axis], id = 'trsfwfoAtl')
-    totTransfp  = cdm.createVariable(transfp*convw , axes = [timeaxis, s_axis], id = 'trsftotPac')
-    hefTransfp  = cdm.createVariable(transfhp*convw, axes = [timeaxis, s_axis], id = 'trsfhefPac')
-    wfoTransfp  = cdm.createVariable(transfwp*convw, axes = [timeaxis, s_axis], id = 'trsfwfoPac')
-    totTransfi  = cdm.createVariable(transfi*convw , axes = [timeaxis, s_axis], id = 'trsftotInd')
-    hefTransfi  = cdm.createVariable(transfhi*convw, axes = [timeaxis, s_axis], id = 'trsfhefInd')
-    wfoTransfi  = cdm.createVariable(transfwi*convw, axes = [timeaxis, s_axis], id = 'trsfwfoInd')
-    totTransf.long_name   = 'Total transformation'
-    totTransf.units       = 'Sv'
-    hefTransf.long_name   = 'Heat flux transformation'
-    hefTransf.units       = 'Sv'
-    wfoTransf.long_name   = 'Water flux transformation'
-    wfoTransf.units       = 'Sv'
-    totTransfa.long_name  = 'Atl. Total transformation'
-    totTransfa.units      = 'Sv'
-    hefTransfa.long_name  = 'Atl. Heat flux transformation'
-    hefTransfa.units      = 'Sv'
-    wfoTransfa.long_name  = 'Atl. Water flux transformation'
-    wfoTransfa.units      = 'Sv'
-    totTransfp.long_name  = 'Pac. Total transformation'
-    totTransfp.units      = 'Sv'
-    hefTransfp.long_name  = 'Pac. Heat flux transformation'
-    hefTransfp.units      = 'Sv'
-    wfoTransfp.long_name  = 'Pac. Water flux transformation'
-    wfoTransfp.units      = 'Sv'
-    totTransfi.long_name  = 'Ind. Total transformation'
-    totTransfi.units      = 'Sv'
-    hefTransfi.long_name  = 'Ind. Heat flux transformation'
-    hefTransfi.units      = 'Sv'
-    wfoTransfi.long_name  = 'Ind. Water flux transformation'
-    wfoTransfi.units      = 'Sv'
-    #
-    # Integral heat and emp fux (1D: time)
-    intQFlx   = cdm.createVariable(intHeatFlx  , axes = [timeaxis], id = 'intQflx')
-    intWFlx   = cdm.createVariable(intWatFlx   , axes = [timeaxis], id = 'intWflx')
-    intQFlxa  = cdm.createVariable(intHeatFlxa , axes = [timeaxis], id = 'intQflxAtl')
-    intWFlxa  = cdm.createVariable(intWatFlxa  , axes = [timeaxis], id = 'intWflxAtl')
-    intQFlxp  = cdm.createVariable(intHeatFlxp , axes = [timeaxis], id = 'intQflxPac')
-    intWFlxp  = cdm.createVariable(intWatFlxp  , axes = [timeaxis], id = 'intWflxPac')
-    intQFlxi  = cdm.createVariable(intHeatFlxi , axes = [timeaxis], id = 'intQflxInd')
-    intWFlxi  = cdm.createVariable(intWatFlxi  , axes = [timeaxis], id = 'intWflxInd')
-    intQFlx.long_name   = 'Integral Surface Heat Flux'
-    intQFlx.units       = 'PW'
-    intWFlx.long_name   = 'Integral Surface E minus P'
-    intWFlx.units       = 'Sv'
-    intQFlxa.long_name  = 'Atl. Integral Surface Heat Flux'
-    intQFlxa.units      = 'PW'
-    intWFlxa.long_name  = 'Atl. Integral Surface E minus P'
-    intWFlxa.units      = 'Sv'
-    intQFlxp.long_name  = 'Pac. Integral Surface Heat Flux'
-    intQFlxp.units      = 'PW'
-    intWFlxp.long_name  = 'Pac. Integral Surface E minus P'
-    intWFlxp.units      = 'Sv'
-    intQFlxi.long_name  = 'Ind. Integral Surface Heat Flux'
-    intQFlxi.units      = 'PW'
-    intWFlxi.long_name  = 'Ind. Integral Surface E minus P'
-    intWFlxi.units      = 'Sv'
-
-    if writedenflx:
-        outFile_f.write(rhon)
-        outFile_f.write(denFlx)
-        outFile_f.write(denFlxh)
-        outFile_f.write(denFlxw)
-    outFile_f.write(totTransf)
-    outFile_f.write(hefTransf)
-    outFile_f.write(wfoTransf)
-    outFile_f.write(totTransfa)
-    outFile_f.write(hefTransfa)
-    outFile_f.write(wfoTransfa)
-    outFile_f.write(totTransfp)
-    outFile_f.write(hefTransfp)
-    outFile_f.write(wfoTransfp)
-    outFile_f.write(totTransfi)
-    outFile_f.write(hefTransfi)
-    outFile_f.write(wfoTransfi)
-    outFile_f.write(intQFlx)
-    outFile_f.write(intWFlx)
-    outFile_f.write(intQFlxa)
-    outFile_f.write(intWFlxa)
-    outFile_f.write(intQFlxp)
-    outFile_f.write(intWFlxp)
-    outFile_f.write(intQFlxi)
-    outFile_f.write(intWFlxi)
+        #
+        # Output files as netCDF
+        # Density flux (3D: time, lon, lat)
+        convw = 1.e6
+        if writedenflx:
+            rhon    = cdm.createVariable(rhon          , axes = [timeblk, lati, loni], id = 'densurf')
+            denFlx  = cdm.createVariable(denflx*convw  , axes = [timeblk, lati, loni], id = 'denflux')
+            denFlxh = cdm.createVariable(denflxh*convw , axes = [timeblk, lati, loni], id = 'hdenflx')
+            denFlxw = cdm.createVariable(denflxw*convw , axes = [timeblk, lati, loni], id = 'wdenflx')
+            denFlx.long_name   = 'Surface density'
+            denFlx.units       = 'kg.m-3 (anomaly, minus 1000)'
+            denFlx.long_name   = 'Total density flux'
+            denFlx.units       = '1.e-6 kg/m2/s'
+            denFlxh.long_name  = 'Heat density flux'
+            denFlxh.units      = '1.e-6 kg/m2/s'
+            denFlxw.long_name  = 'Water density flux'
+            denFlxw.units      = '1.e-6 kg/m2/s'
+        #
+        # Transformation (2D: time, sigma or 3D: time, domain, sigma) and integral heat
+        # and emp flux (1D: time or 2D: time, domain) per basin
+        convw = 1.e-6
+        transf  = transf .reshape(nt, ndom, nbas, N_s+1)
+        transfh = transfh.reshape(nt, ndom, nbas, N_s+1)
+        transfw = transfw.reshape(nt, ndom, nbas, N_s+1)
+        areabin = areabin.reshape(nt, ndom, nbas, N_s+1)
+        intHeatFlx = intHeatFlx.reshape(nt, ndom, nbas)
+        intWatFlx  = intWatFlx .reshape(nt, ndom, nbas)
+        outVars = []
+        for b in range(nbas):
+            for [field, vid, lname, conv, units] in [[transf , 'trsftot', 'Total transformation'     , convw, 'Sv'],
+                                                     [transfh, 'trsfhef', 'Heat flux transformation' , convw, 'Sv'],
+                                                     [transfw, 'trsfwfo', 'Water flux transformation', convw, 'Sv'],
+                                                     [areabin, 'areabin', 'Area of density bin'      , 1.   , 'm2']]:
+                var = field[:,:,b,:]
+                if not domMulti:
+                    var = var[:,0,:]
+                var = cdm.createVariable(maskVal(var, valmask)*conv, axes = [timeblk]+axes2d, id = vid+basinIds[b])
+                var.long_name = basinNames[b]+lname
+                var.units     = units
+                outVars.append(var)
+        for b in range(nbas):
+            for [field, vid, lname, units] in [[intHeatFlx, 'intQflx', 'Integral Surface Heat Flux', 'PW'],
+                                               [intWatFlx , 'intWflx', 'Integral Surface E minus P', 'Sv']]:
+                var = field[:,:,b]
+                if not domMulti:
+                    var = var[:,0]
+                var = cdm.createVariable(var, axes = [timeblk]+axes1d, id = vid+basinIds[b])
+                var.long_name = basinNames[b]+lname
+                var.units     = units
+                outVars.append(var)
+
+        with lock:
+            if writedenflx:
+                outFile_f.write(rhon, extend = 1, index = t0-tmin)
+                outFile_f.write(denFlx, extend = 1, index = t0-tmin)
+                outFile_f.write(denFlxh, extend = 1, index = t0-tmin)
+                outFile_f.write(denFlxw, extend = 1, index = t0-tmin)
+            for var in outVars:
+                outFile_f.write(var, extend = 1, index = t0-tmin)
+        del(outVars, transf, transfh, transfw, areabin, intHeatFlx, intWatFlx)
+        del(tos, sos, qnet, emp) ; gc.collect()
     #
     # File global attributes
     for i in range(0,len(file_dic)):
@@ -738,6 +683,7 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     fhef.close()
     fwfo.close()
     outFile_f.close()
+    os.rename(outFilePart, outFile)
     print ' Wrote file: ',outFile
 
 
@@ -749,3 +695,89 @@ def surfTransf(fileFx, fileTos, fileSos, fileHef, fileWfo, varNames, outFile, de
     print ' CPU use', timc.clock() - cpu0
     print ' Max memory use',resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1.e6,'GB'
 
+
+# Batch mode globals - inherited by forked worker processes
+_surfBatchGrid = None
+_surfBatchJobs = []
+
+def _surfTransfMember(i):
+    '''
+    Run surfTransf on member i of the current batch (pool worker)
+    '''
+    files, outFile, kwargs = _surfBatchJobs[i]
+    te0 = timeit.default_timer()
+    try:
+        surfTransf(files[0], files[1], files[2], files[3], files[4], kwargs['varNames'], outFile,
+                   debug=kwargs['debug'], timeint=kwargs['timeint'], noInterp=kwargs['noInterp'],
+                   domain=kwargs['domain'], tchunk=kwargs['tchunk'], grid=_surfBatchGrid)
+        err = None
+    except Exception,err:
+        print ' ** surfTransf failed for ',files[1],': ',err
+        err = str(err)
+    return outFile, timeit.default_timer() - te0, err
+
+def surfTransfBatch(members, varNames, outFiles, nproc=1, debug=False, timeint='all', noInterp=False, domain='global', tchunk=120):
+    '''
+    The surfTransfBatch() function runs surfTransf() on a list of ensemble members of the
+    same model. The grid setup (density grid, target grid and masks, domains and regridder)
+    is done once and shared by all members, which are processed in sequence or in parallel
+    on nproc processes
+
+    Author:    Eric Guilyardi : Eric.Guilyardi@locean-ipsl.upmc.fr
+
+    Created on Sun Oct 18 2026
+
+    Inputs:
+    ------
+    - members                   - list of [fileFx, fileTos, fileSos, fileHef, fileWfo] files, one per member
+    - varNames[4]               - names of the variables
+    - outFiles                  - list of output files (one per member)
+    -> options:
+    - nproc <optional>          - number of processes (1 = members processed in sequence)
+    - debug, timeint, noInterp, domain, tchunk <optional> - as in surfTransf
+
+    Output:
+    - list of [outFile, elapsed time, error] for each member (error is None on success)
+
+    Usage:
+    ------
+    >>> from surface_transf import surfTransfBatch
+    >>> members = [[file_fx, file_tos1, file_sos1, file_hef1, file_wfo1], [file_fx, file_tos2, ...]]
+    >>> surfTransfBatch(members, ['tos','sos','hfds','wfo'], [outFile1, outFile2], nproc=2)
+
+    Notes:
+    -----
+    - EG  18 Oct 2026 - Initial version
+    - The grid is built from the tos file of the first member, all members must share it
+    - Worker processes are forked after the grid setup and inherit it (including the ESMF regridder)
+    - A failing member is reported and does not stop the batch
+    '''
+    global _surfBatchGrid, _surfBatchJobs
+    if len(members) != len(outFiles):
+        print '** members and outFiles have different lengths, exiting..'
+        return
+    te0 = timeit.default_timer()
+    _surfBatchGrid = surfTransfGrid(members[0][1], varNames[0], noInterp=noInterp, domain=domain, debug=debug)
+    kwargs = {'varNames':varNames, 'debug':debug, 'timeint':timeint, 'noInterp':noInterp,
+              'domain':domain, 'tchunk':tchunk}
+    _surfBatchJobs = [[member, outFile, kwargs] for member,outFile in zip(members,outFiles)]
+    print ' ==> batch of',len(_surfBatchJobs),'members, grid setup elapsed:',timeit.default_timer() - te0
+    nproc = max(min(nproc, len(_surfBatchJobs)), 1)
+    if nproc > 1:
+        pool = mp.Pool(processes=nproc)
+        try:
+            results = pool.map(_surfTransfMember, range(len(_surfBatchJobs)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_surfTransfMember(i) for i in range(len(_surfBatchJobs))]
+    for outFile,elapsed,err in results:
+        if err is None:
+            print ' Member done (elapsed',elapsed,'s): ',outFile
+        else:
+            print ' Member failed (elapsed',elapsed,'s): ',outFile,err
+    print ' Batch elapsed: ',timeit.default_timer() - te0
+    _surfBatchGrid = None ; _surfBatchJobs = [] ; gc.collect()
+
+    return results